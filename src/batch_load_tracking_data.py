@@ -0,0 +1,43 @@
+import argparse
+
+from utility.batch_loader import find_tracking_data_files, load_tracking_data_files
+
+parser = argparse.ArgumentParser(description='Parallel loading of tracking data files into the binary hit cache',
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+parser.add_argument('--tracking_data',
+                    action='store',
+                    type=str,
+                    default=None,
+                    help='Directory or glob pattern of tracking data files, e.g. "<folder>/e0gpc_7.0_*_sl.csv"')
+
+parser.add_argument('--tracking_data_format',
+                    action='store',
+                    type=str,
+                    default='simplified simulation csv',
+                    help='Format of the tracking data: "key4hep slcio", "key4hep csv", "simplified simulation csv"')
+
+parser.add_argument('--num_workers',
+                    action='store',
+                    type=int,
+                    default=None,
+                    help='Number of processes, default is the number of CPUs')
+
+parser.add_argument('--refresh_hit_cache',
+                    action='store_true',
+                    help='Parse the tracking data files again and rewrite their binary hit caches')
+
+parser_args = parser.parse_args()
+
+tracking_data_files = find_tracking_data_files(parser_args.tracking_data, parser_args.tracking_data_format)
+if len(tracking_data_files) == 0:
+    print(f'No tracking data files found for {parser_args.tracking_data}!')
+    print('Exiting...')
+    exit()
+
+print(f'Loading {len(tracking_data_files)} tracking data files...')
+hit_tables = load_tracking_data_files(tracking_data_files,
+                                      parser_args.tracking_data_format,
+                                      num_workers=parser_args.num_workers,
+                                      write_cache=True,
+                                      refresh_cache=parser_args.refresh_hit_cache)
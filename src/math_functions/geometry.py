@@ -60,3 +60,21 @@ def angle_based_measure(detector_hits: list[list[float, float, float]]) -> float
     yz = [xyz_angle(y[i], y[i + 1], z[i], z[i + 1]) for i in range(len(detector_hits[1]) - 1)]
 
     return np.sqrt(np.std(xz)**2 + np.std(yz)**2)
+
+
+def angle_based_measure_array(x: np.ndarray,
+                              y: np.ndarray,
+                              z: np.ndarray) -> np.ndarray:
+    """Array version of angle_based_measure, computing the measure for many hit combinations at once.
+
+    :param x: x positions, one row of consecutive hits per combination
+    :param y: y positions, same shape as x
+    :param z: z positions, same shape as x
+
+    :return
+        sqrt(max_diff_xz angle**2 + max_diff_yz_angle**2) of each row
+    """
+    xz = np.arctan2(np.diff(x, axis=1), np.diff(z, axis=1))
+    yz = np.arctan2(np.diff(y, axis=1), np.diff(z, axis=1))
+
+    return np.sqrt(np.std(xz, axis=1)**2 + np.std(yz, axis=1)**2)
@@ -0,0 +1,153 @@
+import numpy as np
+
+from utility.file_cache import file_fingerprint, load_arrays, save_arrays
+
+
+class Geometry:
+    """Detector geometry loaded once from a geometry .csv file (header: name,x_start,x_end,y_start,y_end,z) into NumPy
+    arrays. Chips keep the order of the geometry file, layers are numbered by increasing z.
+    """
+    # (field name, dtype) of the per chip arrays
+    chip_fields = (('name', np.str_),
+                   ('x_start', np.float64),
+                   ('x_end', np.float64),
+                   ('y_start', np.float64),
+                   ('y_end', np.float64),
+                   ('z', np.float64))
+
+    def __init__(self,
+                 name: np.ndarray,
+                 x_start: np.ndarray,
+                 x_end: np.ndarray,
+                 y_start: np.ndarray,
+                 y_end: np.ndarray,
+                 z: np.ndarray):
+        """Set fields and derive the layer information of the chips.
+        :param name: name of each chip
+        :param x_start: start of each chip in x [m]
+        :param x_end: end of each chip in x [m]
+        :param y_start: start of each chip in y [m]
+        :param y_end: end of each chip in y [m]
+        :param z: z position of each chip [m]
+        """
+        self.name = np.asarray(name, dtype=np.str_)
+        self.x_start = np.asarray(x_start, dtype=np.float64)
+        self.x_end = np.asarray(x_end, dtype=np.float64)
+        self.y_start = np.asarray(y_start, dtype=np.float64)
+        self.y_end = np.asarray(y_end, dtype=np.float64)
+        self.z = np.asarray(z, dtype=np.float64)
+
+        # here the first layer is the one with the lowest z position, in the usual geometry file, this is different!
+        self.layer_z, self.chip_layer = np.unique(self.z, return_inverse=True)
+        self.chip_layer = self.chip_layer.reshape(-1).astype(np.int32)
+        self.z_to_layer = {z_value: layer for layer, z_value in enumerate(self.layer_z.tolist())}
+
+        # chips sorted by layer and x_start, the chips of a layer are
+        # layer_chips[layer_chip_offsets[layer]:layer_chip_offsets[layer + 1]]
+        self.layer_chips = np.lexsort((self.x_start, self.chip_layer)).astype(np.int32)
+        self.layer_chip_offsets = np.searchsorted(self.chip_layer[self.layer_chips],
+                                                  np.arange(self.num_layers() + 1)).astype(np.int32)
+
+    @staticmethod
+    def load(geometry_file: str,
+             use_cache: bool = True) -> 'Geometry':
+        """Loads the geometry from a .csv file. The parsed chips are stored in a binary sidecar folder
+        <geometry_file>.geometry_cache, which is used as long as the geometry file is unchanged.
+        :param geometry_file: .csv detector geometry file
+        :param use_cache: if False, the file is parsed and no cache is read or written
+
+        :return
+            Geometry object
+        """
+        cache_folder = f'{geometry_file}.geometry_cache'
+        fingerprint = file_fingerprint(geometry_file, 'geometry')
+        if use_cache:
+            cached_chips = load_arrays(cache_folder, fingerprint, mmap_mode=None)
+            if cached_chips is not None:
+                return Geometry(**cached_chips)
+
+        with open(geometry_file, 'r') as file:
+            header = file.readline().strip().split(',')  # csv files should consist of one line of header
+            chips = np.loadtxt(file,
+                               delimiter=',',
+                               usecols=[header.index(name) for name, _ in Geometry.chip_fields],
+                               dtype=[(name, np.float64 if dtype is np.float64 else 'U64')
+                                      for name, dtype in Geometry.chip_fields],
+                               ndmin=1)
+        geometry = Geometry(**{name: chips[name] for name, _ in Geometry.chip_fields})
+
+        if use_cache:
+            save_arrays(cache_folder, fingerprint, geometry.chips())
+        return geometry
+
+    def chips(self) -> dict[str, np.ndarray]:
+        """Returns the per chip arrays.
+
+        :return
+            {<field name>: <array>}
+        """
+        return {name: getattr(self, name) for name, _ in Geometry.chip_fields}
+
+    def num_layers(self) -> int:
+        """Number of layers, i.e. distinct z positions of chips.
+        """
+        return len(self.layer_z)
+
+    def layer_ranges(self,
+                     layer: int) -> list[float]:
+        """Returns the spatial covering of the chips of a layer.
+        :param layer: layer number
+
+        :return
+            [min_x, max_x, min_y, max_y]
+        """
+        chips = self.chip_layer == layer
+        return [float(self.x_start[chips].min()),
+                float(self.x_end[chips].max()),
+                float(self.y_start[chips].min()),
+                float(self.y_end[chips].max())]
+
+    def layer_at_z(self,
+                   z: np.ndarray,
+                   tolerance: float = 0.0) -> np.ndarray:
+        """Returns the layer of z values, -1 if no layer is within the tolerance.
+        :param z: z positions [m]
+        :param tolerance: maximum distance to the z position of a layer [m]
+
+        :return
+            layer of each z value
+        """
+        z = np.asarray(z, dtype=np.float64)
+        right = np.clip(np.searchsorted(self.layer_z, z), 0, self.num_layers() - 1)
+        left = np.clip(right - 1, 0, self.num_layers() - 1)
+        closest = np.where(np.abs(self.layer_z[left] - z) <= np.abs(self.layer_z[right] - z), left, right)
+        return np.where(np.abs(self.layer_z[closest] - z) <= tolerance, closest, -1).astype(np.int32)
+
+    def chip_at(self,
+                x: np.ndarray,
+                y: np.ndarray,
+                layer: np.ndarray) -> np.ndarray:
+        """Returns the chip containing the (x, y) positions on the given layers, -1 if the position is not covered.
+        :param x: x positions [m]
+        :param y: y positions [m]
+        :param layer: layer of each position, e.g. from layer_at_z
+
+        :return
+            index of the chip in the geometry file order
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        layer = np.asarray(layer)
+        chip = np.full(x.shape, -1, dtype=np.int32)
+        for layer_number in range(self.num_layers()):
+            on_layer = layer == layer_number
+            if not np.any(on_layer):
+                continue
+            chips = self.layer_chips[self.layer_chip_offsets[layer_number]:self.layer_chip_offsets[layer_number + 1]]
+            # last chip starting before x
+            candidate = chips[np.clip(np.searchsorted(self.x_start[chips], x[on_layer], side='right') - 1,
+                                      0, len(chips) - 1)]
+            covered = (self.x_start[candidate] <= x[on_layer]) & (x[on_layer] <= self.x_end[candidate]) & \
+                      (self.y_start[candidate] <= y[on_layer]) & (y[on_layer] <= self.y_end[candidate])
+            chip[on_layer] = np.where(covered, candidate, -1)
+        return chip
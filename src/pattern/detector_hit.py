@@ -1,56 +1,84 @@
 class DetectorHit:
-    """Class for storing information about particle-detector interactions.
+    """Class for storing information about particle-detector interactions. Objects are immutable and use __slots__,
+    so they stay small when many hits are kept in memory or pickled together with triplets and multiplets.
     """
+    __slots__ = ('hit_id',
+                 'x',
+                 'y',
+                 'z',
+                 'layer_id',
+                 'module_id',
+                 'cell_id',
+                 'particle_id',
+                 'is_signal',
+                 'particle_energy')
+
+    hit_id: str
+    x: float
+    y: float
+    z: float
+    layer_id: int
+    module_id: int
+    cell_id: int
+    particle_id: int | None
+    is_signal: bool
+    particle_energy: float | None
 
     def __init__(self,
-                 detector_hit: dict):
+                 hit_id: str,
+                 x: float,
+                 y: float,
+                 z: float,
+                 layer_id: int,
+                 module_id: int,
+                 cell_id: int,
+                 particle_id: int | None,
+                 is_signal: bool,
+                 particle_energy: float | None):
         """Set fields according to the information provided.
 
-        :param detector_hit: dictionary with information about a detector hit
+        :param hit_id: unique identifier of the hit
+        :param x: x position [m]
+        :param y: y position [m]
+        :param z: z position [m]
+        :param layer_id: layer of the hit
+        :param module_id: module of the hit
+        :param cell_id: cell id of the hit
+        :param particle_id: id of the particle creating the hit, None if unknown
+        :param is_signal: True if hit originates from a signal particle
+        :param particle_energy: energy of the particle creating the hit, None if unknown
         """
-        self.hit_dictionary = detector_hit
-
-        self.hit_id = None
-        self.x = None
-        self.y = None
-        self.z = None
-        self.layer_id = None
-        self.module_id = None
-        self.cell_id = None
-        self.particle_id = None
-        self.is_signal = None
-        self.particle_energy = None
-
-        self.fill_fields()
-
-    def fill_fields(self) -> None:
-        """Fills the fields with the dictionary with information from the hit_dictionary.
+        set_field = object.__setattr__
+        set_field(self, 'hit_id', hit_id)
+        set_field(self, 'x', x)
+        set_field(self, 'y', y)
+        set_field(self, 'z', z)
+        set_field(self, 'layer_id', layer_id)
+        set_field(self, 'module_id', module_id)
+        set_field(self, 'cell_id', cell_id)
+        set_field(self, 'particle_id', particle_id)
+        set_field(self, 'is_signal', is_signal)
+        set_field(self, 'particle_energy', particle_energy)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'DetectorHit is immutable, cannot set {name}')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'DetectorHit is immutable, cannot delete {name}')
+
+    def __reduce__(self):
+        """Pickles the hit as constructor call with the field values, without per object attribute names.
         """
-        for key, value in self.hit_dictionary.items():
-            if key == 'hit_ID':
-                self.hit_id = str(value)
-            elif key == 'x':
-                self.x = float(value)
-            elif key == 'y':
-                self.y = float(value)
-            elif key == 'z':
-                self.z = float(value)
-            elif key == 'layer_ID':
-                self.layer_id = int(value)
-            elif key == 'module_ID':
-                self.module_id = int(value)
-            elif key == 'cell_ID':
-                self.cell_id = int(value)
-            elif key == 'particle_ID':
-                if value is not None:
-                    self.particle_id = int(value)
-                else:
-                    self.particle_id = None
-            elif key == 'is_signal':
-                self.is_signal = bool(value)
-            elif key == 'particle_energy':
-                self.particle_energy = float(value)
-            else:
-                print(f'key: {key} not found!')
-                print('Exiting...')
-                exit()
+        return DetectorHit, tuple([getattr(self, name) for name in DetectorHit.__slots__])
+
+    def __setstate__(self, state: dict):
+        """Restores hits pickled before DetectorHit used __slots__, e.g. in existing triplet_list.npy files. Their state
+        is the instance __dict__, the hit_dictionary the fields were filled from is dropped.
+        :param state: instance __dict__ of the old layout
+        """
+        for name in DetectorHit.__slots__:
+            object.__setattr__(self, name, state.get(name))
+
+    def __repr__(self) -> str:
+        return f'DetectorHit(hit_id={self.hit_id!r}, x={self.x}, y={self.y}, z={self.z}, ' \
+               f'particle_id={self.particle_id})'
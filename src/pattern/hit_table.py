@@ -0,0 +1,158 @@
+import numpy as np
+
+from pattern.detector_hit import DetectorHit
+
+
+class HitTable:
+    """Columnar (struct-of-arrays) storage of detector hits. Every field is a NumPy array with one entry per hit, the
+    position inside the arrays is the hit index used during pattern building.
+    Missing information is encoded with fill values instead of None:
+        particle_id -1, layer_id / module_id / cell_id -1, particle_energy NaN
+    """
+    # (field name, dtype, fill value if information is not provided by the data format)
+    fields = (('hit_id', np.int64, -1),
+              ('x', np.float64, np.nan),
+              ('y', np.float64, np.nan),
+              ('z', np.float64, np.nan),
+              ('layer_id', np.int32, -1),
+              ('module_id', np.int32, -1),
+              ('cell_id', np.int64, -1),
+              ('particle_id', np.int64, -1),
+              ('is_signal', np.bool_, True),
+              ('particle_energy', np.float64, np.nan))
+
+    def __init__(self,
+                 hit_id: np.ndarray,
+                 x: np.ndarray,
+                 y: np.ndarray,
+                 z: np.ndarray,
+                 layer_id: np.ndarray | None = None,
+                 module_id: np.ndarray | None = None,
+                 cell_id: np.ndarray | None = None,
+                 particle_id: np.ndarray | None = None,
+                 is_signal: np.ndarray | None = None,
+                 particle_energy: np.ndarray | None = None):
+        """Set fields, columns which are not provided are filled with the corresponding fill value.
+
+        :param hit_id: unique identifier of the hits in the tracking data file
+        :param x: x position [m]
+        :param y: y position [m]
+        :param z: z position [m]
+        :param layer_id: layer of the hit
+        :param module_id: module of the hit
+        :param cell_id: integer cell id, see utility.data_format_handler
+        :param particle_id: id of the particle creating the hit, -1 if unknown
+        :param is_signal: True if hit originates from a signal particle
+        :param particle_energy: energy of the particle creating the hit [GeV]
+        """
+        provided_columns = {'hit_id': hit_id,
+                            'x': x,
+                            'y': y,
+                            'z': z,
+                            'layer_id': layer_id,
+                            'module_id': module_id,
+                            'cell_id': cell_id,
+                            'particle_id': particle_id,
+                            'is_signal': is_signal,
+                            'particle_energy': particle_energy}
+        num_hits = len(hit_id)
+        for name, dtype, fill_value in HitTable.fields:
+            column = provided_columns[name]
+            if column is None:
+                column = np.full(num_hits, fill_value, dtype=dtype)
+            else:
+                column = np.asarray(column, dtype=dtype)
+            if column.shape != (num_hits, ):
+                raise ValueError(f'Column {name} has shape {column.shape}, expected ({num_hits},)')
+            setattr(self, name, column)
+
+    def __len__(self) -> int:
+        """Number of hits in the table.
+        """
+        return len(self.hit_id)
+
+    def columns(self) -> dict[str, np.ndarray]:
+        """Returns the columns of the table.
+
+        :return
+            {<field name>: <array>}
+        """
+        return {name: getattr(self, name) for name, _, _ in HitTable.fields}
+
+    def take(self,
+             indices: np.ndarray) -> 'HitTable':
+        """Returns a new table containing only the specified hits.
+
+        :param indices: indices or boolean mask of the hits to keep
+
+        :return
+            HitTable object
+        """
+        return HitTable(**{name: column[indices] for name, column in self.columns().items()})
+
+    @staticmethod
+    def concatenate(tables: list['HitTable']) -> 'HitTable':
+        """Concatenates hit tables, e.g. from several events or files.
+
+        :param tables: list of HitTable objects
+
+        :return
+            HitTable object
+        """
+        if len(tables) == 0:
+            return HitTable.empty()
+        return HitTable(**{name: np.concatenate([getattr(table, name) for table in tables])
+                           for name, _, _ in HitTable.fields})
+
+    @staticmethod
+    def empty() -> 'HitTable':
+        """Returns a table without hits.
+
+        :return
+            HitTable object
+        """
+        return HitTable(**{name: np.empty(0, dtype=dtype) for name, dtype, _ in HitTable.fields})
+
+    def hit(self,
+            index: int) -> DetectorHit:
+        """Returns a DetectorHit object of a single row, for code which still needs hit objects.
+
+        :param index: index of the hit in the table
+
+        :return
+            DetectorHit object
+        """
+        particle_id = int(self.particle_id[index])
+        particle_energy = float(self.particle_energy[index])
+        return DetectorHit(hit_id=str(self.hit_id[index]),
+                           x=float(self.x[index]),
+                           y=float(self.y[index]),
+                           z=float(self.z[index]),
+                           layer_id=int(self.layer_id[index]),
+                           module_id=int(self.module_id[index]),
+                           cell_id=int(self.cell_id[index]),
+                           particle_id=particle_id if particle_id != -1 else None,
+                           is_signal=bool(self.is_signal[index]),
+                           particle_energy=particle_energy if not np.isnan(particle_energy) else None)
+
+    def to_detector_hits(self) -> list[DetectorHit]:
+        """Returns all rows as DetectorHit objects.
+
+        :return
+            list of DetectorHit objects
+        """
+        hits = []
+        for hit_id, x, y, z, layer_id, module_id, cell_id, particle_id, is_signal, particle_energy in \
+                zip(*[column.tolist() for column in self.columns().values()]):
+            hits.append(DetectorHit(hit_id=str(hit_id),
+                                    x=x,
+                                    y=y,
+                                    z=z,
+                                    layer_id=layer_id,
+                                    module_id=module_id,
+                                    cell_id=cell_id,
+                                    particle_id=particle_id if particle_id != -1 else None,
+                                    is_signal=is_signal,
+                                    particle_energy=particle_energy if particle_energy == particle_energy
+                                    else None))  # NaN check
+        return hits
@@ -0,0 +1,283 @@
+import numpy as np
+
+from scipy.sparse import csr_matrix, triu
+
+from pattern.hit_table import HitTable
+from pattern.triplet import Triplet
+
+
+class TripletTable:
+    """Columnar storage of triplets. A triplet is identified by its index in the table, its hits by their index in the
+    hit table. The QUBO coefficients are a dense vector a (quality) and a sparse upper triangular matrix Q
+    (interactions), so the energy of a binary vector x is a.x + x.Q.x. Optionally, the conflicts of triplets using the
+    same hit in the same position are not stored in Q but as one group per hit and position, each pair of kept triplets
+    in a group adds the conflict penalty to the energy. The groups are expanded on the fly from the hit indices. String
+    triplet ids <hit_ID>_<hit_ID>_<hit_ID> are only created for exporting Triplet objects.
+    """
+    def __init__(self,
+                 hit_table: HitTable,
+                 hit_indices: np.ndarray,
+                 quality: np.ndarray | None = None,
+                 interactions: csr_matrix | None = None,
+                 conflict_penalty: float = 0.):
+        """Set fields.
+        :param hit_table: hits of the event
+        :param hit_indices: (N, 3) array with the indices of the first, second and third hit of each triplet
+        :param quality: quality (linear QUBO term) of each triplet, default is 0
+        :param interactions: interactions of the triplets as upper triangular (N, N) matrix, default has no entries
+        :param conflict_penalty: penalty of each pair of triplets using the same hit in the same position, 0 if all
+                                 conflicts are stored in the interactions
+        """
+        self.hit_table = hit_table
+        self.hit_indices = np.asarray(hit_indices, dtype=np.int32).reshape(-1, 3)
+        self.quality = np.zeros(len(self.hit_indices)) if quality is None else np.asarray(quality, dtype=np.float64)
+        self.interactions = csr_matrix((len(self.hit_indices), len(self.hit_indices))) if interactions is None \
+            else triu(interactions, k=1, format='csr')
+        self.conflict_penalty = conflict_penalty
+        # hit to triplet incidence of each position, the hit indices are not changed after construction
+        self.position_incidence = None
+
+    def __len__(self) -> int:
+        """Number of triplets in the table.
+        """
+        return len(self.hit_indices)
+
+    def set_interactions(self,
+                         first_triplets: np.ndarray,
+                         second_triplets: np.ndarray,
+                         values: np.ndarray) -> None:
+        """Sets the interactions from pairs of triplets, each unordered pair at most once.
+        :param first_triplets: indices of the first triplets
+        :param second_triplets: indices of the second triplets
+        :param values: interaction values
+        """
+        self.interactions = csr_matrix((values,
+                                        (np.minimum(first_triplets, second_triplets),
+                                         np.maximum(first_triplets, second_triplets))),
+                                       shape=(len(self), len(self)))
+        self.interactions.sort_indices()
+
+    def symmetric_interactions(self) -> csr_matrix:
+        """Returns the interactions as symmetric matrix, row i holds all interactions of triplet i. Interactions with
+        value 0 are kept as explicit entries, like the entries of the interaction dictionaries.
+
+        :return
+            Q + Q^T as CSR matrix with sorted indices
+        """
+        # adding the sparse matrices would drop explicit zeros
+        upper = self.interactions.tocoo()
+        symmetric = csr_matrix((np.concatenate([upper.data, upper.data]),
+                                (np.concatenate([upper.row, upper.col]), np.concatenate([upper.col, upper.row]))),
+                               shape=self.interactions.shape)
+        symmetric.sort_indices()
+        return symmetric
+
+    def coordinates(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the coordinates of the triplet hits.
+
+        :return
+            (x, y, z), each an (N, 3) array
+        """
+        return (self.hit_table.x[self.hit_indices],
+                self.hit_table.y[self.hit_indices],
+                self.hit_table.z[self.hit_indices])
+
+    def from_same_particle(self) -> np.ndarray:
+        """Checks for all triplets if their hits stem from the same signal particle.
+
+        :return
+            boolean array, True if triplet originates from one single signal particle
+        """
+        particle_id = self.hit_table.particle_id[self.hit_indices]
+        return np.all(self.hit_table.is_signal[self.hit_indices], axis=1) & \
+            (particle_id[:, 0] == particle_id[:, 1]) & (particle_id[:, 1] == particle_id[:, 2])
+
+    def triplets_by_hit(self) -> tuple[np.ndarray, np.ndarray]:
+        """Hit to triplet incidence (CSR structure) over the hits of the hit table.
+
+        :return
+            (indptr, triplets), the triplets using hit h are triplets[indptr[h]:indptr[h + 1]] in increasing order
+        """
+        hits = self.hit_indices.ravel()
+        triplets = np.argsort(hits, kind='stable') // 3
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(hits, minlength=len(self.hit_table)))])
+        return indptr, triplets
+
+    def triplets_by_position(self) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Hit to triplet incidence (CSR structure) of each hit position, these are the conflict groups.
+
+        :return
+            [(indptr, triplets)] for the first, second and third hit, the triplets using hit h in position p are
+            triplets[indptr[h]:indptr[h + 1]] in increasing order
+        """
+        if self.position_incidence is None:
+            self.position_incidence = []
+            for hits in self.hit_indices.T:
+                indptr = np.concatenate([[0], np.cumsum(np.bincount(hits, minlength=len(self.hit_table)))])
+                self.position_incidence.append((indptr, np.argsort(hits, kind='stable')))
+        return self.position_incidence
+
+    def in_conflict_groups(self) -> np.ndarray:
+        """Checks for all triplets if one of their conflict groups has other members.
+
+        :return
+            boolean array, True if the triplet has implicit conflicts, all False if all conflicts are stored in the
+            interactions
+        """
+        if not self.conflict_penalty:
+            return np.zeros(len(self), dtype=bool)
+        conflicted = np.zeros(len(self), dtype=bool)
+        for position, (indptr, _) in enumerate(self.triplets_by_position()):
+            conflicted |= np.diff(indptr)[self.hit_indices[:, position]] > 1
+        return conflicted
+
+    def conflict_counts(self,
+                        solution_candidate: np.ndarray,
+                        triplet_subset: list[int] | np.ndarray | None = None) -> np.ndarray:
+        """Counts the kept triplets in each conflict group.
+        :param solution_candidate: binary vector of all triplets or of the subset
+        :param triplet_subset: indices of the triplets the solution candidate refers to, default is all triplets
+
+        :return
+            (3, number of hits) array, number of kept triplets using hit h in position p
+        """
+        hit_indices = self.hit_indices if triplet_subset is None else self.hit_indices[triplet_subset]
+        kept = hit_indices[np.asarray(solution_candidate) == 1]
+        return np.stack([np.bincount(hits, minlength=len(self.hit_table)) for hits in kept.T])
+
+    def conflict_energy(self,
+                        solution_candidate: np.ndarray,
+                        triplet_subset: list[int] | np.ndarray | None = None) -> float:
+        """Energy of the conflict groups, the penalty times the number of pairs of kept triplets in each group.
+        :param solution_candidate: binary vector of all triplets or of the subset
+        :param triplet_subset: indices of the triplets the solution candidate refers to, default is all triplets
+
+        :return
+            conflict energy, 0 if all conflicts are stored in the interactions
+        """
+        if not self.conflict_penalty:
+            return 0.
+        counts = self.conflict_counts(solution_candidate, triplet_subset)
+        return float(self.conflict_penalty * np.sum(counts * (counts - 1) // 2))
+
+    def conflict_fields(self,
+                        solution_candidate: np.ndarray) -> np.ndarray:
+        """Contribution of the conflict groups to the local fields, the penalty times the number of other kept triplets
+        in the groups of a triplet.
+        :param solution_candidate: binary vector representing kept and discarded triplets
+
+        :return
+            conflict field of each triplet
+        """
+        solution_candidate = np.asarray(solution_candidate, dtype=np.float64)
+        if not self.conflict_penalty:
+            return np.zeros(len(self))
+        counts = self.conflict_counts(solution_candidate)
+        kept_in_groups = sum(counts[position, self.hit_indices[:, position]] for position in range(3))
+        return self.conflict_penalty * (kept_in_groups - 3 * solution_candidate)
+
+    def expand_conflicts(self,
+                         symmetric: csr_matrix,
+                         rows: list[int] | np.ndarray) -> csr_matrix:
+        """Adds the conflict groups of some triplets to the symmetric interactions. A pair of triplets sharing hits in
+        several positions gets the penalty for each position.
+        :param symmetric: symmetric interactions
+        :param rows: indices of the triplets whose conflicts are added
+
+        :return
+            symmetric interactions, the rows of the given triplets include their conflicts
+        """
+        if not self.conflict_penalty:
+            return symmetric
+        rows = np.asarray(rows, dtype=np.int64)
+        row_parts = []
+        column_parts = []
+        for position, (indptr, triplets) in enumerate(self.triplets_by_position()):
+            hits = self.hit_indices[rows, position]
+            starts = indptr[hits]
+            counts = indptr[hits + 1] - starts
+            # positions of the group members in triplets, group after group
+            members = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(np.sum(counts))
+            row_parts.append(np.repeat(rows, counts))
+            column_parts.append(triplets[members])
+        row = np.concatenate(row_parts)
+        column = np.concatenate(column_parts)
+        other = row != column
+        # duplicate entries are summed, explicit zeros of the interactions are kept
+        symmetric = symmetric.tocoo()
+        expanded = csr_matrix((np.concatenate([symmetric.data, np.full(np.sum(other), float(self.conflict_penalty))]),
+                               (np.concatenate([symmetric.row, row[other]]),
+                                np.concatenate([symmetric.col, column[other]]))),
+                              shape=symmetric.shape)
+        expanded.sort_indices()
+        return expanded
+
+    def triplet_ids(self) -> list[str]:
+        """Returns the string ids of the triplets, used for exporting.
+
+        :return
+            list of <hit_ID>_<hit_ID>_<hit_ID> strings
+        """
+        hit_ids = self.hit_table.hit_id[self.hit_indices].tolist()
+        return ['_'.join([str(hit_id) for hit_id in triplet_hit_ids]) for triplet_hit_ids in hit_ids]
+
+    def to_triplets(self,
+                    indices: list[int] | np.ndarray | None = None) -> list[Triplet]:
+        """Exports triplets as Triplet objects with quality and string keyed interactions. Triplets sharing a hit
+        share the DetectorHit object.
+        :param indices: indices of the triplets to export, default is all triplets
+
+        :return
+            list of Triplet objects
+        """
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices, dtype=np.int64)
+        hits = {}
+        for hit_index in np.unique(self.hit_indices[indices]).tolist():
+            hits.update({hit_index: self.hit_table.hit(hit_index)})
+
+        triplet_ids = self.triplet_ids()
+        symmetric = self.expand_conflicts(self.symmetric_interactions(), indices)
+        triplets = []
+        for index in indices.tolist():
+            triplet = Triplet(*[hits[hit_index] for hit_index in self.hit_indices[index].tolist()])
+            triplet.quality = float(self.quality[index])
+            row = slice(symmetric.indptr[index], symmetric.indptr[index + 1])
+            triplet.interactions = {triplet_ids[other]: value for other, value in zip(symmetric.indices[row].tolist(),
+                                                                                      symmetric.data[row].tolist())}
+            triplets.append(triplet)
+        return triplets
+
+    def save(self,
+             file: str) -> None:
+        """Saves the table with the hits of the triplets, the CSR arrays of the interactions and the conflict penalty in
+        a .npz file.
+        :param file: .npz file
+        """
+        used_hits, hit_indices = np.unique(self.hit_indices, return_inverse=True)
+        hit_table = self.hit_table.take(used_hits)
+        np.savez(file,
+                 hit_indices=hit_indices.reshape(-1, 3).astype(np.int32),
+                 quality=self.quality,
+                 interaction_indptr=self.interactions.indptr,
+                 interaction_indices=self.interactions.indices,
+                 interaction_values=self.interactions.data,
+                 conflict_penalty=self.conflict_penalty,
+                 **{f'hit {name}': column for name, column in hit_table.columns().items()})
+
+    @staticmethod
+    def load(file: str) -> 'TripletTable':
+        """Loads a table saved with save.
+        :param file: .npz file
+
+        :return
+            TripletTable object
+        """
+        with np.load(file) as data:
+            hit_table = HitTable(**{name: data[f'hit {name}'] for name, _, _ in HitTable.fields})
+            num_triplets = len(data['quality'])
+            interactions = csr_matrix((data['interaction_values'],
+                                       data['interaction_indices'],
+                                       data['interaction_indptr']),
+                                      shape=(num_triplets, num_triplets))
+            conflict_penalty = float(data['conflict_penalty']) if 'conflict_penalty' in data else 0.
+            return TripletTable(hit_table, data['hit_indices'], data['quality'], interactions, conflict_penalty)
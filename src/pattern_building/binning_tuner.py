@@ -0,0 +1,106 @@
+import contextlib
+import copy
+import io
+import time
+
+from pattern.hit_table import HitTable
+from pattern_building.pattern_builder import PatternBuilder
+from pattern_building.segment_manager import LUXESegmentManager
+
+
+def measure_binning(configuration: dict,
+                    geometry_file: str,
+                    hit_table: HitTable,
+                    num_bins_x: int,
+                    num_bins_y: int) -> dict:
+    """Runs segmentation, mapping and doublet creation of one event with the given binning and measures the time of
+    each step and the size of the segment mapping. The mapping is always computed, no cached mapping is used.
+    :param configuration: pattern building configuration
+    :param geometry_file: .csv detector geometry file
+    :param hit_table: hits of a representative event
+    :param num_bins_x: number of bins in x
+    :param num_bins_y: number of bins in y
+
+    :return
+        {'num bins x', 'num bins y', 'mapping time', 'doublet time', 'total time', 'segment pairs', 'compared pairs',
+        'doublets'}, the segment pairs are the number of mapped segment pairs, the compared pairs are
+        LUXESegmentManager.compared_hit_pairs and the doublets are a set of (hit_id, hit_id) tuples
+    """
+    configuration = copy.deepcopy(configuration)
+    configuration['binning'] = {'num bins x': num_bins_x, 'num bins y': num_bins_y}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        mapping_start = time.perf_counter()
+        segment_manager = LUXESegmentManager(configuration, geometry_file)
+        segment_manager.create_LUXE_segments()
+        segment_manager.segment_mapping_LUXE(use_cache=False)
+        mapping_end = time.perf_counter()
+
+        doublet_start = time.perf_counter()
+        pattern_builder = PatternBuilder(configuration)
+        pattern_builder.load_tracking_data(hit_table, segment_manager)
+        pattern_builder.create_doublet_list(segment_manager)
+        doublet_end = time.perf_counter()
+
+    doublets = set([(doublet.hit_1.hit_id, doublet.hit_2.hit_id)
+                    for segments in segment_manager.segment_storage.values()
+                    for segment in segments
+                    for doublet in segment.doublet_data])
+
+    return {'num bins x': num_bins_x,
+            'num bins y': num_bins_y,
+            'mapping time': mapping_end - mapping_start,
+            'doublet time': doublet_end - doublet_start,
+            'total time': doublet_end - mapping_start,
+            'segment pairs': len(segment_manager.mapping_indices),
+            'compared pairs': segment_manager.compared_hit_pairs(hit_table),
+            'doublets': doublets}
+
+
+def tune_binning(configuration: dict,
+                 geometry_file: str,
+                 hit_table: HitTable,
+                 bins_x: list[int],
+                 bins_y: list[int]) -> tuple[dict, list[dict]]:
+    """Sweeps all combinations of the candidate binnings and selects the fastest one, measured as mapping and doublet
+    time, which finds the same doublets as the binning of the configuration.
+    :param configuration: pattern building configuration, its binning is the reference
+    :param geometry_file: .csv detector geometry file
+    :param hit_table: hits of a representative event
+    :param bins_x: candidate numbers of bins in x
+    :param bins_y: candidate numbers of bins in y
+
+    :return
+        (selected measurement, all measurements)
+    """
+    # warm up, so just-in-time compilation is not part of the first measurement
+    measure_binning(configuration, geometry_file, hit_table.take(slice(0, 100)), 1, 1)
+
+    reference = measure_binning(configuration,
+                                geometry_file,
+                                hit_table,
+                                configuration['binning']['num bins x'],
+                                configuration['binning']['num bins y'])
+    reference['identical doublets'] = True
+    print(f"Reference binning {reference['num bins x']}x{reference['num bins y']}: "
+          f"{len(reference['doublets'])} doublets\n")
+
+    print(f"{'bins x':>8}{'bins y':>8}{'mapping [s]':>14}{'doublets [s]':>14}{'total [s]':>12}"
+          f"{'segment pairs':>15}{'compared pairs':>16}{'doublets':>10}{'identical':>11}")
+    measurements = [reference]
+    for num_bins_x in bins_x:
+        for num_bins_y in bins_y:
+            if [num_bins_x, num_bins_y] == [reference['num bins x'], reference['num bins y']]:
+                measurement = reference
+            else:
+                measurement = measure_binning(configuration, geometry_file, hit_table, num_bins_x, num_bins_y)
+                measurement['identical doublets'] = measurement['doublets'] == reference['doublets']
+                measurements.append(measurement)
+            print(f"{num_bins_x:>8}{num_bins_y:>8}{measurement['mapping time']:>14.3f}"
+                  f"{measurement['doublet time']:>14.3f}{measurement['total time']:>12.3f}"
+                  f"{measurement['segment pairs']:>15}{measurement['compared pairs']:>16}"
+                  f"{len(measurement['doublets']):>10}"
+                  f"{str(measurement['identical doublets']):>11}")
+
+    selected = min([m for m in measurements if m['identical doublets']], key=lambda m: m['total time'])
+    return selected, measurements
@@ -0,0 +1,422 @@
+import numpy as np
+
+
+def get_target_layers(layer: int,
+                      num_layers: int,
+                      setup: str) -> list[int]:
+    """Returns the layers in which the second hit of a doublet starting on the given layer can be located.
+    :param layer: layer of the first hit
+    :param num_layers: number of detector layers
+    :param setup: 'full' or 'simplified'
+
+    :return
+        list of target layers
+    """
+    if layer > num_layers - 2:
+        return []
+    if setup == 'full' and layer < num_layers - 2:
+        return [layer + 1, layer + 2]
+    return [layer + 1]
+
+
+def layer_targets(num_layers: int,
+                  setup: str) -> tuple[np.ndarray, np.ndarray]:
+    """Target layers of all layers as CSR structure, the layers take the place of segments for searching doublets
+    without segmentation.
+    :param num_layers: number of detector layers
+    :param setup: 'full' or 'simplified'
+
+    :return
+        (indptr, indices), the target layers of layer l are indices[indptr[l]:indptr[l + 1]]
+    """
+    targets = [get_target_layers(layer, num_layers, setup) for layer in range(num_layers)]
+    indptr = np.concatenate([[0], np.cumsum([len(layer_targets) for layer_targets in targets])]).astype(np.int64)
+    indices = np.array([target for layer_targets in targets for target in layer_targets], dtype=np.int64)
+    return indptr, indices
+
+
+def dxy_x0_check(xy1: np.ndarray,
+                 xy2: np.ndarray,
+                 z1: np.ndarray,
+                 z2: np.ndarray,
+                 x0: np.ndarray,
+                 criteria_mean: float,
+                 criteria_eps: float) -> np.ndarray:
+    """Array version of math_functions.checks.dxy_x0_check, using the same operations.
+
+    :return
+        boolean array, True if criteria is fulfilled
+    """
+    return ~(np.abs((xy2 - xy1) / x0 / np.abs(z2 - z1) - criteria_mean) > criteria_eps)
+
+
+def is_valid_doublet(x1: np.ndarray,
+                     y1: np.ndarray,
+                     z1: np.ndarray,
+                     x2: np.ndarray,
+                     y2: np.ndarray,
+                     z2: np.ndarray,
+                     z_ref: float,
+                     doublet_criteria: dict) -> np.ndarray:
+    """Array version of math_functions.checks.is_valid_doublet, using the same operations.
+    :param x1: x of first hits
+    :param y1: y of first hits
+    :param z1: z of first hits
+    :param x2: x of second hits
+    :param y2: y of second hits
+    :param z2: z of second hits
+    :param z_ref: reference layer z-value
+    :param doublet_criteria: doublet section of the configuration
+
+    :return
+        boolean array, True if valid doublet candidate
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x0 = x2 - (x2 - x1) * np.abs(z2 - z_ref) / (z2 - z1)
+        return dxy_x0_check(x1, x2, z1, z2, x0, doublet_criteria["dx/x0"], doublet_criteria["dx/x0 eps"]) & \
+            dxy_x0_check(y1, y2, z1, z2, x0, doublet_criteria["dy/x0"], doublet_criteria["dy/x0 eps"])
+
+
+def x_window(x1: np.ndarray,
+             z1: np.ndarray,
+             z2_min: float,
+             z2_max: float,
+             z_ref: float,
+             doublet_criteria: dict) -> tuple[np.ndarray, np.ndarray]:
+    """Range of x values of second hits which can fulfill the dx/x0 criterion with the given first hits. Solving
+    (x2 - x1) / x0 / (z2 - z1) = t for x2 gives x2 = x1 * (1 + t * (z2 - z_ref)) / (1 + t * (z1 - z_ref)), which is
+    monotonic in t for positive x1 and x0. Otherwise, the window is unbounded.
+    :param x1: x of first hits
+    :param z1: z of first hits
+    :param z2_min: minimum z of second hits
+    :param z2_max: maximum z of second hits
+    :param z_ref: reference layer z-value
+    :param doublet_criteria: doublet section of the configuration
+
+    :return
+        (lower bound, upper bound) of x of second hits, slightly enlarged against rounding
+    """
+    t_low = doublet_criteria["dx/x0"] - doublet_criteria["dx/x0 eps"]
+    t_high = doublet_criteria["dx/x0"] + doublet_criteria["dx/x0 eps"]
+
+    bounds = []
+    for t in [t_low, t_high]:
+        for z2 in [z2_min, z2_max]:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                bounds.append(x1 * (1 + t * (z2 - z_ref)) / (1 + t * (z1 - z_ref)))
+    lower = np.minimum.reduce(bounds)
+    upper = np.maximum.reduce(bounds)
+
+    padding = 1e-9 * (np.abs(lower) + np.abs(upper)) + 1e-12
+    bounded = (x1 > 0) & (t_low > 0) & (1 + t_low * (z1 - z_ref) > 0) & np.isfinite(lower) & np.isfinite(upper)
+    return np.where(bounded, lower - padding, -np.inf), np.where(bounded, upper + padding, np.inf)
+
+
+def expand_windows(first: np.ndarray,
+                   start: np.ndarray,
+                   end: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Expands windows [start, end) of positions in a sorted array into explicit pairs.
+    :param first: index of the first hit of each window
+    :param start: start position of each window
+    :param end: end position of each window
+
+    :return
+        (first hit index, position in sorted array) of each pair
+    """
+    length = np.maximum(end - start, 0)
+    first_of_pair = np.repeat(first, length)
+    window_start = np.repeat(start - np.concatenate([[0], np.cumsum(length)[:-1]]), length)
+    return first_of_pair, window_start + np.arange(len(first_of_pair))
+
+
+def check_windows(first: np.ndarray,
+                  start: np.ndarray,
+                  end: np.ndarray,
+                  second: np.ndarray,
+                  x: np.ndarray,
+                  y: np.ndarray,
+                  z: np.ndarray,
+                  z_ref: float,
+                  doublet_criteria: dict,
+                  max_candidates_per_chunk: int = 2 ** 22) -> tuple[np.ndarray, np.ndarray]:
+    """Checks the exact doublet criteria for all candidates inside the windows of second hits.
+    :param first: index of the first hit of each window
+    :param start: start position of each window in second
+    :param end: end position of each window in second
+    :param second: indices of the second hits the windows refer to
+    :param x: x of all hits
+    :param y: y of all hits
+    :param z: z of all hits
+    :param z_ref: reference layer z-value
+    :param doublet_criteria: doublet section of the configuration
+    :param max_candidates_per_chunk: approximate number of candidate pairs checked at once
+
+    :return
+        (index of first hit, index of second hit) of the doublets, ordered by window and position in second
+    """
+    if len(first) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # expanding the windows in chunks limits the memory of the candidate arrays
+    candidates_before = np.concatenate([[0], np.cumsum(end - start)])
+    chunk_edges = np.unique(np.concatenate([
+        [0],
+        np.searchsorted(candidates_before,
+                        np.arange(0, candidates_before[-1], max_candidates_per_chunk),
+                        side='right') - 1,
+        [len(first)]]))
+
+    first_hits = []
+    second_hits = []
+    for chunk_start, chunk_end in zip(chunk_edges[:-1], chunk_edges[1:]):
+        first_of_pair, position = expand_windows(first[chunk_start:chunk_end],
+                                                 start[chunk_start:chunk_end],
+                                                 end[chunk_start:chunk_end])
+        second_of_pair = second[position]
+
+        valid = is_valid_doublet(x[first_of_pair], y[first_of_pair], z[first_of_pair],
+                                 x[second_of_pair], y[second_of_pair], z[second_of_pair],
+                                 z_ref,
+                                 doublet_criteria)
+        first_hits.append(first_of_pair[valid])
+        second_hits.append(second_of_pair[valid])
+    return np.concatenate(first_hits).astype(np.int64), np.concatenate(second_hits).astype(np.int64)
+
+
+def sort_by_group(x: np.ndarray,
+                  z: np.ndarray,
+                  hit_group: np.ndarray,
+                  num_groups: int) -> dict[str, np.ndarray]:
+    """Sorts the hits by group, i.e. layer or segment, and by x inside a group. The key of a sorted hit combines its
+    group and the rank of its x among all sorted hits, so the windows of second hits in any target group are found with
+    one np.searchsorted on the integer keys, without rounding.
+    :param x: x of all hits
+    :param z: z of all hits
+    :param hit_group: group of all hits, -1 for hits which are not used
+    :param num_groups: number of groups
+
+    :return
+        {'by group and x': <hit indices sorted by group and x>, 'keys': <key of the sorted hits>,
+        'sorted x': <x of the sorted hits in increasing order>, 'z min': <minimum z of each group>,
+        'z max': <maximum z of each group>}
+    """
+    used = np.flatnonzero(hit_group >= 0)
+    by_group_and_x = used[np.lexsort((x[used], hit_group[used]))]
+    sorted_group = hit_group[by_group_and_x].astype(np.int64)
+    sorted_x = np.sort(x[by_group_and_x])
+    keys = sorted_group * (len(by_group_and_x) + 1) + np.searchsorted(sorted_x, x[by_group_and_x], side='left')
+
+    group_starts = np.searchsorted(sorted_group, np.arange(num_groups + 1), side='left')
+    filled = np.flatnonzero(np.diff(group_starts) > 0)
+    z_min = np.full(num_groups, np.inf)
+    z_max = np.full(num_groups, -np.inf)
+    if len(filled) > 0:
+        z_min[filled] = np.minimum.reduceat(z[by_group_and_x], group_starts[filled])
+        z_max[filled] = np.maximum.reduceat(z[by_group_and_x], group_starts[filled])
+    return {'by group and x': by_group_and_x, 'keys': keys, 'sorted x': sorted_x, 'z min': z_min, 'z max': z_max}
+
+
+def candidate_windows(first: np.ndarray,
+                      x: np.ndarray,
+                      z: np.ndarray,
+                      hit_group: np.ndarray,
+                      groups: dict[str, np.ndarray],
+                      target_indptr: np.ndarray,
+                      target_indices: np.ndarray,
+                      z_ref: float,
+                      doublet_criteria: dict) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Windows of candidate second hits of the given first hits, one window per first hit and non-empty target group
+    holding the hits of that group allowed by the dx/x0 criterion.
+    :param first: indices of first hits, all in a group
+    :param x: x of all hits
+    :param z: z of all hits
+    :param hit_group: group of all hits
+    :param groups: hits sorted by group as returned by sort_by_group
+    :param target_indptr: CSR index pointer of the target groups
+    :param target_indices: CSR target groups, the target groups of group g are
+                           target_indices[target_indptr[g]:target_indptr[g + 1]]
+    :param z_ref: reference layer z-value
+    :param doublet_criteria: doublet section of the configuration
+
+    :return
+        (index of first hit, window start, window end) with windows [start, end) of positions in
+        groups['by group and x'], ordered by first hit and target group
+    """
+    first_group = hit_group[first]
+    first_of_window, position = expand_windows(first, target_indptr[first_group], target_indptr[first_group + 1])
+    target = target_indices[position].astype(np.int64)
+    filled = np.isfinite(groups['z min'][target])
+    first_of_window, target = first_of_window[filled], target[filled]
+
+    lower, upper = x_window(x[first_of_window], z[first_of_window], groups['z min'][target],
+                            groups['z max'][target], z_ref, doublet_criteria)
+    key_offset = target * (len(groups['keys']) + 1)
+    start = np.searchsorted(groups['keys'], key_offset + np.searchsorted(groups['sorted x'], lower, side='left'),
+                            side='left')
+    end = np.searchsorted(groups['keys'], key_offset + np.searchsorted(groups['sorted x'], upper, side='right'),
+                          side='left')
+    return first_of_window, start, end
+
+
+def find_doublets_of_first_hits(first: np.ndarray,
+                                x: np.ndarray,
+                                y: np.ndarray,
+                                z: np.ndarray,
+                                hit_group: np.ndarray,
+                                groups: dict[str, np.ndarray],
+                                target_indptr: np.ndarray,
+                                target_indices: np.ndarray,
+                                z_ref: float,
+                                doublet_criteria: dict) -> tuple[np.ndarray, np.ndarray]:
+    """Finds the doublets of the given first hits with the hits of the target groups of their group. The candidates
+    of a first hit in a target group are the window of hits allowed by the dx/x0 criterion inside that group.
+    :param first: indices of first hits, all in a group
+    :param x: x of all hits
+    :param y: y of all hits
+    :param z: z of all hits
+    :param hit_group: group of all hits
+    :param groups: hits sorted by group as returned by sort_by_group
+    :param target_indptr: CSR index pointer of the target groups
+    :param target_indices: CSR target groups, the target groups of group g are
+                           target_indices[target_indptr[g]:target_indptr[g + 1]]
+    :param z_ref: reference layer z-value
+    :param doublet_criteria: doublet section of the configuration
+
+    :return
+        (index of first hit, index of second hit) of the doublets, ordered by first hit, target group and x of the
+        second hit
+    """
+    first_of_window, start, end = candidate_windows(first, x, z, hit_group, groups, target_indptr, target_indices,
+                                                    z_ref, doublet_criteria)
+    return check_windows(first_of_window, start, end, groups['by group and x'], x, y, z, z_ref, doublet_criteria)
+
+
+def find_doublets_in_groups(x: np.ndarray,
+                            y: np.ndarray,
+                            z: np.ndarray,
+                            hit_group: np.ndarray,
+                            target_indptr: np.ndarray,
+                            target_indices: np.ndarray,
+                            z_ref: float,
+                            doublet_criteria: dict) -> tuple[np.ndarray, np.ndarray]:
+    """Finds all doublets whose second hit lies in a target group of the group of the first hit. With the segments as
+    groups and the segment mapping as targets, only the hits of mapped segment pairs are compared.
+    :param x: x of all hits
+    :param y: y of all hits
+    :param z: z of all hits
+    :param hit_group: group of all hits, -1 for hits which are not used
+    :param target_indptr: CSR index pointer of the target groups
+    :param target_indices: CSR target groups
+    :param z_ref: reference layer z-value
+    :param doublet_criteria: doublet section of the configuration
+
+    :return
+        (index of first hit, index of second hit) of all doublets, ordered by group of the first hit, first hit, target
+        group and x of the second hit
+    """
+    groups = sort_by_group(x, z, hit_group, len(target_indptr) - 1)
+    used = np.flatnonzero(hit_group >= 0)
+    first = used[np.argsort(hit_group[used], kind='stable')]
+    return find_doublets_of_first_hits(first, x, y, z, hit_group, groups, target_indptr, target_indices, z_ref,
+                                       doublet_criteria)
+
+
+def count_candidates(x: np.ndarray,
+                     z: np.ndarray,
+                     hit_group: np.ndarray,
+                     target_indptr: np.ndarray,
+                     target_indices: np.ndarray,
+                     z_ref: float,
+                     doublet_criteria: dict) -> int:
+    """Number of hit pairs find_doublets_in_groups checks with the exact doublet criteria, i.e. the summed size of the
+    candidate windows of all first hits.
+    :param x: x of all hits
+    :param z: z of all hits
+    :param hit_group: group of all hits, -1 for hits which are not used
+    :param target_indptr: CSR index pointer of the target groups
+    :param target_indices: CSR target groups
+    :param z_ref: reference layer z-value
+    :param doublet_criteria: doublet section of the configuration
+
+    :return
+        number of candidate pairs
+    """
+    groups = sort_by_group(x, z, hit_group, len(target_indptr) - 1)
+    _, start, end = candidate_windows(np.flatnonzero(hit_group >= 0), x, z, hit_group, groups, target_indptr,
+                                      target_indices, z_ref, doublet_criteria)
+    return int(np.sum(end - start))
+
+
+def find_doublets(x: np.ndarray,
+                  y: np.ndarray,
+                  z: np.ndarray,
+                  layer: np.ndarray,
+                  num_layers: int,
+                  setup: str,
+                  z_ref: float,
+                  doublet_criteria: dict) -> tuple[np.ndarray, np.ndarray]:
+    """Finds all doublets between consecutive layers (next two layers in the full setup) without segmentation, with
+    the layers as groups of find_doublets_in_groups.
+    :param x: x of all hits
+    :param y: y of all hits
+    :param z: z of all hits
+    :param layer: layer of all hits, -1 for hits outside the detector
+    :param num_layers: number of detector layers
+    :param setup: 'full' or 'simplified'
+    :param z_ref: reference layer z-value
+    :param doublet_criteria: doublet section of the configuration
+
+    :return
+        (index of first hit, index of second hit) of all doublets, ordered by source layer, first hit, target layer
+        and x of the second hit
+    """
+    return find_doublets_in_groups(x, y, z, layer, *layer_targets(num_layers, setup), z_ref, doublet_criteria)
+
+
+def find_truth_doublets(particle_id: np.ndarray,
+                        layer: np.ndarray,
+                        max_layer_distance: int) -> tuple[np.ndarray, np.ndarray]:
+    """Finds all pairs of hits of the same particle whose layers differ by 1 to max_layer_distance. The hits are
+    lexsorted by (particle id, layer), so the partners of a hit in layer l are the contiguous range of hits of the same
+    particle in layers l + 1 to l + max_layer_distance.
+    :param particle_id: particle id of the hits
+    :param layer: layer of the hits
+    :param max_layer_distance: maximum layer distance of the hits of a doublet, 2 for the full setup, else 1
+
+    :return
+        (index of first hit, index of second hit) of the truth doublets, indices refer to the input arrays
+    """
+    order = np.lexsort((layer, particle_id))
+    _, particle_rank = np.unique(particle_id[order], return_inverse=True)
+    # (particle, layer) key increasing along order, layers of different particles can not overlap
+    key = particle_rank.astype(np.int64) * (int(np.max(layer, initial=0)) + max_layer_distance + 1) + layer[order]
+    positions = np.arange(len(order))
+    first, position = expand_windows(positions,
+                                     np.searchsorted(key, key + 1, side='left'),
+                                     np.searchsorted(key, key + max_layer_distance, side='right'))
+    return order[first], order[position]
+
+
+def filter_by_segment_mapping(first_hits: np.ndarray,
+                              second_hits: np.ndarray,
+                              hit_segment: np.ndarray,
+                              mapping_indptr: np.ndarray,
+                              mapping_indices: np.ndarray) -> np.ndarray:
+    """Selects the doublets whose second hit lies in a target segment of the segment of the first hit.
+    :param first_hits: index of first hits
+    :param second_hits: index of second hits
+    :param hit_segment: global segment index of all hits
+    :param mapping_indptr: CSR index pointer of the segment mapping
+    :param mapping_indices: CSR target segments of the segment mapping
+
+    :return
+        boolean array, True if the doublet is allowed by the segment mapping
+    """
+    num_segments = len(mapping_indptr) - 1
+    sources = np.repeat(np.arange(num_segments, dtype=np.int64), np.diff(mapping_indptr))
+    allowed_pairs = sources * num_segments + mapping_indices  # sorted, targets are ascending per source
+    pairs = hit_segment[first_hits] * num_segments + hit_segment[second_hits]
+    position = np.clip(np.searchsorted(allowed_pairs, pairs), 0, max(len(allowed_pairs) - 1, 0))
+    if len(allowed_pairs) == 0:
+        return np.zeros(len(pairs), dtype=bool)
+    return (allowed_pairs[position] == pairs) & (hit_segment[first_hits] >= 0) & (hit_segment[second_hits] >= 0)
@@ -0,0 +1,287 @@
+import numpy as np
+
+from numba import njit, prange
+
+from pattern_building.doublet_engine import layer_targets
+
+
+@njit(cache=True, error_model='numpy')
+def is_valid_doublet(x1: float,
+                     y1: float,
+                     z1: float,
+                     x2: float,
+                     y2: float,
+                     z2: float,
+                     z_ref: float,
+                     criteria: np.ndarray) -> bool:
+    """Doublet criteria of math_functions.checks.is_valid_doublet on plain floats, using the same operations.
+    Divisions by zero result in NaN, which passes the criteria like in the array version of the doublet engine.
+    :param criteria: [dx/x0, dx/x0 eps, dy/x0, dy/x0 eps]
+
+    :return
+        True if valid doublet candidate, else False
+    """
+    x0 = x2 - (x2 - x1) * abs(z2 - z_ref) / (z2 - z1)
+    if abs((x2 - x1) / x0 / abs(z2 - z1) - criteria[0]) > criteria[1]:
+        return False
+    if abs((y2 - y1) / x0 / abs(z2 - z1) - criteria[2]) > criteria[3]:
+        return False
+    return True
+
+
+@njit(cache=True, error_model='numpy')
+def x_window(x1: float,
+             z1: float,
+             z2_min: float,
+             z2_max: float,
+             z_ref: float,
+             criteria: np.ndarray) -> tuple[float, float]:
+    """Scalar version of doublet_engine.x_window.
+    :param criteria: [dx/x0, dx/x0 eps, dy/x0, dy/x0 eps]
+
+    :return
+        (lower bound, upper bound) of x of second hits
+    """
+    t_low = criteria[0] - criteria[1]
+    t_high = criteria[0] + criteria[1]
+    lower = np.inf
+    upper = -np.inf
+    for t in (t_low, t_high):
+        for z2 in (z2_min, z2_max):
+            bound = x1 * (1 + t * (z2 - z_ref)) / (1 + t * (z1 - z_ref))
+            lower = min(lower, bound)
+            upper = max(upper, bound)
+
+    if not (x1 > 0 and t_low > 0 and 1 + t_low * (z1 - z_ref) > 0 and np.isfinite(lower) and np.isfinite(upper)):
+        return -np.inf, np.inf
+    padding = 1e-9 * (abs(lower) + abs(upper)) + 1e-12
+    return lower - padding, upper + padding
+
+
+@njit(cache=True, error_model='numpy')
+def is_valid_triplet(x1: float,
+                     y1: float,
+                     z1: float,
+                     x2: float,
+                     y2: float,
+                     z2: float,
+                     x3: float,
+                     y3: float,
+                     z3: float,
+                     max_scattering: float) -> bool:
+    """Scattering criterion of math_functions.checks.is_valid_triplet on plain floats, using the same operations.
+
+    :return
+        True if criteria applies, else False
+    """
+    xz_12 = np.arctan2(x2 - x1, z2 - z1)
+    xz_23 = np.arctan2(x3 - x2, z3 - z2)
+    yz_12 = np.arctan2(y2 - y1, z2 - z1)
+    yz_23 = np.arctan2(y3 - y2, z3 - z2)
+    return np.sqrt((xz_23 - xz_12) ** 2 + (yz_23 - yz_12) ** 2) < max_scattering
+
+
+@njit(cache=True, error_model='numpy')
+def target_window(x1: float,
+                  z1: float,
+                  target: int,
+                  x: np.ndarray,
+                  group_offsets: np.ndarray,
+                  z_min: np.ndarray,
+                  z_max: np.ndarray,
+                  z_ref: float,
+                  criteria: np.ndarray) -> tuple[int, int]:
+    """Window of candidate second hits of a first hit inside a target group.
+    :param x1: x of the first hit
+    :param z1: z of the first hit
+    :param target: target group
+    :param x: x of the sorted hits
+    :param group_offsets: start of each group in the sorted hits, with the number of hits as last entry
+    :param z_min: minimum z of each group
+    :param z_max: maximum z of each group
+    :param z_ref: reference layer z-value
+    :param criteria: [dx/x0, dx/x0 eps, dy/x0, dy/x0 eps]
+
+    :return
+        (start, end) of the window in the sorted hits
+    """
+    lower, upper = x_window(x1, z1, z_min[target], z_max[target], z_ref, criteria)
+    target_x = x[group_offsets[target]:group_offsets[target + 1]]
+    return (group_offsets[target] + np.searchsorted(target_x, lower, side='left'),
+            group_offsets[target] + np.searchsorted(target_x, upper, side='right'))
+
+
+@njit(cache=True, parallel=True, error_model='numpy')
+def multiplet_kernel(x: np.ndarray,
+                     y: np.ndarray,
+                     z: np.ndarray,
+                     group_offsets: np.ndarray,
+                     target_indptr: np.ndarray,
+                     target_indices: np.ndarray,
+                     z_ref: float,
+                     criteria: np.ndarray,
+                     max_scattering: float) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Creates all doublets and triplets in one call. The hits have to be sorted by group, i.e. layer or segment, and
+    by x inside a group, the hits of group g are hits[group_offsets[g]:group_offsets[g + 1]]. The second hit of a
+    doublet lies in a target group of the group of its first hit. Doublets and triplets are counted in a first parallel
+    pass over the hits and doublets, and written in a second one, so the result does not depend on the number of
+    threads.
+    :param x: x of the sorted hits
+    :param y: y of the sorted hits
+    :param z: z of the sorted hits
+    :param group_offsets: start of each group in the sorted hits, with the number of hits as last entry
+    :param target_indptr: CSR index pointer of the target groups
+    :param target_indices: CSR target groups, the target groups of group g are
+                           target_indices[target_indptr[g]:target_indptr[g + 1]]
+    :param z_ref: reference layer z-value
+    :param criteria: [dx/x0, dx/x0 eps, dy/x0, dy/x0 eps]
+    :param max_scattering: maximum allowed scattering
+
+    :return
+        (first hit, second hit) of the doublets, ordered by first hit, target group and second hit, and
+        (first doublet, second doublet) of the triplets, ordered by first doublet and second doublet
+    """
+    num_groups = len(group_offsets) - 1
+    num_hits = group_offsets[-1]
+    hit_group = np.empty(num_hits, dtype=np.int64)
+    for group in range(num_groups):
+        hit_group[group_offsets[group]:group_offsets[group + 1]] = group
+
+    z_min = np.zeros(num_groups)
+    z_max = np.zeros(num_groups)
+    for group in range(num_groups):
+        if group_offsets[group + 1] > group_offsets[group]:
+            z_min[group] = z[group_offsets[group]:group_offsets[group + 1]].min()
+            z_max[group] = z[group_offsets[group]:group_offsets[group + 1]].max()
+
+    # the windows of candidate second hits are computed in both passes, they are cheap compared to the criteria
+    doublet_count = np.zeros(num_hits, dtype=np.int64)
+    for i in prange(num_hits):
+        group = hit_group[i]
+        for k in range(target_indptr[group], target_indptr[group + 1]):
+            target = target_indices[k]
+            if group_offsets[target + 1] == group_offsets[target]:
+                continue
+            start, end = target_window(x[i], z[i], target, x, group_offsets, z_min, z_max, z_ref, criteria)
+            for j in range(start, end):
+                if is_valid_doublet(x[i], y[i], z[i], x[j], y[j], z[j], z_ref, criteria):
+                    doublet_count[i] += 1
+
+    doublet_offsets = np.zeros(num_hits + 1, dtype=np.int64)
+    doublet_offsets[1:] = np.cumsum(doublet_count)
+    first_hits = np.empty(doublet_offsets[-1], dtype=np.int64)
+    second_hits = np.empty(doublet_offsets[-1], dtype=np.int64)
+    for i in prange(num_hits):
+        group = hit_group[i]
+        position = doublet_offsets[i]
+        for k in range(target_indptr[group], target_indptr[group + 1]):
+            target = target_indices[k]
+            if group_offsets[target + 1] == group_offsets[target]:
+                continue
+            start, end = target_window(x[i], z[i], target, x, group_offsets, z_min, z_max, z_ref, criteria)
+            for j in range(start, end):
+                if is_valid_doublet(x[i], y[i], z[i], x[j], y[j], z[j], z_ref, criteria):
+                    first_hits[position] = i
+                    second_hits[position] = j
+                    position += 1
+
+    # doublets are grouped by their first hit, so doublet_offsets is the CSR structure for joining the doublets
+    num_doublets = len(first_hits)
+    triplet_count = np.zeros(num_doublets, dtype=np.int64)
+    for d in prange(num_doublets):
+        i = first_hits[d]
+        j = second_hits[d]
+        for e in range(doublet_offsets[j], doublet_offsets[j + 1]):
+            k = second_hits[e]
+            if is_valid_triplet(x[i], y[i], z[i], x[j], y[j], z[j], x[k], y[k], z[k], max_scattering):
+                triplet_count[d] += 1
+
+    triplet_offsets = np.zeros(num_doublets + 1, dtype=np.int64)
+    triplet_offsets[1:] = np.cumsum(triplet_count)
+    first_doublets = np.empty(triplet_offsets[-1], dtype=np.int64)
+    second_doublets = np.empty(triplet_offsets[-1], dtype=np.int64)
+    for d in prange(num_doublets):
+        i = first_hits[d]
+        j = second_hits[d]
+        position = triplet_offsets[d]
+        for e in range(doublet_offsets[j], doublet_offsets[j + 1]):
+            k = second_hits[e]
+            if is_valid_triplet(x[i], y[i], z[i], x[j], y[j], z[j], x[k], y[k], z[k], max_scattering):
+                first_doublets[position] = d
+                second_doublets[position] = e
+                position += 1
+
+    return first_hits, second_hits, first_doublets, second_doublets
+
+
+def find_multiplets_in_groups(x: np.ndarray,
+                              y: np.ndarray,
+                              z: np.ndarray,
+                              hit_group: np.ndarray,
+                              target_indptr: np.ndarray,
+                              target_indices: np.ndarray,
+                              z_ref: float,
+                              doublet_criteria: dict,
+                              max_scattering: float) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Creates doublets and triplets of all hits with the compiled multiplet kernel. Same selection as
+    doublet_engine.find_doublets_in_groups followed by triplet_engine.find_triplets.
+    :param x: x of all hits
+    :param y: y of all hits
+    :param z: z of all hits
+    :param hit_group: group (layer or segment) of all hits, -1 for hits which are not used
+    :param target_indptr: CSR index pointer of the target groups
+    :param target_indices: CSR target groups
+    :param z_ref: reference layer z-value
+    :param doublet_criteria: doublet section of the configuration
+    :param max_scattering: maximum allowed scattering
+
+    :return
+        (index of first hit, index of second hit) of all doublets and
+        (index of first doublet, index of second doublet) of all triplets
+    """
+    used = np.flatnonzero(hit_group >= 0)
+    order = used[np.lexsort((x[used], hit_group[used]))]
+    group_offsets = np.searchsorted(hit_group[order], np.arange(len(target_indptr)), side='left').astype(np.int64)
+    criteria = np.array([doublet_criteria[key] for key in ['dx/x0', 'dx/x0 eps', 'dy/x0', 'dy/x0 eps']],
+                        dtype=np.float64)
+
+    first_hits, second_hits, first_doublets, second_doublets = multiplet_kernel(
+        np.ascontiguousarray(x[order], dtype=np.float64),
+        np.ascontiguousarray(y[order], dtype=np.float64),
+        np.ascontiguousarray(z[order], dtype=np.float64),
+        group_offsets,
+        np.asarray(target_indptr, dtype=np.int64),
+        np.asarray(target_indices, dtype=np.int64),
+        float(z_ref),
+        criteria,
+        float(max_scattering))
+    return order[first_hits], order[second_hits], first_doublets, second_doublets
+
+
+def find_multiplets(x: np.ndarray,
+                    y: np.ndarray,
+                    z: np.ndarray,
+                    layer: np.ndarray,
+                    num_layers: int,
+                    setup: str,
+                    z_ref: float,
+                    doublet_criteria: dict,
+                    max_scattering: float) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Creates doublets and triplets of all hits without segmentation, with the layers as groups of
+    find_multiplets_in_groups.
+    :param x: x of all hits
+    :param y: y of all hits
+    :param z: z of all hits
+    :param layer: layer of all hits, -1 for hits which are not used
+    :param num_layers: number of detector layers
+    :param setup: 'full' or 'simplified'
+    :param z_ref: reference layer z-value
+    :param doublet_criteria: doublet section of the configuration
+    :param max_scattering: maximum allowed scattering
+
+    :return
+        (index of first hit, index of second hit) of all doublets and
+        (index of first doublet, index of second doublet) of all triplets
+    """
+    return find_multiplets_in_groups(x, y, z, layer, *layer_targets(num_layers, setup), z_ref, doublet_criteria,
+                                     max_scattering)
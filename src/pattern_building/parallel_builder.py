@@ -0,0 +1,237 @@
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from pattern_building.doublet_engine import layer_targets, sort_by_group, find_doublets_of_first_hits
+from pattern_building.triplet_engine import doublets_by_first_hit, join_doublets
+
+
+def to_shared_memory(arrays: dict[str, np.ndarray]) -> tuple[list[shared_memory.SharedMemory], dict[str, tuple]]:
+    """Copies arrays into shared memory blocks.
+    :param arrays: {<name>: <array>}
+
+    :return
+        (shared memory blocks, {<name>: (<block name>, <shape>, <dtype>)}), the blocks have to be closed and unlinked
+        by the caller
+    """
+    blocks = []
+    descriptions = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        descriptions.update({name: (block.name, array.shape, array.dtype.str)})
+    return blocks, descriptions
+
+
+def from_shared_memory(descriptions: dict[str, tuple]) -> tuple[list[shared_memory.SharedMemory],
+                                                                dict[str, np.ndarray]]:
+    """Attaches to shared memory blocks created by to_shared_memory, without copying.
+    :param descriptions: {<name>: (<block name>, <shape>, <dtype>)}
+
+    :return
+        (shared memory blocks, {<name>: <array>}), the blocks have to be closed after the arrays are used
+    """
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in descriptions.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays.update({name: np.ndarray(shape, dtype=dtype, buffer=block.buf)})
+    return blocks, arrays
+
+
+def release_shared_memory(blocks: list[shared_memory.SharedMemory],
+                          unlink: bool = False) -> None:
+    """Closes shared memory blocks and optionally frees them.
+    :param blocks: shared memory blocks
+    :param unlink: if True, the blocks are freed, only done by the process which created them
+    """
+    for block in blocks:
+        block.close()
+        if unlink:
+            block.unlink()
+
+
+def doublet_work_unit(hits: dict[str, tuple],
+                      first_start: int,
+                      first_end: int,
+                      z_ref: float,
+                      doublet_criteria: dict) -> tuple[np.ndarray, np.ndarray]:
+    """Creates the doublets of a block of first hits with the hits of their target groups. Executed in the worker
+    processes.
+    :param hits: shared memory description of the hit arrays 'x', 'y', 'z', 'hit group', 'by group' with the hit
+                 indices sorted by group, the arrays of doublet_engine.sort_by_group and the CSR target groups
+                 'target indptr' and 'target indices'
+    :param first_start: start of the block of first hits in 'by group'
+    :param first_end: end of the block of first hits in 'by group'
+    :param z_ref: reference layer z-value
+    :param doublet_criteria: doublet section of the configuration
+
+    :return
+        (index of first hit, index of second hit) of the doublets
+    """
+    blocks, arrays = from_shared_memory(hits)
+    try:
+        return find_doublets_of_first_hits(arrays['by group'][first_start:first_end],
+                                           arrays['x'],
+                                           arrays['y'],
+                                           arrays['z'],
+                                           arrays['hit group'],
+                                           {name: arrays[name] for name in ['by group and x', 'keys', 'sorted x',
+                                                                            'z min', 'z max']},
+                                           arrays['target indptr'],
+                                           arrays['target indices'],
+                                           z_ref,
+                                           doublet_criteria)
+    finally:
+        del arrays
+        release_shared_memory(blocks)
+
+
+def triplet_work_unit(hits: dict[str, tuple],
+                      doublets: dict[str, tuple],
+                      doublet_start: int,
+                      doublet_end: int,
+                      max_scattering: float) -> tuple[np.ndarray, np.ndarray]:
+    """Creates the triplets starting with a block of doublets. Executed in the worker processes.
+    :param hits: shared memory description of the hit arrays 'x', 'y' and 'z'
+    :param doublets: shared memory description of the doublet arrays 'first hits', 'second hits' and of the CSR
+                     structure 'indptr', 'doublets' of triplet_engine.doublets_by_first_hit
+    :param doublet_start: first doublet of the block
+    :param doublet_end: end of the block of doublets
+    :param max_scattering: maximum allowed scattering
+
+    :return
+        (index of first doublet, index of second doublet) of the triplets
+    """
+    hit_blocks, hit_arrays = from_shared_memory(hits)
+    doublet_blocks, doublet_arrays = from_shared_memory(doublets)
+    try:
+        return join_doublets(np.arange(doublet_start, doublet_end),
+                             doublet_arrays['indptr'],
+                             doublet_arrays['doublets'],
+                             doublet_arrays['first hits'],
+                             doublet_arrays['second hits'],
+                             hit_arrays['x'],
+                             hit_arrays['y'],
+                             hit_arrays['z'],
+                             max_scattering)
+    finally:
+        del hit_arrays, doublet_arrays
+        release_shared_memory(hit_blocks + doublet_blocks)
+
+
+def find_multiplets_parallel_in_groups(x: np.ndarray,
+                                       y: np.ndarray,
+                                       z: np.ndarray,
+                                       hit_group: np.ndarray,
+                                       target_indptr: np.ndarray,
+                                       target_indices: np.ndarray,
+                                       z_ref: float,
+                                       doublet_criteria: dict,
+                                       max_scattering: float,
+                                       num_workers: int | None = None,
+                                       block_size: int = 4096) -> tuple[np.ndarray, np.ndarray, np.ndarray,
+                                                                        np.ndarray]:
+    """Creates doublets and triplets with a process pool. The hit arrays are placed in shared memory, the work units
+    are blocks of first hits for the doublets and blocks of doublets for the triplets. The results of the work units
+    are concatenated in the order of the work units, so the output is identical to
+    doublet_engine.find_doublets_in_groups followed by triplet_engine.find_triplets for any number of workers.
+    :param x: x of all hits
+    :param y: y of all hits
+    :param z: z of all hits
+    :param hit_group: group (layer or segment) of all hits, -1 for hits which are not used
+    :param target_indptr: CSR index pointer of the target groups
+    :param target_indices: CSR target groups
+    :param z_ref: reference layer z-value
+    :param doublet_criteria: doublet section of the configuration
+    :param max_scattering: maximum allowed scattering
+    :param num_workers: number of processes, default is the number of CPUs
+    :param block_size: number of first hits or doublets of a work unit
+
+    :return
+        (index of first hit, index of second hit) of all doublets and
+        (index of first doublet, index of second doublet) of all triplets
+    """
+    # same first hit ordering as find_doublets_in_groups
+    used = np.flatnonzero(hit_group >= 0)
+    by_group = used[np.argsort(hit_group[used], kind='stable')]
+
+    hit_blocks, hits = to_shared_memory({'x': np.asarray(x, dtype=np.float64),
+                                         'y': np.asarray(y, dtype=np.float64),
+                                         'z': np.asarray(z, dtype=np.float64),
+                                         'hit group': hit_group,
+                                         'by group': by_group,
+                                         'target indptr': target_indptr,
+                                         'target indices': target_indices,
+                                         **sort_by_group(x, z, hit_group, len(target_indptr) - 1)})
+    doublet_blocks = []
+    try:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = [executor.submit(doublet_work_unit,
+                                       hits,
+                                       first_start,
+                                       min(first_start + block_size, len(by_group)),
+                                       z_ref,
+                                       doublet_criteria)
+                       for first_start in range(0, len(by_group), block_size)]
+            doublets = [future.result() for future in futures]
+            first_hits = np.concatenate([np.empty(0, dtype=np.int64)] + [doublet[0] for doublet in doublets])
+            second_hits = np.concatenate([np.empty(0, dtype=np.int64)] + [doublet[1] for doublet in doublets])
+
+            indptr, doublets_by_first = doublets_by_first_hit(first_hits, len(x))
+            doublet_blocks, doublet_arrays = to_shared_memory({'first hits': first_hits,
+                                                               'second hits': second_hits,
+                                                               'indptr': indptr,
+                                                               'doublets': doublets_by_first})
+            futures = [executor.submit(triplet_work_unit,
+                                       hits,
+                                       doublet_arrays,
+                                       doublet_start,
+                                       min(doublet_start + block_size, len(first_hits)),
+                                       max_scattering)
+                       for doublet_start in range(0, len(first_hits), block_size)]
+            triplets = [future.result() for future in futures]
+            first_doublets = np.concatenate([np.empty(0, dtype=np.int64)] + [triplet[0] for triplet in triplets])
+            second_doublets = np.concatenate([np.empty(0, dtype=np.int64)] + [triplet[1] for triplet in triplets])
+    finally:
+        release_shared_memory(hit_blocks + doublet_blocks, unlink=True)
+
+    return first_hits, second_hits, first_doublets, second_doublets
+
+
+def find_multiplets_parallel(x: np.ndarray,
+                             y: np.ndarray,
+                             z: np.ndarray,
+                             layer: np.ndarray,
+                             num_layers: int,
+                             setup: str,
+                             z_ref: float,
+                             doublet_criteria: dict,
+                             max_scattering: float,
+                             num_workers: int | None = None,
+                             block_size: int = 4096) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Creates doublets and triplets with a process pool without segmentation, with the layers as groups of
+    find_multiplets_parallel_in_groups. The output is identical to doublet_engine.find_doublets followed by
+    triplet_engine.find_triplets.
+    :param x: x of all hits
+    :param y: y of all hits
+    :param z: z of all hits
+    :param layer: layer of all hits, -1 for hits which are not used
+    :param num_layers: number of detector layers
+    :param setup: 'full' or 'simplified'
+    :param z_ref: reference layer z-value
+    :param doublet_criteria: doublet section of the configuration
+    :param max_scattering: maximum allowed scattering
+    :param num_workers: number of processes, default is the number of CPUs
+    :param block_size: number of first hits or doublets of a work unit
+
+    :return
+        (index of first hit, index of second hit) of all doublets and
+        (index of first doublet, index of second doublet) of all triplets
+    """
+    return find_multiplets_parallel_in_groups(x, y, z, layer, *layer_targets(num_layers, setup), z_ref,
+                                              doublet_criteria, max_scattering, num_workers, block_size)
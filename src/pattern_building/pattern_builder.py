@@ -2,14 +2,18 @@ import time
 
 import numpy as np
 
-from math_functions.checks import is_valid_doublet, is_valid_triplet, x0_at_z_ref
-
 from utility.time_tracking import hms_string
-from utility.data_format_handler import load_data
 from pattern.detector_hit import DetectorHit
+from pattern.hit_table import HitTable
 from pattern.doublet import Doublet
 from pattern.triplet import Triplet
+from pattern.triplet_table import TripletTable
 from pattern_building.segment_manager import LUXESegmentManager
+from pattern_building.doublet_engine import layer_targets, find_doublets_in_groups, filter_by_segment_mapping, \
+    find_truth_doublets
+from pattern_building.triplet_engine import find_triplets, doublets_by_first_hit, chain_doublets
+from pattern_building.multiplet_kernel import find_multiplets_in_groups
+from pattern_building.parallel_builder import find_multiplets_parallel_in_groups
 
 
 class PatternBuilder:
@@ -21,6 +25,12 @@ class PatternBuilder:
         """
         self.configuration = configuration
         self.doublet_creation_time = None
+
+        # 'numpy' for the array engines, 'numba' for the compiled kernel creating doublets and triplets in one call
+        self.multiplet_kernel = configuration.get('pattern building', {}).get('multiplet kernel', 'numpy')
+
+        # number of processes for the array engines, None for creating doublets and triplets in this process
+        self.num_workers = configuration.get('pattern building', {}).get('num workers')
         self.triplet_creation_time = None
 
         # signal particles
@@ -41,9 +51,9 @@ class PatternBuilder:
         # undecided particles (blind sample)
         self.blinded_hits = 0
 
-        # some values to check if computation successful
-        self.all_truth_doublets = set()
-        self.all_truth_triplets = set()
+        # some values to check if computation successful, truth doublets and triplets as indices of their hits
+        self.all_truth_doublets = np.empty((0, 2), dtype=np.int64)
+        self.all_truth_triplets = np.empty((0, 3), dtype=np.int64)
         self.found_correct_doublets = 0
         self.found_correct_triplets = 0
         self.found_doublets = 0
@@ -52,72 +62,62 @@ class PatternBuilder:
         # track level
         self.num_signal_tracks = 0
 
+        # loaded hits, columnar and as DetectorHit objects with the same ordering
+        self.hit_table = None
+        self.detector_hits = []
+
+        # doublets as indices of their hits in the hit table, same ordering as the doublets in the segments
+        self.doublet_first_hits = np.empty(0, dtype=np.int64)
+        self.doublet_second_hits = np.empty(0, dtype=np.int64)
+
+        # triplets as indices of their hits in the hit table, same ordering as the triplets in the segments
+        self.triplet_hit_indices = np.empty((0, 3), dtype=np.int64)
+
+        # (first doublet, second doublet) of the triplets, if already created together with the doublets
+        self.precomputed_triplets = None
+
     def load_tracking_data(self,
-                           tracking_data_file: str,
-                           segment_manager: LUXESegmentManager,
-                           tracking_data_format: str) -> None:
-        """Loads tracking data from a file and stores and places the data in the corresponding segments.
-        :param tracking_data_file: LUXE tracking data file
+                           hit_table: HitTable,
+                           segment_manager: LUXESegmentManager) -> None:
+        """Stores the already loaded tracking data and places the hits in the corresponding segments. The hit table is
+        shared with other consumers (e.g. GenMultiplet), so the tracking data file is only parsed once.
+        :param hit_table: hits loaded from the LUXE tracking data file
         :param segment_manager: SegmentManager object
-        :param tracking_data_format: format of tracking data file
         """
         print('\n-----------------------------------\n')
-        print(f"Using tracking data file {tracking_data_file.split('/')[-1]}\n"
-              f"Placing data in segments ...\n")
-
-        list_of_hits = load_data(tracking_data_file, tracking_data_format)
-
-        for hit in list_of_hits:
-            if hit.is_signal:
-                self.fill_signal_particle_dictionary(hit)
-                self.signal_hits += 1
-            elif hit.is_signal is None:
-                self.fill_blinded_particle_dictionary(hit)
-                self.blinded_hits += 1
-            else:
-                self.fill_background_particle_dictionary(hit)
-                self.background_hits += 1
-
-            # adding particle to a segment, used to reduce combinatorial candidates
-            segment = segment_manager.get_segment_at_known_xyz_value(hit)
-            if segment:
-                segment.data.append(hit)
-            else:
-                print('Segment not found. Please check location of hits or detector geometry file!')
+        print(f"Placing {len(hit_table)} hits in segments ...\n")
+
+        self.hit_table = hit_table
+        self.detector_hits = self.hit_table.to_detector_hits()
+
+        is_signal = self.hit_table.is_signal
+        self.signal_hits = int(np.count_nonzero(is_signal))
+        self.background_hits = len(self.hit_table) - self.signal_hits
+        self.particle_dict_signal = self.hits_by_particle(np.flatnonzero(is_signal))
+        self.particle_dict_background = self.hits_by_particle(np.flatnonzero(~is_signal))
+
+        # adding hits to segments, used to reduce combinatorial candidates
+        num_hits_outside = segment_manager.fill_segments(self.hit_table, self.detector_hits)
+        if num_hits_outside > 0:
+            print(f'{num_hits_outside} hits not found in any segment. Please check location of hits or detector '
+                  f'geometry file!')
 
         print(f'Number of signal hits found: {self.signal_hits}')
         print(f'Number of background hits found: {self.background_hits}')
         print(f'Number of blinded hits found: {self.blinded_hits}')
 
-    def fill_signal_particle_dictionary(self,
-                                        hit: DetectorHit) -> None:
-        """Fill signal particle dict.
-        :param hit: detector hit object
-        """
-        if hit.particle_id in self.particle_dict_signal.keys():
-            self.particle_dict_signal[hit.particle_id].append(hit)
-        else:
-            self.particle_dict_signal.update({hit.particle_id: [hit]})
+    def hits_by_particle(self,
+                         hit_indices: np.ndarray) -> dict[int | None, list[DetectorHit]]:
+        """Groups the specified hits of the hit table by their particle id, keeping the order of the hits in the file.
+        :param hit_indices: indices of hits in the hit table
 
-    def fill_blinded_particle_dictionary(self,
-                                         hit: DetectorHit) -> None:
-        """Fill unknown particle dict.
-        :param hit: detector hit object
+        :return
+            {<particle id>: [<hit>, <hit>, ...]}, hits without particle information are stored under None
         """
-        if hit.particle_id in self.particle_dict_blinded.keys():
-            self.particle_dict_blinded[hit.particle_id].append(hit)
-        else:
-            self.particle_dict_blinded.update({hit.particle_id: [hit]})
-
-    def fill_background_particle_dictionary(self,
-                                            hit: DetectorHit):
-        """Fill unknown particle dict.
-        :param hit: detector hit object
-        """
-        if hit.particle_id in self.particle_dict_background.keys():
-            self.particle_dict_background[hit.particle_id].append(hit)
-        else:
-            self.particle_dict_background.update({hit.particle_id: [hit]})
+        order = hit_indices[np.argsort(self.hit_table.particle_id[hit_indices], kind='stable')]
+        particle_ids, group_starts = np.unique(self.hit_table.particle_id[order], return_index=True)
+        return {particle_id if particle_id != -1 else None: [self.detector_hits[i] for i in group]
+                for particle_id, group in zip(particle_ids.tolist(), np.split(order, group_starts[1:]))}
 
     def information_about_particle_tracks(self,
                                           z_position_layers: list[float],
@@ -133,27 +133,34 @@ class PatternBuilder:
         """
 
         max_layer_dist = None
-
-        for key, values in self.particle_dict_signal.items():
-            if len(values) >= min_track_length:
-                self.num_signal_tracks += 1
-            if setup == 'simplified':
-                max_layer_dist = 1
-            if setup == 'full':
-                max_layer_dist = 2
-
-            doublet_list = []
-            for i, hit_1 in enumerate(values[0:-1]):
-                for hit_2 in values[i + 1:]:
-                    if 1 <= z_position_layers.index(hit_2.z) - z_position_layers.index(hit_1.z) <= max_layer_dist:
-                        doublet_list.append(Doublet(hit_1, hit_2))
-            for d in doublet_list:
-                self.all_truth_doublets.add(d)
-
-            for m, d1 in enumerate(doublet_list):
-                for d2 in doublet_list[m + 1:]:
-                    if d1.hit_2.hit_id == d2.hit_1.hit_id:
-                        self.all_truth_triplets.add(Triplet(d1.hit_1, d2.hit_1, d2.hit_2))
+        if setup == 'simplified':
+            max_layer_dist = 1
+        if setup == 'full':
+            max_layer_dist = 2
+
+        signal = np.flatnonzero(self.hit_table.is_signal)
+        particle_id = self.hit_table.particle_id[signal]
+        _, num_particle_hits = np.unique(particle_id, return_counts=True)
+        self.num_signal_tracks += int(np.count_nonzero(num_particle_hits >= min_track_length))
+
+        # layer of the signal hits, hits have to be placed exactly at a layer position
+        layer_positions = np.asarray(z_position_layers)
+        layer_order = np.argsort(layer_positions, kind='stable')
+        z = self.hit_table.z[signal]
+        layer = np.minimum(np.searchsorted(layer_positions[layer_order], z), len(layer_positions) - 1)
+        on_layer = layer_positions[layer_order][layer] == z
+        if not np.all(on_layer):
+            raise ValueError(f'{z[~on_layer][0]} is not a z position of a detector layer')
+        layer = layer_order[layer]
+
+        # consecutive-layer truth doublets, truth triplets are chains of two truth doublets
+        first_hits, second_hits = find_truth_doublets(particle_id, layer, max_layer_dist)
+        indptr, doublets = doublets_by_first_hit(first_hits, len(signal))
+        first_doublets, second_doublets = chain_doublets(np.arange(len(first_hits)), indptr, doublets, second_hits)
+        self.all_truth_doublets = np.column_stack([signal[first_hits], signal[second_hits]])
+        self.all_truth_triplets = np.column_stack([signal[first_hits[first_doublets]],
+                                                   signal[second_hits[first_doublets]],
+                                                   signal[second_hits[second_doublets]]])
 
         if sample_composition == 'blinded':
             print('Truth information about particles cannot be accessed in blinded example!')
@@ -162,62 +169,146 @@ class PatternBuilder:
             print(f"Number of complete signal tracks: {self.num_signal_tracks}\n")
 
     def create_doublet_list(self,
-                            segment_manager: LUXESegmentManager) -> None:
-        """Creates the doublets. For LUXE detector model only.
+                            segment_manager: LUXESegmentManager,
+                            use_segment_mapping: bool = True) -> None:
+        """Creates the doublets with the array doublet engine, or together with the triplets with the compiled multiplet
+        kernel or a process pool if configured. With the segment mapping, the candidate second hits of a first hit are
+        searched only inside the target segments of its segment, otherwise in all hits of the target layers. The
+        doublets are stored in the segment of their first hit, ordered like a loop over segments, first hits, target
+        segments and second hits would create them. For LUXE detector model only.
         :param segment_manager: SegmentManager object with already set segments and mapping
+        :param use_segment_mapping: if True, only doublets between a segment and its target segments are created,
+                                    otherwise all hits placed in a segment are combined
         """
-        num_layers = len(segment_manager.segment_storage.keys())
-        for layer in range(num_layers - 1):
-            for segment in segment_manager.segment_storage[layer]:
-                if segment.name not in segment_manager.segment_mapping.keys():
-                    continue
-                next_segments = segment_manager.target_segments(segment.name)  # target segments
-
-                for first_hit in segment.data:
-                    for target_segment in next_segments:
-                        for second_hit in target_segment.data:
-                            if not is_valid_doublet(first_hit,
-                                                    second_hit,
-                                                    segment_manager.z_position_to_layer[0],
-                                                    self.configuration):
-                                continue
-                            doublet = Doublet(first_hit, second_hit)
-                            segment.doublet_data.append(doublet)
-                            self.found_doublets += 1
-
-                            if doublet.from_same_particle():
-                                self.found_correct_doublets += 1
+        hit_segment = segment_manager.hit_segment
+        if use_segment_mapping:
+            hit_group = hit_segment
+            target_indptr, target_indices = segment_manager.mapping_indptr, segment_manager.mapping_indices
+        else:
+            layer = segment_manager.geometry.layer_at_z(self.hit_table.z, tolerance=segment_manager.z_tolerance)
+            hit_group = np.where(hit_segment >= 0, layer, -1)
+            target_indptr, target_indices = layer_targets(len(segment_manager.segment_storage.keys()),
+                                                          segment_manager.setup)
+
+        first_doublets, second_doublets = None, None
+        if self.multiplet_kernel == 'numba':
+            first_hits, second_hits, first_doublets, second_doublets = find_multiplets_in_groups(
+                self.hit_table.x,
+                self.hit_table.y,
+                self.hit_table.z,
+                hit_group,
+                target_indptr,
+                target_indices,
+                segment_manager.z_position_to_layer[0],
+                self.configuration["doublet"],
+                self.configuration["triplet"]["max scattering"])
+        elif self.num_workers is not None and self.num_workers > 1:
+            first_hits, second_hits, first_doublets, second_doublets = find_multiplets_parallel_in_groups(
+                self.hit_table.x,
+                self.hit_table.y,
+                self.hit_table.z,
+                hit_group,
+                target_indptr,
+                target_indices,
+                segment_manager.z_position_to_layer[0],
+                self.configuration["doublet"],
+                self.configuration["triplet"]["max scattering"],
+                num_workers=self.num_workers)
+        else:
+            first_hits, second_hits = find_doublets_in_groups(self.hit_table.x,
+                                                              self.hit_table.y,
+                                                              self.hit_table.z,
+                                                              hit_group,
+                                                              target_indptr,
+                                                              target_indices,
+                                                              segment_manager.z_position_to_layer[0],
+                                                              self.configuration["doublet"])
+
+        order = np.lexsort((second_hits, hit_segment[second_hits], first_hits, hit_segment[first_hits]))
+        self.doublet_first_hits = first_hits[order]
+        self.doublet_second_hits = second_hits[order]
+
+        if first_doublets is not None:
+            # precomputed triplets refer to the doublets before sorting
+            position = np.empty(len(order), dtype=np.int64)
+            position[order] = np.arange(len(order))
+            self.precomputed_triplets = (position[first_doublets], position[second_doublets])
+
+        all_segments = segment_manager.get_all_segments()
+        segments, group_starts = np.unique(hit_segment[self.doublet_first_hits], return_index=True)
+        group_ends = np.append(group_starts[1:], len(order))
+        for segment, group_start, group_end in zip(segments.tolist(), group_starts.tolist(), group_ends.tolist()):
+            all_segments[segment].doublet_data = [
+                Doublet(self.detector_hits[i1], self.detector_hits[i2])
+                for i1, i2 in zip(self.doublet_first_hits[group_start:group_end].tolist(),
+                                  self.doublet_second_hits[group_start:group_end].tolist())]
+
+        particle_id = self.hit_table.particle_id
+        is_signal = self.hit_table.is_signal
+        self.found_doublets += len(order)
+        self.found_correct_doublets += int(np.count_nonzero(is_signal[self.doublet_first_hits] &
+                                                            is_signal[self.doublet_second_hits] &
+                                                            (particle_id[self.doublet_first_hits] ==
+                                                             particle_id[self.doublet_second_hits])))
 
     def create_triplet_list(self,
-                            segment_manager: LUXESegmentManager) -> None:
-        """Creates the doublets. For LUXE detector model only.
+                            segment_manager: LUXESegmentManager,
+                            use_segment_mapping: bool = True) -> None:
+        """Creates the triplets by joining doublets on their shared hit. The triplets are stored in the segment of their
+        first hit, ordered like a loop over segments, target segments, first doublets and second doublets would create
+        them. For LUXE detector model only.
         :param segment_manager: SegmentManager object with already set segments and mapping
+        :param use_segment_mapping: if True, only triplets whose second hit lies in a target segment of the segment of
+                                    the first hit are created
+        """
+        if self.precomputed_triplets is not None:
+            first_doublets, second_doublets = self.precomputed_triplets
+        else:
+            first_doublets, second_doublets = find_triplets(self.doublet_first_hits,
+                                                            self.doublet_second_hits,
+                                                            self.hit_table.x,
+                                                            self.hit_table.y,
+                                                            self.hit_table.z,
+                                                            self.configuration["triplet"]["max scattering"])
+        hit_segment = segment_manager.hit_segment
+        hit_1 = self.doublet_first_hits[first_doublets]
+        hit_2 = self.doublet_second_hits[first_doublets]
+        hit_3 = self.doublet_second_hits[second_doublets]
+        if use_segment_mapping:
+            allowed = filter_by_segment_mapping(hit_1,
+                                                hit_2,
+                                                hit_segment,
+                                                segment_manager.mapping_indptr,
+                                                segment_manager.mapping_indices)
+            first_doublets, second_doublets = first_doublets[allowed], second_doublets[allowed]
+            hit_1, hit_2, hit_3 = hit_1[allowed], hit_2[allowed], hit_3[allowed]
+
+        order = np.lexsort((second_doublets, first_doublets, hit_segment[hit_2], hit_segment[hit_1]))
+        self.triplet_hit_indices = np.column_stack([hit_1[order], hit_2[order], hit_3[order]])
+
+        all_segments = segment_manager.get_all_segments()
+        segments, group_starts = np.unique(hit_segment[self.triplet_hit_indices[:, 0]], return_index=True)
+        group_ends = np.append(group_starts[1:], len(order))
+        for segment, group_start, group_end in zip(segments.tolist(), group_starts.tolist(), group_ends.tolist()):
+            all_segments[segment].triplet_data = [
+                Triplet(self.detector_hits[i1], self.detector_hits[i2], self.detector_hits[i3])
+                for i1, i2, i3 in self.triplet_hit_indices[group_start:group_end].tolist()]
+
+        particle_id = self.hit_table.particle_id[self.triplet_hit_indices]
+        is_signal = self.hit_table.is_signal[self.triplet_hit_indices]
+        self.found_triplets += len(order)
+        self.found_correct_triplets += int(np.count_nonzero(np.all(is_signal, axis=1) &
+                                                            (particle_id[:, 0] == particle_id[:, 1]) &
+                                                            (particle_id[:, 1] == particle_id[:, 2])))
+
+    def get_triplet_table(self) -> TripletTable:
+        """Returns the created triplets as triplet table, the triplet indices follow the ordering of
+        create_triplet_list.
+
+        :return
+            TripletTable object
         """
-        num_layers = len(segment_manager.segment_storage.keys())
-        for layer in range(num_layers - 2):
-            for segment in segment_manager.segment_storage[layer]:
-                if segment.name not in segment_manager.segment_mapping.keys():
-                    continue
-                next_segments = segment_manager.target_segments(segment.name)  # target segment list
-                for target_segment in next_segments:
-                    for first_doublet in segment.doublet_data:
-                        for second_doublet in target_segment.doublet_data:
-                            if first_doublet.hit_2.hit_id != second_doublet.hit_1.hit_id:  # check if match
-                                continue
-                            if not is_valid_triplet(first_doublet.hit_1,
-                                                    first_doublet.hit_2,
-                                                    second_doublet.hit_2,
-                                                    self.configuration["triplet"]["max scattering"]):
-                                continue
-                            triplet = Triplet(first_doublet.hit_1,
-                                              first_doublet.hit_2,
-                                              second_doublet.hit_2)
-                            self.found_triplets += 1
-                            segment.triplet_data.append(triplet)
-
-                            # filling lists for statistical purposes
-                            if triplet.from_same_particle():
-                                self.found_correct_triplets += 1
+        return TripletTable(self.hit_table, self.triplet_hit_indices)
 
     def create_multiplets(self,
                           segment_manager: LUXESegmentManager) -> None:
@@ -227,9 +318,10 @@ class PatternBuilder:
         print("-----------------------------------\n")
         print("Forming doublets ...\n")
 
-        doublet_list_start = time.process_time()
+        # elapsed time, includes the work of worker processes and threads
+        doublet_list_start = time.perf_counter()
         self.create_doublet_list(segment_manager)
-        doublet_list_end = time.process_time()
+        doublet_list_end = time.perf_counter()
 
         self.doublet_creation_time = hms_string(doublet_list_end - doublet_list_start)
         print(f"Time elapsed for forming doublets: "
@@ -243,9 +335,9 @@ class PatternBuilder:
 
         print("-----------------------------------\n")
         print("Forming triplets ...\n")
-        list_triplet_start = time.process_time()
+        list_triplet_start = time.perf_counter()
         self.create_triplet_list(segment_manager)
-        list_triplet_end = time.process_time()
+        list_triplet_end = time.perf_counter()
         self.triplet_creation_time = hms_string(list_triplet_end - list_triplet_start)
 
         print(f"Time elapsed for forming triplets: "
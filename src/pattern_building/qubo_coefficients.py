@@ -1,11 +1,14 @@
 import numpy as np
 import time
 
-from pattern.triplet import Triplet
-from pattern.doublet import Doublet
+from concurrent.futures import ProcessPoolExecutor
+
+from pattern.triplet_table import TripletTable
 from utility.time_tracking import hms_string
-from math_functions.geometry import angle_based_measure
+from math_functions.geometry import angle_based_measure_array
+from pattern_building.parallel_builder import to_shared_memory, from_shared_memory, release_shared_memory
 from pattern_building.segment_manager import LUXESegmentManager
+from pattern_building.triplet_engine import sharing_triplet_pairs
 
 
 class QuboCoefficients:
@@ -20,8 +23,11 @@ class QuboCoefficients:
         self.configuration = configuration
         self.save_to_folder = save_to_folder
 
-        # storing triplets
-        self.triplet_list = set()
+        # triplets with their coefficients, a triplet is identified by its index in the table
+        self.triplet_table = None
+
+        # triplets compared with the triplets of their own and target segments, only these get a quality
+        self.compared_triplets = None
 
         # Dictionary of quality and conflict functions
         self.match_mode = None
@@ -30,6 +36,13 @@ class QuboCoefficients:
         self.match = None
         self.conflict = None
         self.quality = None
+        # conflicts of triplets using the same hit in the same position are stored as conflict groups, which changes the
+        # QUBO: pairs sharing two hits are penalized twice and pairs of segments which are not compared are penalized
+        self.implicit_conflicts = False
+        # number of processes computing the interactions, one process if not set
+        self.num_workers = None
+        # y and z of the last hit of pairs continued by one hit are replaced by its x, like in earlier versions
+        self.legacy_match = False
         self.parameter_setting()
 
     def parameter_setting(self) -> None:
@@ -38,114 +51,202 @@ class QuboCoefficients:
         self.conflict = self.configuration["qubo parameters"]["b_ij conflict"]
         b_ij_match = self.configuration["qubo parameters"]["b_ij match"]
         a_i_quality = self.configuration["qubo parameters"]["a_i"]
+        self.implicit_conflicts = self.configuration["qubo parameters"].get("implicit conflicts", False)
+        self.num_workers = self.configuration["qubo parameters"].get("num workers")
+        self.legacy_match = self.configuration["qubo parameters"].get("legacy b_ij match", False)
 
         if b_ij_match == 'default':
-            self.match = angle_based_measure
+            self.match = angle_based_measure_array
             self.match_mode = 'default'
         else:
             self.match = b_ij_match
             self.match_mode = 'constant'
 
         if a_i_quality == 'default':
-            self.quality = angle_based_measure
+            self.quality = angle_based_measure_array
             self.quality_mode = 'default'
         else:
             self.quality = a_i_quality
             self.quality_mode = 'constant'
 
     def set_triplet_coefficients(self,
-                                 segment_manager: LUXESegmentManager) -> None:
+                                 segment_manager: LUXESegmentManager,
+                                 triplet_table: TripletTable) -> None:
         """Sets the triplet coefficients according to the configuration files. If a (re-)normalization was
         set it is also applied. If the process is successful a message and the target folder location containing the
         triplet list is displayed.
         :param segment_manager: segment manager object
+        :param triplet_table: triplets of the pattern builder, triplets are identified by their index in the table
         """
-        set_triplet_coefficients_start = time.process_time()
+        # elapsed time, includes the work of the worker processes
+        set_triplet_coefficients_start = time.perf_counter()
 
-        num_layers = len(segment_manager.segment_storage.keys())
+        self.triplet_table = triplet_table
+        first_triplets, second_triplets = self.interaction_pairs(segment_manager)
+
+        compared = np.flatnonzero(self.compared_triplets)
+        if self.quality_mode == 'constant':
+            triplet_table.quality[compared] = self.quality
+        elif self.quality_mode == "default":
+            x, y, z = triplet_table.coordinates()
+            triplet_table.quality[compared] = self.quality(x[compared], y[compared], z[compared])
 
-        for layer in range(num_layers - 2):
-            for segment in segment_manager.segment_storage[layer]:
-                if segment.name not in segment_manager.segment_mapping.keys():
-                    continue
-                next_segments = segment_manager.target_segments(segment.name)  # target segments
-                for t1 in segment.triplet_data:
-                    if self.quality_mode == 'constant':
-                        t1.quality = self.quality
-                    elif self.quality_mode == "default":
-                        t1.quality = angle_based_measure([[t1.hit_1.x, t1.hit_2.x, t1.hit_3.x],
-                                                          [t1.hit_1.y, t1.hit_2.y, t1.hit_3.y],
-                                                          [t1.hit_1.z, t1.hit_2.z, t1.hit_3.z]])
-
-                    for target_segment in next_segments + [segment]:   # checking all combinations with other triplets
-                        for t2 in target_segment.triplet_data:
-                            interaction_value = self.triplet_interaction(t1, t2)
-                            # Only interactions != 0 are treated
-                            if interaction_value == 0:
-                                continue
-                            t1.interactions.update({t2.triplet_id: interaction_value})
-                            t2.interactions.update({t1.triplet_id: interaction_value})
-
-        # filling list structure
-        for layer in range(num_layers - 2):
-            for segment in segment_manager.segment_storage[layer]:
-                for triplet in segment.triplet_data:
-                    self.triplet_list.add(triplet)
-
-        set_triplet_coefficients_end = time.process_time()
+        if self.num_workers is not None and self.num_workers > 1:
+            triplet_table.set_interactions(*self.interactions_parallel(segment_manager, first_triplets, second_triplets))
+        else:
+            hit_table = triplet_table.hit_table
+            triplet_table.set_interactions(*coo_interactions(first_triplets,
+                                                             second_triplets,
+                                                             triplet_table.hit_indices,
+                                                             hit_table.x,
+                                                             hit_table.y,
+                                                             hit_table.z,
+                                                             self.conflict,
+                                                             self.match_mode,
+                                                             self.match,
+                                                             self.implicit_conflicts,
+                                                             self.legacy_match))
+        if self.implicit_conflicts:
+            triplet_table.conflict_penalty = float(self.conflict)
+
+        set_triplet_coefficients_end = time.perf_counter()
         apply_coefficients_time = hms_string(set_triplet_coefficients_end - set_triplet_coefficients_start)
-        self.triplet_list = list(self.triplet_list)
 
         print(f"Time elapsed for setting triplet coefficients: "
               f"{apply_coefficients_time}\n")
 
+    def interaction_pairs(self,
+                          segment_manager: LUXESegmentManager) -> tuple[np.ndarray, np.ndarray]:
+        """Finds the triplet pairs whose interaction is set. Only triplets sharing a hit can interact, so the pairs are
+        taken from the hit to triplet incidence of the triplet table, each unordered pair once. Like a comparison of
+        each triplet with the triplets of its own and of its target segments, a pair is only kept if the first hits of
+        both triplets lie in the same segment or one segment is a target of the other. The pair is oriented as
+        triplet_interaction is evaluated last by this comparison, i.e. from source to target segment and from the
+        later to the earlier triplet inside a segment. Sets the compared_triplets field.
+        :param segment_manager: segment manager object
+
+        :return
+            (first triplet, second triplet) for triplet_interaction
+        """
+        all_segments = segment_manager.get_all_segments()
+        num_segments = len(all_segments)
+        num_layers = len(segment_manager.segment_storage.keys())
+        num_targets = np.diff(segment_manager.mapping_indptr)
+        # segments of the source layers with target segments
+        compared_segments = (np.arange(num_segments) < segment_manager.segment_offsets[num_layers - 2]) & \
+                            (num_targets > 0)
+        mapping_keys = np.repeat(np.arange(num_segments), num_targets) * num_segments + segment_manager.mapping_indices
+
+        triplet_segment = segment_manager.hit_segment[self.triplet_table.hit_indices[:, 0]]
+        self.compared_triplets = compared_segments[triplet_segment]
+
+        first, second = sharing_triplet_pairs(*self.triplet_table.triplets_by_hit(), len(self.triplet_table))
+        first_segment = triplet_segment[first]
+        second_segment = triplet_segment[second]
+        same_segment = (first_segment == second_segment) & compared_segments[first_segment]
+        forward = np.isin(first_segment * num_segments + second_segment, mapping_keys) & \
+            compared_segments[first_segment]
+        backward = np.isin(second_segment * num_segments + first_segment, mapping_keys) & \
+            compared_segments[second_segment]
+
+        keep = same_segment | forward | backward
+        swap = (same_segment | backward)[keep]
+        first, second = first[keep], second[keep]
+        return np.where(swap, second, first), np.where(swap, first, second)
+
+    def interactions_parallel(self,
+                              segment_manager: LUXESegmentManager,
+                              first_triplets: np.ndarray,
+                              second_triplets: np.ndarray,
+                              block_size: int = 65536) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Computes the interactions with a process pool. The pairs are sorted by the source segment of their first
+        triplet and split into blocks of whole source segments with about block_size pairs. The hits, triplets and pairs
+        are placed in shared memory and the results of the blocks are concatenated in the order of the source
+        segments, so the interactions are identical to a single process for any number of workers.
+        :param segment_manager: segment manager object
+        :param first_triplets: indices of the first triplets of the pairs
+        :param second_triplets: indices of the second triplets of the pairs
+        :param block_size: number of pairs of a work unit
+
+        :return
+            (first triplet, second triplet, value) of the interactions
+        """
+        hit_indices = self.triplet_table.hit_indices
+        source_segment = segment_manager.hit_segment[hit_indices[first_triplets, 0]]
+        by_segment = np.argsort(source_segment, kind='stable')
+        source_segment = source_segment[by_segment]
+        segment_starts = np.searchsorted(source_segment, np.arange(len(segment_manager.get_all_segments()) + 1))
+        # block ends are moved to the start of the next source segment
+        block_ends = segment_starts[np.searchsorted(segment_starts, np.arange(block_size, len(source_segment),
+                                                                               block_size))]
+        bounds = np.unique(np.concatenate([[0], block_ends, [len(source_segment)]])).tolist()
+
+        hit_table = self.triplet_table.hit_table
+        blocks, arrays = to_shared_memory({'x': np.asarray(hit_table.x, dtype=np.float64),
+                                           'y': np.asarray(hit_table.y, dtype=np.float64),
+                                           'z': np.asarray(hit_table.z, dtype=np.float64),
+                                           'hit indices': hit_indices,
+                                           'first triplets': first_triplets[by_segment],
+                                           'second triplets': second_triplets[by_segment]})
+        try:
+            with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+                futures = [executor.submit(interaction_work_unit,
+                                           arrays,
+                                           pair_start,
+                                           pair_end,
+                                           self.conflict,
+                                           self.match_mode,
+                                           self.match,
+                                           self.implicit_conflicts,
+                                           self.legacy_match)
+                           for pair_start, pair_end in zip(bounds[:-1], bounds[1:])]
+                interactions = [future.result() for future in futures]
+        finally:
+            release_shared_memory(blocks, unlink=True)
+
+        first = np.concatenate([np.empty(0, dtype=first_triplets.dtype)] + [block[0] for block in interactions])
+        second = np.concatenate([np.empty(0, dtype=second_triplets.dtype)] + [block[1] for block in interactions])
+        values = np.concatenate([np.empty(0)] + [block[2] for block in interactions])
+        return first, second, values
+
     def coefficient_rescaling(self) -> None:
         """Rescaling parameters according to the config file.
         """
         print("Starting rescaling of a_i and b_ij parameters...")
         # additional processing of qubo parameter
 
-        rescale_triplet_coefficients_start = time.process_time()
+        rescale_triplet_coefficients_start = time.perf_counter()
+        quality = self.triplet_table.quality
+        interactions = self.triplet_table.interactions.data
 
         if self.configuration["scale range parameters"]["z_scores"]:
-            mu = np.mean([t.quality for t in self.triplet_list])
-            sigma = np.std([t.quality for t in self.triplet_list])
-            for triplet in self.triplet_list:
-                triplet.quality = (triplet.quality - mu) / sigma
+            quality[:] = (quality - np.mean(quality)) / np.std(quality)
 
         # Scaling in the following way to [a, b] : X' = a + (X - X_min) (b - a) / (X_max - X_min)
         if self.configuration["scale range parameters"]["quality"] is not None:
 
             a = self.configuration["scale range parameters"]["quality"][0]
             b = self.configuration["scale range parameters"]["quality"][1]
-            min_quality = min([t.quality for t in self.triplet_list])
-            max_quality = max([t.quality for t in self.triplet_list])
-            for triplet in self.triplet_list:
-                triplet.quality = a + (triplet.quality - min_quality) * (b - a) / (max_quality - min_quality)
+            min_quality = np.min(quality)
+            max_quality = np.max(quality)
+            quality[:] = a + (quality - min_quality) * (b - a) / (max_quality - min_quality)
 
         # scaling connectivity
         if self.configuration["scale range parameters"]["interaction"] is not None:
             conflict_term = float(self.configuration["qubo parameters"]["b_ij conflict"])
             # excluding conflict terms
-            connectivity_values = [interaction
-                                   for t in self.triplet_list
-                                   for interaction in t.interactions.values() if interaction != conflict_term]
-            min_connectivity = min(connectivity_values)
-            max_connectivity = max(connectivity_values)
+            connectivity = interactions != conflict_term
+            min_connectivity = np.min(interactions[connectivity])
+            max_connectivity = np.max(interactions[connectivity])
             range_connectivity = max_connectivity - min_connectivity
 
             a = self.configuration["scale range parameters"]["interaction"][0]
             b = self.configuration["scale range parameters"]["interaction"][1]
 
-            for triplet in self.triplet_list:
-                for key in triplet.interactions.keys():
-                    if triplet.interactions[key] == conflict_term:
-                        continue
-                    else:
-                        triplet.interactions[key] = a + (triplet.interactions[key] - min_connectivity) * (b - a) / \
-                                                    range_connectivity
+            interactions[connectivity] = a + (interactions[connectivity] - min_connectivity) * (b - a) / \
+                range_connectivity
 
-        rescale_triplet_coefficients_end = time.process_time()
+        rescale_triplet_coefficients_end = time.perf_counter()
         rescale_coefficients_time = hms_string(rescale_triplet_coefficients_end - rescale_triplet_coefficients_start)
 
         print(f"Time elapsed for rescaling triplet coefficients: "
@@ -153,47 +254,162 @@ class QuboCoefficients:
 
         print("Finished setting and rescaling of parameters.\n")
         print(f"Save triplet list...\n")
-        np.save(f"{self.save_to_folder}/triplet_list", self.triplet_list)
-
-    def triplet_interaction(self,
-                            t1: Triplet,
-                            t2: Triplet) -> float:
-        """Compares two triplets and  how they match.
-        :param t1: first triplet
-        :param t2: second triplet
+        self.triplet_table.save(f"{self.save_to_folder}/triplet_table.npz")
+        # Triplet objects with string ids for the analysis scripts
+        np.save(f"{self.save_to_folder}/triplet_list", self.triplet_table.to_triplets())
+
+    def triplet_interactions(self,
+                             first_triplets: np.ndarray,
+                             second_triplets: np.ndarray) -> np.ndarray:
+        """Compares pairs of triplets and how they match, all pairs at once. Matching pairs continue each other by one
+        or two hits, all other pairs sharing hits are in conflict.
+        :param first_triplets: indices of the first triplets
+        :param second_triplets: indices of the second triplets
         :return
-            value based on connectivity/conflict and chosen set of parameters
+            value of each pair based on connectivity/conflict and chosen set of parameters
         """
-        # checking number of shared hits
-
-        t1_set = {t1.hit_1.hit_id,
-                  t1.hit_2.hit_id,
-                  t1.hit_3.hit_id}
-        t2_set = {t2.hit_1.hit_id,
-                  t2.hit_2.hit_id,
-                  t2.hit_3.hit_id}
-        intersection = len(t1_set.intersection(t2_set))
-
-        # same and not interacting triplets get a zero as a coefficient
-        if intersection in [0, 3]:
-            return 0
-
-        if intersection == 1:
-            if t1.hit_3.hit_id == t2.hit_1.hit_id:
-                return - 1 + self.match([[t1.hit_1.x, t1.hit_2.x, t1.hit_3.x, t2.hit_2.x, t2.hit_3.x],
-                                         [t1.hit_1.y, t1.hit_2.y, t1.hit_3.y, t2.hit_2.y, t2.hit_3.x],
-                                         [t1.hit_1.z, t1.hit_2.z, t1.hit_3.z, t2.hit_2.z, t2.hit_3.x]])
-            return self.conflict
-
-        if intersection == 2:
-            # triplets on same layer always have a conflict
-            if t1.hit_2.hit_id == t2.hit_1.hit_id and t1.hit_3.hit_id == t2.hit_2.hit_id:
-                if self.match_mode == 'constant':
-                    return self.match
-                else:
-                    return - 1 + self.match([[t1.hit_1.x, t1.hit_2.x, t1.hit_3.x, t2.hit_3.x],
-                                             [t1.hit_1.y, t1.hit_2.y, t1.hit_3.y, t2.hit_3.y],
-                                             [t1.hit_1.z, t1.hit_2.z, t1.hit_3.z, t2.hit_3.z]])
-
-            else:
-                return self.conflict
+        hit_table = self.triplet_table.hit_table
+        return interaction_values(self.triplet_table.hit_indices[first_triplets],
+                                  self.triplet_table.hit_indices[second_triplets],
+                                  hit_table.x,
+                                  hit_table.y,
+                                  hit_table.z,
+                                  self.conflict,
+                                  self.match_mode,
+                                  self.match,
+                                  self.legacy_match)
+
+
+def interaction_values(t1_hits: np.ndarray,
+                       t2_hits: np.ndarray,
+                       x: np.ndarray,
+                       y: np.ndarray,
+                       z: np.ndarray,
+                       conflict: float,
+                       match_mode: str,
+                       match,
+                       legacy_match: bool = False) -> np.ndarray:
+    """Compares pairs of triplets and how they match, all pairs at once. Matching pairs continue each other by one or
+    two hits, all other pairs sharing hits are in conflict.
+    :param t1_hits: (N, 3) hit indices of the first triplets
+    :param t2_hits: (N, 3) hit indices of the second triplets
+    :param x: x of all hits
+    :param y: y of all hits
+    :param z: z of all hits
+    :param conflict: value of conflicting pairs
+    :param match_mode: 'constant' or 'default'
+    :param match: value of matching pairs or function of the hit coordinates of the track candidate
+    :param legacy_match: if True, the y and z of the last hit of pairs continued by one hit are replaced by its x, as
+                         in earlier versions, to reproduce their coefficients
+    :return
+        value of each pair based on connectivity/conflict and chosen set of parameters
+    """
+    # checking number of shared hits, the hits of a triplet are different
+    intersection = np.sum(t1_hits[:, :, np.newaxis] == t2_hits[:, np.newaxis, :], axis=(1, 2))
+
+    # same and not interacting triplets get a zero as a coefficient
+    values = np.zeros(len(t1_hits))
+    values[(intersection == 1) | (intersection == 2)] = conflict
+
+    # track continued by one hit
+    one_hit = np.flatnonzero((intersection == 1) & (t1_hits[:, 2] == t2_hits[:, 0]))
+    if match_mode == 'constant':
+        values[one_hit] = match
+    elif legacy_match:
+        hits = np.column_stack([t1_hits[one_hit], t2_hits[one_hit, 1:]])
+        last_hit_x = x[hits[:, 4:]]
+        values[one_hit] = - 1 + match(x[hits],
+                                      np.column_stack([y[hits[:, :4]], last_hit_x]),
+                                      np.column_stack([z[hits[:, :4]], last_hit_x]))
+    else:
+        hits = np.column_stack([t1_hits[one_hit], t2_hits[one_hit, 1:]])
+        values[one_hit] = - 1 + match(x[hits], y[hits], z[hits])
+
+    # track continued by two hits, triplets on same layer always have a conflict
+    two_hits = np.flatnonzero((intersection == 2) &
+                              (t1_hits[:, 1] == t2_hits[:, 0]) & (t1_hits[:, 2] == t2_hits[:, 1]))
+    if match_mode == 'constant':
+        values[two_hits] = match
+    else:
+        hits = np.column_stack([t1_hits[two_hits], t2_hits[two_hits, 2]])
+        values[two_hits] = - 1 + match(x[hits], y[hits], z[hits])
+
+    return values
+
+
+def coo_interactions(first_triplets: np.ndarray,
+                     second_triplets: np.ndarray,
+                     hit_indices: np.ndarray,
+                     x: np.ndarray,
+                     y: np.ndarray,
+                     z: np.ndarray,
+                     conflict: float,
+                     match_mode: str,
+                     match,
+                     implicit_conflicts: bool,
+                     legacy_match: bool = False) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Computes the stored interactions of pairs of triplets. Only interactions != 0 are kept, with implicit conflicts
+    also no conflicts of triplets sharing a hit in the same position.
+    :param first_triplets: indices of the first triplets
+    :param second_triplets: indices of the second triplets
+    :param hit_indices: (N, 3) hit indices of all triplets
+    :param x: x of all hits
+    :param y: y of all hits
+    :param z: z of all hits
+    :param conflict: value of conflicting pairs
+    :param match_mode: 'constant' or 'default'
+    :param match: value of matching pairs or function of the hit coordinates of the track candidate
+    :param implicit_conflicts: True if the conflicts of triplets using the same hit in the same position are stored as
+                               conflict groups
+    :param legacy_match: if True, the matching pairs continued by one hit get the values of earlier versions
+    :return
+        (first triplet, second triplet, value) of the interactions
+    """
+    t1_hits = hit_indices[first_triplets]
+    t2_hits = hit_indices[second_triplets]
+    values = interaction_values(t1_hits, t2_hits, x, y, z, conflict, match_mode, match, legacy_match)
+    keep = values != 0
+    if implicit_conflicts:
+        # matching triplets never share a hit in the same position, these pairs are covered by the conflict groups
+        keep &= ~np.any(t1_hits == t2_hits, axis=1)
+    return first_triplets[keep], second_triplets[keep], values[keep]
+
+
+def interaction_work_unit(arrays: dict[str, tuple],
+                          pair_start: int,
+                          pair_end: int,
+                          conflict: float,
+                          match_mode: str,
+                          match,
+                          implicit_conflicts: bool,
+                          legacy_match: bool) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Computes the interactions of a block of triplet pairs. Executed in the worker processes.
+    :param arrays: shared memory description of the hit arrays 'x', 'y', 'z', the triplet array 'hit indices' and
+                   the pair arrays 'first triplets' and 'second triplets'
+    :param pair_start: first pair of the block
+    :param pair_end: end of the block of pairs
+    :param conflict: value of conflicting pairs
+    :param match_mode: 'constant' or 'default'
+    :param match: value of matching pairs or function of the hit coordinates of the track candidate
+    :param implicit_conflicts: True if the conflicts of triplets using the same hit in the same position are stored as
+                               conflict groups
+    :param legacy_match: if True, the matching pairs continued by one hit get the values of earlier versions
+    :return
+        (first triplet, second triplet, value) of the interactions of the block
+    """
+    blocks, shared = from_shared_memory(arrays)
+    try:
+        return coo_interactions(shared['first triplets'][pair_start:pair_end],
+                                shared['second triplets'][pair_start:pair_end],
+                                shared['hit indices'],
+                                shared['x'],
+                                shared['y'],
+                                shared['z'],
+                                conflict,
+                                match_mode,
+                                match,
+                                implicit_conflicts,
+                                legacy_match)
+    finally:
+        del shared
+        release_shared_memory(blocks)
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class DetectorSegment:
     """Class for handling parts (segments) of the detector.
     """
@@ -32,6 +35,9 @@ class DetectorSegment:
         # stored info from .csv file
         self.data = []
 
+        # indices of the stored hits in the hit table, same ordering as data
+        self.hit_indices = np.empty(0, dtype=np.int64)
+
         # doublet list, first hit of the doublet is considered to be inside the segment
         self.doublet_data = []
 
@@ -1,8 +1,14 @@
-import csv
+import os
+
+import numpy as np
 
 from math_functions.geometry import x0_at_z_ref
+from pattern_building.doublet_engine import count_candidates
 from pattern_building.segment import DetectorSegment
 from pattern.detector_hit import DetectorHit
+from pattern.detector_geometry import Geometry
+from pattern.hit_table import HitTable
+from utility.file_cache import file_fingerprint, load_arrays, save_arrays
 
 
 class LUXESegmentManager:
@@ -10,10 +16,12 @@ class LUXESegmentManager:
     """
     def __init__(self,
                  configuration,
-                 detector_geometry: str):
+                 detector_geometry: str,
+                 use_cache: bool = True):
         """Setting fields according to the configuration and detector geometry.
         :param configuration: pattern building configuration file
         :param detector_geometry: .csv detector layer file geometry file
+        :param use_cache: if False, no geometry or segment mapping cache is read or written next to the geometry file
         """
         self.mapping_criteria = configuration['doublet']
         print(f'Segment mapping based on doublet preselection criteria:\n'
@@ -28,22 +36,22 @@ class LUXESegmentManager:
               f'num bins x: {self.binning[0]}\n'
               f'num bins y: {self.binning[1]}\n')
 
-        # list containing coordinate information about detector layers
-        self.detector_chips = []
+        # adaptive segmentation, segments of the grid holding more hits are split recursively into quadrants
+        self.max_hits_per_segment = configuration['binning'].get('max hits per segment')
+        if self.max_hits_per_segment is not None:
+            print(f'Adaptive segmentation with at most {self.max_hits_per_segment} hits per segment\n')
+
         self.setup = None
 
-        # load detector layers / chips information and add them to the detector layers list
-        with open(detector_geometry, 'r') as file:
-            csv_reader = csv.reader(file)
-            next(csv_reader)    # skip header, csv files should consist of one line
-            for row in csv_reader:
-                self.detector_chips.append([float(r) for r in (row[1:])])
+        # load detector layers / chips information
+        self.geometry_file = detector_geometry
+        self.use_cache = use_cache
+        self.geometry = Geometry.load(detector_geometry, use_cache=use_cache)
 
         print(f"Using geometry file {detector_geometry.split('/')[-1]} for segmentation algorithm")
 
         # here the first layer is the one with the lowest z position, in the usual geometry file, this is different!
-        self.z_position_to_layer = list(set([chip[4] for chip in self.detector_chips]))
-        self.z_position_to_layer.sort()
+        self.z_position_to_layer = self.geometry.layer_z.tolist()
 
         # check setup
         if len(self.z_position_to_layer) == 4:
@@ -69,18 +77,37 @@ class LUXESegmentManager:
         #  ...,                                 , <segment_xm_yn>]
         self.layer_ranges = {}
 
+        # segment edges in x and y of each layer, computed like the segment boundaries
+        # <layer> (key): [<x_edges>, <y_edges>] (value)
+        self.segment_edges = {}
+
+        # maximum distance of a hit in z to the z position of its layer, matching the segment thickness
+        self.z_tolerance = 0.1e-4
+
+        # segment mapping as adjacency structure (CSR) between global segment indices, segments are numbered layer by
+        # layer in the order of the segment storage, the targets of segment i are
+        # mapping_indices[mapping_indptr[i]:mapping_indptr[i + 1]]
+        self.segment_offsets = None
+        self.mapping_indptr = None
+        self.mapping_indices = None
+
+        # global segment index of each hit of the current event, -1 if outside all segments
+        self.hit_segment = None
+
+        # fixed grid segments and their mapping, restored for every event in adaptive segmentation mode
+        self.grid_segment_storage = {}
+        self.grid_segment_mapping = None
+
+        # maximum number of quadrant splits of a grid segment in adaptive segmentation mode
+        self.max_split_depth = 10
+
     def create_LUXE_segments(self) -> None:
         """Create segments according to their x, y and z coordinates. The name of the segments gives
         information about their position and layer.
         """
-        for layer_number, stave in enumerate(self.z_position_to_layer):
-            x_vals = [chip[0] for chip in self.detector_chips if chip[4] == stave] + \
-                     [chip[1] for chip in self.detector_chips if chip[4] == stave]
-            y_vals = [chip[2] for chip in self.detector_chips if chip[4] == stave] + \
-                     [chip[3] for chip in self.detector_chips if chip[4] == stave]
-
+        for layer_number in range(self.geometry.num_layers()):
             # extract spatial covering in x,y of the chips in the detector
-            min_x, max_x, min_y, max_y = min(x_vals), max(x_vals), min(y_vals), max(y_vals)
+            min_x, max_x, min_y, max_y = self.geometry.layer_ranges(layer_number)
             self.layer_ranges.update({layer_number: [min_x, max_x, min_y, max_y]})
 
             # creating dictionary key for each layer, value is a list
@@ -88,6 +115,9 @@ class LUXESegmentManager:
                 self.segment_storage.update({layer_number: []})
             segment_size_x = (max_x - min_x) / int(self.binning[0])
             segment_size_y = (max_y - min_y) / int(self.binning[1])
+            self.segment_edges.update({layer_number: [
+                np.array([min_x + j * segment_size_x for j in range(int(self.binning[0]) + 1)]),
+                np.array([min_y + k * segment_size_y for k in range(int(self.binning[1]) + 1)])]})
 
             # segment creation
             for j in range(int(self.binning[0])):
@@ -105,33 +135,170 @@ class LUXESegmentManager:
 
                     self.segment_storage[layer_number].append(new_segment)
 
-    def segment_mapping_LUXE(self) -> None:
+    def reset_segments(self) -> None:
+        """Removes hits, doublets and triplets from all segments, so the segmentation and its mapping can be reused
+        for the next event.
+        """
+        if self.max_hits_per_segment is not None and self.grid_segment_mapping is not None:
+            self.segment_storage = {layer: list(segments) for layer, segments in self.grid_segment_storage.items()}
+            self.set_segment_mapping(self.grid_segment_mapping)
+
+        for segments in self.segment_storage.values():
+            for segment in segments:
+                segment.data = []
+                segment.hit_indices = np.empty(0, dtype=np.int64)
+                segment.doublet_data = []
+                segment.triplet_data = []
+
+    def segment_mapping_LUXE(self,
+                             use_cache: bool | None = None) -> None:
         """Maps the segments according to the doublet pattern_building criteria. That means, that if there are hits
         inside the area, defined by the segment, that should be considered for creating doublets, a connection to the
-        target  segment is stored inside the segment mapping attribute.
+        target  segment is stored inside the segment mapping attribute. The mapping is stored on disk next to the
+        geometry file, keyed by geometry file, binning and doublet criteria, and reused if these are unchanged.
+        :param use_cache: if False, the mapping is computed and no cache is read or written, default is the setting
+                          of the constructor
         """
+        use_cache = self.use_cache if use_cache is None else use_cache
+        all_segments = self.get_all_segments()
+
+        cache_folder = f'{self.geometry_file}.mapping_cache'
+        fingerprint = file_fingerprint(self.geometry_file,
+                                       self.binning,
+                                       [self.mapping_criteria[key] for key in ['dx/x0', 'dx/x0 eps', 'dy/x0',
+                                                                               'dy/x0 eps']])
+        mapping = None
+        if use_cache:
+            mapping = load_arrays(os.path.join(cache_folder, fingerprint), fingerprint, mmap_mode=None)
+        if mapping is not None:
+            print(f"Using cached segment mapping from {cache_folder.split('/')[-1]}")
+        else:
+            mapping = self.compute_segment_mapping(all_segments)
+            if use_cache:
+                os.makedirs(cache_folder, exist_ok=True)
+                save_arrays(os.path.join(cache_folder, fingerprint), fingerprint, mapping)
+
+        self.set_segment_mapping(mapping)
+        self.grid_segment_storage = {layer: list(segments) for layer, segments in self.segment_storage.items()}
+        self.grid_segment_mapping = mapping
+
+    def get_all_segments(self) -> list[DetectorSegment]:
+        """Returns all segments ordered by their global index, layer by layer.
+
+        :return
+            list of segments
+        """
+        self.segment_offsets = np.cumsum([0] + [len(self.segment_storage[layer])
+                                                for layer in range(len(self.segment_storage))])
+        return [segment for layer in range(len(self.segment_storage)) for segment in self.segment_storage[layer]]
+
+    def set_segment_mapping(self,
+                            mapping: dict[str, np.ndarray]) -> None:
+        """Sets the CSR structure of the mapping and the derived segment mapping dictionary.
+        :param mapping: {'indptr': <array>, 'indices': <array>}
+        """
+        all_segments = self.get_all_segments()
+        self.mapping_indptr = mapping['indptr']
+        self.mapping_indices = mapping['indices']
+        self.segment_mapping = {}
+        for source, segment in enumerate(all_segments):
+            targets = self.mapping_indices[self.mapping_indptr[source]:self.mapping_indptr[source + 1]]
+            if len(targets) > 0:
+                self.segment_mapping.update({segment.name: [all_segments[target] for target in targets.tolist()]})
+
+    def compute_segment_mapping(self,
+                                all_segments: list[DetectorSegment]) -> dict[str, np.ndarray]:
+        """Computes the segment mapping with the criteria of is_compatible_with_target_LUXE_segment, broadcast over
+        all source segments of a layer and all segments of their target layers.
+        :param all_segments: segments ordered by their global index
+
+        :return
+            {'indptr': <array>, 'indices': <array>}, CSR structure of the mapping
+        """
+        x_start = np.array([segment.x_start for segment in all_segments])
+        x_end = np.array([segment.x_end for segment in all_segments])
+        y_start = np.array([segment.y_start for segment in all_segments])
+        y_end = np.array([segment.y_end for segment in all_segments])
+        z_start = np.array([segment.z_start for segment in all_segments])
+        z_ref = self.z_position_to_layer[0]
+
+        num_targets = np.zeros(len(all_segments), dtype=np.int64)
+        indices = []
         for index, z_position in enumerate(self.z_position_to_layer):
             print(f'Finding target segments of segments from layer {index}')
             if index > len(self.z_position_to_layer) - 2:
                 continue
-            for segment in self.segment_storage[index]:
-                target_list = []
-                if self.setup == "full":
-                    if index == len(self.z_position_to_layer) - 2:
-                        target_list = self.segment_storage[index + 1]
-                    else:
-                        target_list = self.segment_storage[index + 1] + self.segment_storage[index + 2]
-
-                if self.setup == "simplified":
-                    target_list = self.segment_storage[index + 1]
-
-                for target_segment in target_list:
-                    check_compatibility = self.is_compatible_with_target_LUXE_segment(segment, target_segment)
-                    if check_compatibility:
-                        if segment.name in self.segment_mapping.keys():
-                            self.segment_mapping[segment.name].append(target_segment)
-                        else:
-                            self.segment_mapping.update({segment.name: [target_segment]})
+            if self.setup == "full" and index < len(self.z_position_to_layer) - 2:
+                target_layers = [index + 1, index + 2]
+            else:
+                target_layers = [index + 1]
+
+            source = np.arange(self.segment_offsets[index], self.segment_offsets[index + 1])[:, np.newaxis]
+            target = np.arange(self.segment_offsets[target_layers[0]],
+                               self.segment_offsets[target_layers[-1] + 1])[np.newaxis, :]
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                compatible = self.is_compatible_with_target_segments(x_start[source], x_end[source],
+                                                                     y_start[source], y_end[source],
+                                                                     z_start[source],
+                                                                     x_start[target], x_end[target],
+                                                                     y_start[target], y_end[target],
+                                                                     z_start[target],
+                                                                     z_ref)
+            _, target_index = np.nonzero(compatible)
+            num_targets[source[:, 0]] = np.count_nonzero(compatible, axis=1)
+            indices.append(target[0, target_index])
+
+        return {'indptr': np.concatenate([[0], np.cumsum(num_targets)]).astype(np.int64),
+                'indices': np.concatenate(indices).astype(np.int32) if len(indices) > 0
+                else np.empty(0, dtype=np.int32)}
+
+    def is_compatible_with_target_segments(self,
+                                           source_x_start: np.ndarray,
+                                           source_x_end: np.ndarray,
+                                           source_y_start: np.ndarray,
+                                           source_y_end: np.ndarray,
+                                           source_z_start: np.ndarray,
+                                           target_x_start: np.ndarray,
+                                           target_x_end: np.ndarray,
+                                           target_y_start: np.ndarray,
+                                           target_y_end: np.ndarray,
+                                           target_z_start: np.ndarray,
+                                           z_ref: float) -> np.ndarray:
+        """Array version of is_compatible_with_target_LUXE_segment, evaluated with the same operations for
+        broadcastable arrays of source and target segment bounds.
+
+        :return:
+            boolean array, True if compatible
+        """
+        # exclude heavy scattering in x-direction
+        compatible = target_x_end >= source_x_start
+
+        same_y = (source_y_start == target_y_start) & (source_y_end == target_y_end)
+        min_dy = np.where(same_y, 0.0, np.where(source_y_start > target_y_end,
+                                                source_y_start - target_y_end,
+                                                target_y_start - source_y_end))
+        dz = target_z_start - source_z_start
+
+        # max x_0 on reference layer
+        x0_max = target_x_start - (target_x_start - source_x_end) * np.abs(target_z_start - z_ref) / dz
+
+        #  exclude heavy scattering in y-direction
+        compatible &= ~(min_dy / x0_max / dz > self.mapping_criteria["dy/x0 eps"])
+
+        # min x_0 on reference segment, only points on existing detector parts make sense, strictly positive value
+        x0_min = target_x_end - (target_x_end - source_x_start) * np.abs(target_z_start - z_ref) / dz
+
+        max_dx = target_x_end - source_x_start
+        min_dx = np.maximum(target_x_start - source_x_end, 0)
+
+        max_dx_x0 = np.abs(max_dx / x0_min / dz)
+        min_dx_x0 = np.abs(min_dx / x0_max / dz)
+
+        compatible &= ~(min_dx_x0 > self.mapping_criteria["dx/x0"] + self.mapping_criteria["dx/x0 eps"])
+        compatible &= ~(max_dx_x0 < self.mapping_criteria["dx/x0"] - self.mapping_criteria["dx/x0 eps"])
+
+        return compatible
 
     @staticmethod
     def get_min_dy_of_two_segments(source_y: list[float],
@@ -207,16 +374,202 @@ class LUXESegmentManager:
         """
         return self.segment_mapping[name]
 
+    def get_segment_indices(self,
+                            x: np.ndarray,
+                            y: np.ndarray,
+                            z: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Calculates the segments of hits arithmetically from the segment edges. Hits on a boundary between two
+        segments are placed in the segment with the lower index, like a scan over the segments would do.
+        :param x: x positions of the hits [m]
+        :param y: y positions of the hits [m]
+        :param z: z positions of the hits [m]
+
+        :return:
+            (layer, index of segment in segment_storage[layer]), both -1 if a hit is outside all segments
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        layer = self.geometry.layer_at_z(z, tolerance=self.z_tolerance)
+        segment_index = np.full(x.shape, -1, dtype=np.int64)
+        for layer_number, (x_edges, y_edges) in self.segment_edges.items():
+            on_layer = np.flatnonzero(layer == layer_number)
+            if len(on_layer) == 0:
+                continue
+            x_bin = np.maximum(np.searchsorted(x_edges, x[on_layer], side='left') - 1, 0)
+            y_bin = np.maximum(np.searchsorted(y_edges, y[on_layer], side='left') - 1, 0)
+            inside = (x_bin < len(x_edges) - 1) & (x_edges[0] <= x[on_layer]) & \
+                     (y_bin < len(y_edges) - 1) & (y_edges[0] <= y[on_layer])
+            segment_index[on_layer] = np.where(inside, x_bin * (len(y_edges) - 1) + y_bin, -1)
+        return np.where(segment_index >= 0, layer, -1), segment_index
+
+    def fill_segments(self,
+                      hit_table: HitTable,
+                      detector_hits: list[DetectorHit]) -> int:
+        """Places all hits in their segments. The segments are calculated in one vectorized step, the hits of a
+        segment keep the order of the hit table. In adaptive segmentation mode, grid segments with more than
+        max_hits_per_segment hits are split afterwards and the mapping is recomputed for the resulting segments.
+        :param hit_table: hits to place
+        :param detector_hits: DetectorHit objects with the same ordering as the hit table
+
+        :return:
+            number of hits outside all segments
+        """
+        if self.max_hits_per_segment is not None:
+            # splitting always starts from the fixed grid
+            self.reset_segments()
+
+        layer, segment_index = self.get_segment_indices(hit_table.x, hit_table.y, hit_table.z)
+        placed = np.flatnonzero(segment_index >= 0)
+
+        # global segment number, layers are stored one after another
+        layer_offsets = np.cumsum([0] + [len(self.segment_storage[i]) for i in range(len(self.segment_storage))])
+        global_index = layer_offsets[layer[placed]] + segment_index[placed]
+        order = placed[np.argsort(global_index, kind='stable')]
+        segments, group_starts = np.unique(np.sort(global_index, kind='stable'), return_index=True)
+
+        split_segments = {}
+        for segment, group in zip(segments.tolist(), np.split(order, group_starts[1:])):
+            layer_number = int(np.searchsorted(layer_offsets, segment, side='right') - 1)
+            grid_segment = self.segment_storage[layer_number][segment - layer_offsets[layer_number]]
+            grid_segment.data.extend([detector_hits[i] for i in group.tolist()])
+            grid_segment.hit_indices = np.concatenate([grid_segment.hit_indices, group])
+            if self.max_hits_per_segment is not None and len(group) > self.max_hits_per_segment:
+                split_segments.update({grid_segment.name: self.split_segment(grid_segment,
+                                                                             group,
+                                                                             hit_table,
+                                                                             detector_hits,
+                                                                             0)})
+
+        if self.max_hits_per_segment is not None:
+            grid_pairs = self.compared_hit_pairs(hit_table)
+            num_grid_segments = len(self.get_all_segments())
+            for layer_number, layer_segments in self.segment_storage.items():
+                self.segment_storage[layer_number] = [leaf for segment in layer_segments
+                                                      for leaf in split_segments.get(segment.name, [segment])]
+            self.set_segment_mapping(self.compute_segment_mapping(self.get_all_segments()))
+            self.print_segment_pair_report(hit_table, grid_pairs, num_grid_segments)
+
+        self.hit_segment = self.segment_of_hits(len(hit_table))
+
+        return len(hit_table) - len(placed)
+
+    def split_segment(self,
+                      segment: DetectorSegment,
+                      hit_indices: np.ndarray,
+                      hit_table: HitTable,
+                      detector_hits: list[DetectorHit],
+                      depth: int) -> list[DetectorSegment]:
+        """Splits a segment recursively into quadrants until each holds at most max_hits_per_segment hits. Hits on the
+        split lines are placed in the quadrant with lower x or y. Empty quadrants are dropped.
+        :param segment: segment to split
+        :param hit_indices: indices of the hits of the segment in the hit table
+        :param hit_table: hits of the event
+        :param detector_hits: DetectorHit objects with the same ordering as the hit table
+        :param depth: number of splits done so far
+
+        :return
+            segments replacing the split segment, ordered by x first and y second
+        """
+        if len(hit_indices) <= self.max_hits_per_segment or depth == self.max_split_depth:
+            return [segment]
+
+        x_mid = 0.5 * (segment.x_start + segment.x_end)
+        y_mid = 0.5 * (segment.y_start + segment.y_end)
+        lower_x = hit_table.x[hit_indices] <= x_mid
+        lower_y = hit_table.y[hit_indices] <= y_mid
+
+        leaves = []
+        for quadrant, (x_bounds, y_bounds, in_quadrant) in enumerate([
+                ((segment.x_start, x_mid), (segment.y_start, y_mid), lower_x & lower_y),
+                ((segment.x_start, x_mid), (y_mid, segment.y_end), lower_x & ~lower_y),
+                ((x_mid, segment.x_end), (segment.y_start, y_mid), ~lower_x & lower_y),
+                ((x_mid, segment.x_end), (y_mid, segment.y_end), ~lower_x & ~lower_y)]):
+            if not np.any(in_quadrant):
+                continue
+            quadrant_segment = DetectorSegment(f'{segment.name}_Q{quadrant}',
+                                               segment.layer,
+                                               x_bounds[0],
+                                               x_bounds[1],
+                                               y_bounds[0],
+                                               y_bounds[1],
+                                               segment.z_start,
+                                               segment.z_end)
+            quadrant_segment.data = [detector_hits[i] for i in hit_indices[in_quadrant].tolist()]
+            quadrant_segment.hit_indices = hit_indices[in_quadrant]
+            leaves += self.split_segment(quadrant_segment,
+                                         hit_indices[in_quadrant],
+                                         hit_table,
+                                         detector_hits,
+                                         depth + 1)
+        return leaves
+
+    def segment_of_hits(self,
+                        num_hits: int) -> np.ndarray:
+        """Global segment number of each hit, i.e. its position in get_all_segments.
+        :param num_hits: number of hits of the hit table
+
+        :return
+            segment number of each hit, -1 for hits outside all segments
+        """
+        hit_segment = np.full(num_hits, -1, dtype=np.int64)
+        for global_segment, segment in enumerate(self.get_all_segments()):
+            hit_segment[segment.hit_indices] = global_segment
+        return hit_segment
+
+    def compared_hit_pairs(self,
+                           hit_table: HitTable) -> int:
+        """Number of hit pairs the doublet search compares with the current segments and mapping. The search only
+        looks at the hits of the mapped target segments inside the dx/x0 window of a first hit, so this is the summed
+        size of these windows.
+        :param hit_table: hits placed in the segments
+
+        :return
+            number of compared hit pairs
+        """
+        return count_candidates(hit_table.x,
+                                hit_table.z,
+                                self.segment_of_hits(len(hit_table)),
+                                self.mapping_indptr,
+                                self.mapping_indices,
+                                self.z_position_to_layer[0],
+                                self.mapping_criteria)
+
+    def print_segment_pair_report(self,
+                                  hit_table: HitTable,
+                                  grid_pairs: int,
+                                  num_grid_segments: int) -> None:
+        """Prints the number of hit pairs compared by the doublet search with the adaptive segmentation and with the
+        fixed grid.
+        :param hit_table: hits placed in the segments
+        :param grid_pairs: compared hit pairs with the fixed grid
+        :param num_grid_segments: number of segments of the fixed grid
+        """
+        adaptive_pairs = self.compared_hit_pairs(hit_table)
+        print(f'Hit pairs compared by the doublet search with fixed {self.binning[0]}x{self.binning[1]} grid '
+              f'({num_grid_segments} segments): {grid_pairs}')
+        print(f'Hit pairs compared by the doublet search with adaptive segmentation '
+              f'({len(self.get_all_segments())} segments): {adaptive_pairs}')
+        if adaptive_pairs > 0:
+            print(f'Reduction factor: {np.around(grid_pairs / adaptive_pairs, 2)}\n')
+
     def get_segment_at_known_xyz_value(self,
                                        hit: DetectorHit) -> DetectorSegment | None:
         """Finds the correct segment of a hit, given via x,y,z value.
         :param hit: DetectorHit object
 
         :return:
-            index of corresponding segment in segment list
+            corresponding segment or None if the hit is outside all segments
         """
-
-        for segment in self.segment_storage[self.z_position_to_layer.index(hit.z)]:
-            if segment.x_start <= hit.x <= segment.x_end and segment.y_start <= hit.y <= segment.y_end:
-                return segment
+        layer, segment_index = self.get_segment_indices([hit.x], [hit.y], [hit.z])
+        if segment_index[0] < 0:
+            return None
+        if self.max_hits_per_segment is None or self.grid_segment_mapping is None:
+            return self.segment_storage[int(layer[0])][int(segment_index[0])]
+
+        # adaptive segmentation, searching the segments created from the grid segment
+        grid_segment = self.grid_segment_storage[int(layer[0])][int(segment_index[0])]
+        for segment in self.segment_storage[int(layer[0])]:
+            if segment is grid_segment or segment.name.startswith(f'{grid_segment.name}_Q'):
+                if segment.x_start <= hit.x <= segment.x_end and segment.y_start <= hit.y <= segment.y_end:
+                    return segment
         return None
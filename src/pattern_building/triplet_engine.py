@@ -0,0 +1,147 @@
+import numpy as np
+
+from pattern_building.doublet_engine import expand_windows
+
+
+def doublets_by_first_hit(first_hits: np.ndarray,
+                          num_hits: int) -> tuple[np.ndarray, np.ndarray]:
+    """Groups doublets by the index of their first hit (CSR structure).
+    :param first_hits: index of the first hit of each doublet
+    :param num_hits: number of hits in the hit table
+
+    :return
+        (indptr, doublets), the doublets starting at hit i are doublets[indptr[i]:indptr[i + 1]], keeping their order
+    """
+    doublets = np.argsort(first_hits, kind='stable')
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(first_hits, minlength=num_hits))])
+    return indptr, doublets
+
+
+def is_valid_triplet(x1: np.ndarray,
+                     y1: np.ndarray,
+                     z1: np.ndarray,
+                     x2: np.ndarray,
+                     y2: np.ndarray,
+                     z2: np.ndarray,
+                     x3: np.ndarray,
+                     y3: np.ndarray,
+                     z3: np.ndarray,
+                     max_scattering: float) -> np.ndarray:
+    """Array version of math_functions.checks.is_valid_triplet, using the same operations.
+
+    :return
+        boolean array, True if the scattering angle is below max_scattering
+    """
+    xz_12 = np.arctan2(x2 - x1, z2 - z1)
+    xz_23 = np.arctan2(x3 - x2, z3 - z2)
+    yz_12 = np.arctan2(y2 - y1, z2 - z1)
+    yz_23 = np.arctan2(y3 - y2, z3 - z2)
+    return np.sqrt((xz_23 - xz_12) ** 2 + (yz_23 - yz_12) ** 2) < max_scattering
+
+
+def chain_doublets(first_doublets: np.ndarray,
+                   indptr: np.ndarray,
+                   doublets: np.ndarray,
+                   second_hits: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Pairs the given doublets with all doublets starting at their second hit, without any further criterion.
+    :param first_doublets: indices of the doublets to chain
+    :param indptr: CSR index pointer of doublets_by_first_hit
+    :param doublets: CSR doublets of doublets_by_first_hit
+    :param second_hits: index of the second hit of each doublet
+
+    :return
+        (index of first doublet, index of second doublet) of the chained doublets, ordered like first_doublets and
+        then by second doublet
+    """
+    first_doublets, position = expand_windows(first_doublets,
+                                              indptr[second_hits[first_doublets]],
+                                              indptr[second_hits[first_doublets] + 1])
+    return first_doublets, doublets[position]
+
+
+def join_doublets(first_doublets: np.ndarray,
+                  indptr: np.ndarray,
+                  doublets: np.ndarray,
+                  first_hits: np.ndarray,
+                  second_hits: np.ndarray,
+                  x: np.ndarray,
+                  y: np.ndarray,
+                  z: np.ndarray,
+                  max_scattering: float) -> tuple[np.ndarray, np.ndarray]:
+    """Joins the given doublets with the doublets starting at their second hit and checks the scattering criterion.
+    :param first_doublets: indices of the doublets to join
+    :param indptr: CSR index pointer of doublets_by_first_hit
+    :param doublets: CSR doublets of doublets_by_first_hit
+    :param first_hits: index of the first hit of each doublet
+    :param second_hits: index of the second hit of each doublet
+    :param x: x of all hits
+    :param y: y of all hits
+    :param z: z of all hits
+    :param max_scattering: maximum allowed scattering
+
+    :return
+        (index of first doublet, index of second doublet) of the triplets, ordered like first_doublets and then by
+        second doublet
+    """
+    first_doublets, second_doublets = chain_doublets(first_doublets, indptr, doublets, second_hits)
+    hit_1 = first_hits[first_doublets]
+    hit_2 = second_hits[first_doublets]
+    hit_3 = second_hits[second_doublets]
+    valid = is_valid_triplet(x[hit_1], y[hit_1], z[hit_1],
+                             x[hit_2], y[hit_2], z[hit_2],
+                             x[hit_3], y[hit_3], z[hit_3],
+                             max_scattering)
+    return first_doublets[valid], second_doublets[valid]
+
+
+def find_triplets(first_hits: np.ndarray,
+                  second_hits: np.ndarray,
+                  x: np.ndarray,
+                  y: np.ndarray,
+                  z: np.ndarray,
+                  max_scattering: float) -> tuple[np.ndarray, np.ndarray]:
+    """Joins doublets sharing a hit, i.e. the second hit of the first doublet is the first hit of the second doublet.
+    For each doublet only the doublets starting at its second hit are expanded, so the number of candidates equals the
+    number of doublet pairs sharing a hit. The scattering criterion is checked for all candidates at once.
+    :param first_hits: index of the first hit of each doublet
+    :param second_hits: index of the second hit of each doublet
+    :param x: x of all hits
+    :param y: y of all hits
+    :param z: z of all hits
+    :param max_scattering: maximum allowed scattering
+
+    :return
+        (index of first doublet, index of second doublet) of all triplets, ordered by first doublet and then by second
+        doublet
+    """
+    indptr, doublets = doublets_by_first_hit(first_hits, len(x))
+    return join_doublets(np.arange(len(first_hits)),
+                         indptr,
+                         doublets,
+                         first_hits,
+                         second_hits,
+                         x,
+                         y,
+                         z,
+                         max_scattering)
+
+
+def sharing_triplet_pairs(indptr: np.ndarray,
+                          triplets: np.ndarray,
+                          num_triplets: int) -> tuple[np.ndarray, np.ndarray]:
+    """Finds all pairs of triplets sharing at least one hit by walking the hit to triplet incidence, so the work scales
+    with the number of sharing pairs instead of the number of triplet combinations.
+    :param indptr: CSR index pointer of TripletTable.triplets_by_hit
+    :param triplets: CSR triplets of TripletTable.triplets_by_hit, increasing for each hit
+    :param num_triplets: number of triplets
+
+    :return
+        (first triplet, second triplet) of each pair with first < second, ordered by first and second triplet
+    """
+    hit_of_entry = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    first, position = expand_windows(triplets,
+                                     np.arange(1, len(triplets) + 1),
+                                     indptr[hit_of_entry + 1])
+    # triplets sharing two hits are found twice
+    pairs = np.unique(first.astype(np.int64) * num_triplets + triplets[position])
+    return pairs // num_triplets, pairs % num_triplets
@@ -23,21 +23,24 @@ class Ansatz:
                                 skip_final_rotation_layer=self.config["ansatz"]["skip final rotation layer"])
 
     def set_hamiltonian_driven(self,
+                               interactions,
                                triplet_list_slice):
         """Creates entanglements of the ansatz based on the hamiltonian and sets it as the circuit of the ansatz.
         Direct entanglement means if there is a direct connection, a value b_ij which would connect both.
         Currently restricted to "ry" and "cx" gates.
-        :param triplet_list_slice: triplet list slice of the problem
+        :param interactions: symmetric sparse matrix of the quadratic coefficients b_ij
+        :param triplet_list_slice: indices of the triplets of the problem
         """
         qc = QuantumCircuit(self.config["qubo"]["num qubits"])
         # Number of repetitions
         entanglement_map = []
+        connected = interactions[triplet_list_slice][:, triplet_list_slice].toarray() != 0
         for i in range(self.config["ansatz"]["circuit depth"]):
             for j in range(self.config["qubo"]["num qubits"]):
                 qc.ry(Parameter(str(i) + str(j)), j)  # Parametrized ry gates on every qubit
             for k, p1 in enumerate(triplet_list_slice):
                 for m, p2 in enumerate(triplet_list_slice):
-                    if p2.triplet_id in p1.interactions.keys():
+                    if connected[k, m]:
                         if (p1, p2) in entanglement_map or (p2, p1) in entanglement_map:
                             continue
                         else:
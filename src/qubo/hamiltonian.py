@@ -6,28 +6,29 @@ from qiskit.opflow.primitive_ops.pauli_sum_op import PauliSumOp
 
 class Hamiltonian:
     def __init__(self,
+                 quality,
+                 interactions,
                  triplet_slice,
-                 t_mapping,
                  solution_candidate,
                  rescaling=None,
                  only_specified_connections=None):
         """Class for handling the Hamiltonian
-        :param triplet_slice: slice of triplets participating in the SubQUBO
-        :param t_mapping: name of triplets consist of <hit_ID>_<hit_ID>_<hit_ID> and is mapped to its position
-                          inside the triplet list
+        :param quality: linear coefficients a_i of all triplets
+        :param interactions: symmetric sparse matrix of the quadratic coefficients b_ij of all triplets
+        :param triplet_slice: indices of the triplets participating in the SubQUBO
         :param solution_candidate: binary vector representing kept and discarded triplets e.g [0,1,..., 1]
         :param rescaling: "complete"    : (a_i + sum(outer_terms_bij)) / (#outer_terms_bij + 1)
                           "outer terms" :  a_i + (sum(outer_terms_bij) / #outer_terms_bij)
                           "None"        :  a_i + sum(outer_terms_bij)
-        :param only_specified_connections: dictionary of triplet ids which have to be considered for accumulating
+        :param only_specified_connections: collection of triplet indices which have to be considered for accumulating
                                            relations from outside the (sub)qubo
         :param k: some mysterious value, maybe helpful, maybe not
         """
         self.only_specified_connections = only_specified_connections
+        self.quality = quality
+        self.interactions = interactions
         self.triplet_slice = triplet_slice
-        self.t_mapping = t_mapping
         self.solution_candidate = solution_candidate
-        self.triplet_ids = [triplet.triplet_id for triplet in triplet_slice]
         self.rescaling = rescaling
 
     def linear_term(self):
@@ -36,40 +37,26 @@ class Hamiltonian:
         :return
             list of linear terms for the Sub-QUBO
         """
-        linear = np.zeros(len(self.triplet_slice))
-        for i, triplet in enumerate(self.triplet_slice):
-            # self-term
-            linear[i] += self.triplet_slice[i].quality
-            # outer-term
-            lin_out_connection = []
-            lin_out_conflict = []
-            for interaction_key, interaction_value in triplet.interactions.items():
-                if self.only_specified_connections is None:
-                    if interaction_key not in self.triplet_ids:
-                        if self.solution_candidate[self.t_mapping[interaction_key]] == 1:
-                            if interaction_value < 0:
-                                lin_out_connection.append(triplet.interactions[interaction_key])
-                            else:
-                                lin_out_conflict.append(triplet.interactions[interaction_key])
-                else:
-                    if interaction_key not in self.triplet_ids:
-                        if interaction_key not in self.only_specified_connections:
-                            continue
-                        if self.solution_candidate[self.t_mapping[interaction_key]] == 1:
-                            if interaction_value < 0:
-                                lin_out_connection.append(triplet.interactions[interaction_key])
-                            else:
-                                lin_out_conflict.append(triplet.interactions[interaction_key])
+        # outer triplets which are kept, only the specified ones if given
+        outer = np.asarray(self.solution_candidate) == 1
+        outer[self.triplet_slice] = False
+        if self.only_specified_connections is not None:
+            specified = np.zeros(len(outer), dtype=bool)
+            specified[list(self.only_specified_connections)] = True
+            outer &= specified
 
-            if self.rescaling == "complete":
-                linear[i] += (sum(lin_out_connection) + sum(lin_out_conflict))
-                linear[i] /= (len(lin_out_connection) + len(lin_out_conflict) + 1)
-            elif self.rescaling == "outer terms":
-                if lin_out_connection or lin_out_conflict:
-                    linear[i] += (sum(lin_out_connection) + sum(lin_out_conflict)) / \
-                                 (len(lin_out_connection) + len(lin_out_conflict) + 1)
-            else:
-                linear[i] += (sum(lin_out_connection) + sum(lin_out_conflict))
+        # sum and number of the interactions with the outer triplets, one sparse matrix-vector product each, interactions
+        # with value 0 are stored and counted
+        interactions = self.interactions[self.triplet_slice]
+        outer_sum = interactions @ outer.astype(np.float64)
+        interactions.data[:] = 1
+        outer_count = interactions @ outer.astype(np.float64)
+
+        linear = self.quality[self.triplet_slice] + outer_sum
+        if self.rescaling == "complete":
+            linear /= (outer_count + 1)
+        elif self.rescaling == "outer terms":
+            linear = self.quality[self.triplet_slice] + outer_sum / (outer_count + 1)
         return linear
 
     def quadratic_term(self):
@@ -77,12 +64,8 @@ class Hamiltonian:
         :return
             list of quadratic terms for the Sub-QUBO
         """
-        quadratic = np.zeros((len(self.triplet_slice), len(self.triplet_slice)))
-        for i, t1 in enumerate(self.triplet_slice):
-            for j, t2 in enumerate(self.triplet_slice[i:]):
-                if t2.triplet_id in t1.interactions.keys():
-                    quadratic[i, j + i] = t1.interactions[t2.triplet_id]
-        return quadratic
+        interactions = self.interactions[self.triplet_slice][:, self.triplet_slice]
+        return np.triu(interactions.toarray())
 
     def qubo_representation(self):
         """Returns a qubo representation of the hamiltonian for Numpy Eigensolver.
@@ -1,282 +1,223 @@
 import numpy as np
 
 
+def local_fields(triplets,
+                 solution_candidate,
+                 without_conflicts=False):
+    """Computes the local field a_i + sum_j b_ij x_j of all triplets with one sparse matrix-vector product and the
+    counts of the conflict groups. Flipping triplet i changes the energy by the local field if x_i = 0 and by minus the
+    local field if x_i = 1.
+    :param triplets: TripletTable object
+    :param solution_candidate: binary vector representing kept and discarded triplets e.g [0,1,..., 1]
+    :param without_conflicts: if True, interactions with a positive value and conflict groups are not taken into
+                              account
+    :return:
+        local field of each triplet
+    """
+    interactions = triplets.symmetric_interactions()
+    if without_conflicts:
+        interactions.data[interactions.data > 0] = 0
+        return triplets.quality + interactions @ np.asarray(solution_candidate, dtype=np.float64)
+    return triplets.quality + interactions @ np.asarray(solution_candidate, dtype=np.float64) + \
+        triplets.conflict_fields(solution_candidate)
+
+
 def bit_flip_optimisation(triplets,
                           solution_candidate,
-                          t_mapping,
                           triplet_ordering,
                           reverse=True):
 
-    """Looping over a list of triplet objects and a corresponding binary solution vector to compute if the energy
+    """Looping over the triplets and a corresponding binary solution vector to compute if the energy
     value would improve if the binary state of a triplet (keep <-> discard) should be changed. If the energy
     decreases, the triplet state is flipped.
-    :param triplets: list of triplet objects
+    :param triplets: TripletTable object, triplets are identified by their index in the table
     :param solution_candidate: binary vector representing kept and discarded triplets e.g [0,1,..., 1]
-    :param t_mapping: name of triplets consist of <hit_ID>_<hit_ID>_<hit_ID> and is mapped to its position
-                      inside the triplet list
     :param triplet_ordering: order in which the triplets are sorted, e.g by impact, connectivity,...
     :param reverse: False if provided sorting order, else reversed
     """
     if reverse:
         triplet_ordering.reverse()
+    interactions = triplets.symmetric_interactions()
+    # kept triplets of the conflict groups, updated with each flip
+    conflict_counts = triplets.conflict_counts(solution_candidate) if triplets.conflict_penalty else None
+    positions = np.arange(3)
     energy_change_total = 0
-    for i, triplet in enumerate([triplets[index] for index in triplet_ordering]):
-        # energy change if this particular bit is flipped
-        energy_change = 0
-
-        # checking linear term
-        if solution_candidate[triplet_ordering[i]] == 0:
-            energy_change += triplet.quality
+    for index in triplet_ordering:
+        # energy change if this particular bit is flipped, flips before change the interaction term
+        row = slice(interactions.indptr[index], interactions.indptr[index + 1])
+        field = triplets.quality[index] + np.dot(interactions.data[row],
+                                                 solution_candidate[interactions.indices[row]])
+        if conflict_counts is not None:
+            group_counts = conflict_counts[positions, triplets.hit_indices[index]]
+            field += triplets.conflict_penalty * (np.sum(group_counts) - 3 * solution_candidate[index])
+        if solution_candidate[index] == 0:
+            energy_change = field
         else:
-            energy_change -= triplet.quality
-
-        # Checking interactions with other triplets
-        for interaction in triplet.interactions.keys():
-            if solution_candidate[triplet_ordering[i]] == 0 and solution_candidate[t_mapping[interaction]] == 0:
-                pass
-            elif solution_candidate[triplet_ordering[i]] == 0 and solution_candidate[t_mapping[interaction]] == 1:
-                energy_change += triplet.interactions[interaction]
-            elif solution_candidate[triplet_ordering[i]] == 1 and solution_candidate[t_mapping[interaction]] == 0:
-                pass
-            else:
-                energy_change -= triplet.interactions[interaction]
+            energy_change = - field
 
         # flip if overall energy change is negative
         if energy_change < 0:
-            solution_candidate[triplet_ordering[i]] = 1 - solution_candidate[triplet_ordering[i]]
+            solution_candidate[index] = 1 - solution_candidate[index]
             energy_change_total += energy_change
+            if conflict_counts is not None:
+                conflict_counts[positions, triplets.hit_indices[index]] += 1 if solution_candidate[index] == 1 else -1
 
     return solution_candidate, energy_change_total
 
 
-def make_impact_list(triplet_list,
-                     t_mapping,
-                     solution_candidate,
-                     local=False):
+def make_impact_list(triplets,
+                     solution_candidate):
     """Creates an impact list based on how much influence on the energy a bit flip has
-    :param triplet_list: list of triplet objects
-    :param t_mapping: name of triplets consist of <hit_ID>_<hit_ID>_<hit_ID> and is mapped to its position
-                      inside the triplet list
+    :param triplets: TripletTable object
     :param solution_candidate: binary vector representing kept and discarded triplets e.g [0,1,..., 1]
-    :param local: if True, then triplets outside the given triplet subset are not considered
     :return:
         list of indices ordered from lowest to highest impact of triplets in triplet list
     """
-    impact_list_values = []
-    t_indices = []
-    for triplet in triplet_list:
-        t_indices.append(triplet.triplet_id)
-
-    for triplet, t_i in zip(triplet_list, solution_candidate):
-        energy_change = 0
-        if t_i == 0:
-            energy_change += triplet.quality
-        else:
-            energy_change -= triplet.quality
+    return list(np.argsort(np.abs(local_fields(triplets, solution_candidate))))
 
-        for interaction in triplet.interactions.keys():
 
-            if local:
-                if interaction not in t_indices:
-                    continue
-            if t_i == 0 and solution_candidate[t_mapping[interaction]] == 0:
-                pass
-            elif t_i == 0 and solution_candidate[t_mapping[interaction]] == 1:
-                energy_change += triplet.interactions[interaction]
-            elif t_i == 1 and solution_candidate[t_mapping[interaction]] == 0:
-                pass
-            else:
-                energy_change -= triplet.interactions[interaction]
+def connections_map_entries(interactions,
+                            indices,
+                            in_conflict_groups=None):
+    """Collects the connections of triplets for the connection and paired lists.
+    :param interactions: symmetric interaction matrix
+    :param indices: indices of the triplets
+    :param in_conflict_groups: boolean array, True for triplets with implicit conflicts, default is none
+    :return:
+        list of [connection value, triplet index, connected triplet index or None]
+    """
+    indptr = interactions.indptr.tolist()
+    connected = interactions.indices.tolist()
+    values = interactions.data.tolist()
+
+    conflicted = [False] * len(indptr) if in_conflict_groups is None else in_conflict_groups.tolist()
+
+    connections_map = []   # connection_value, triplet_1, triplet_2
+                           # -0.998          , t1       , t2
+                           # -0.993          , t2       , t234
+                           # ...
+    # To not run into value errors and making sure the whole list is filled, one has to take care of certain cases
+    for index in indices:
+        row = slice(indptr[index], indptr[index + 1])
+        # there are connections -> easy
+        for connection, value in zip(connected[row], values[row]):
+            if value < 0:
+                connections_map.append([value, index, connection])
+        # no connection, no conflict, "single triplet"
+        if indptr[index] == indptr[index + 1] and not conflicted[index]:
+            connections_map.append([0, index, None])
+        # no connection, but conflicts (maybe remove them before!?)
+        elif indptr[index] == indptr[index + 1] or min(values[row]) > 0:
+            connections_map.append([1, index, None])
+    return connections_map
+
+
+def order_by_connections(interactions,
+                         connections_map,
+                         triplet_used,
+                         triplet_ordering):
+    """Appends triplets of sorted connections and their connected triplets to an ordering, each triplet once.
+    :param interactions: symmetric interaction matrix
+    :param connections_map: list of [connection value, triplet index, connected triplet index or None], sorted
+    :param triplet_used: set of triplet indices already in the ordering
+    :param triplet_ordering: list of triplet indices, extended in place
+    """
+    indptr = interactions.indptr.tolist()
+    connected = interactions.indices.tolist()
+    values = interactions.data.tolist()
 
-        impact_list_values.append(abs(energy_change))
-    return list(np.argsort(impact_list_values))
+    for entry in connections_map:
+        # check if there are connections, otherwise skip
+        for i in [1, 2]:
+            if entry[i] is None:
+                continue
+            # don't put the same connection two times in the list
+            if entry[i] not in triplet_used:
+                triplet_ordering.append(entry[i])
+                triplet_used.add(entry[i])
+                # add connection, triplet 1 and triplet 2
+                row = slice(indptr[entry[i]], indptr[entry[i] + 1])
+                for connection, value in zip(connected[row], values[row]):
+                    if value < 0:
+                        if connection not in triplet_used:
+                            triplet_used.add(connection)
+                            triplet_ordering.append(connection)
 
 
-def make_connection_list(triplet_list,
-                         t_mapping):
+def make_connection_list(triplets):
     """Creates a preferred connections list and returns a list of indices for the triplets
-    :param triplet_list: list of triplet objects
-    :param t_mapping: triplet mapping
+    :param triplets: TripletTable object
     :return:
         list of indices ordered from  highest connection values to lowest connection values
     """
-
-    layer_map = {}
+    interactions = triplets.symmetric_interactions()
+    in_conflict_groups = triplets.in_conflict_groups()
     triplet_ordering_complete = []
     triplet_used = set()
 
-    for t in triplet_list:
-        if t.hit_1.z in layer_map.keys():
-            layer_map[t.hit_1.z].append(t)
+    # triplets grouped by the z position of their first hit
+    layer_map = {}
+    for index, z in enumerate(triplets.hit_table.z[triplets.hit_indices[:, 0]].tolist()):
+        if z in layer_map.keys():
+            layer_map[z].append(index)
         else:
-            layer_map.update({t.hit_1.z: [t]})
+            layer_map.update({z: [index]})
 
     key_list = list(layer_map.keys())
     key_list.sort()
 
     for key in key_list:
-        sub_t_list = layer_map[key]
-        connections_map = []  # connection_value, triplet_1, triplet_2
-
-        for triplet in sub_t_list:
-            for connection, value in zip(triplet.interactions.keys(), triplet.interactions.values()):
-                if value < 0:
-                    connections_map.append([value, triplet.triplet_id, connection])
-            if len(list(triplet.interactions.values())) == 0:
-                connections_map.append([0, triplet.triplet_id, None])
-            if len(list(triplet.interactions.values())) > 0:
-                if min(list(triplet.interactions.values())) > 0:
-                    connections_map.append([1, triplet.triplet_id, None])
-
+        connections_map = connections_map_entries(interactions, layer_map[key], in_conflict_groups)
         connections_map.sort(key=lambda x: x[0])
-
-        for entry in connections_map:
-            for i in [1, 2]:
-                if entry[i] is None:
-                    continue
-                if entry[i] not in triplet_used:
-                    triplet_ordering_complete.append(t_mapping[entry[i]])
-                    triplet_used.add(entry[i])
-                    for connection, value in zip(triplet_list[t_mapping[entry[i]]].interactions.keys(),
-                                                 triplet_list[t_mapping[entry[i]]].interactions.values()):
-                        if value < 0:
-                            if connection not in triplet_used:
-                                triplet_used.add(connection)
-                                triplet_ordering_complete.append(t_mapping[connection])
+        order_by_connections(interactions, connections_map, triplet_used, triplet_ordering_complete)
     return triplet_ordering_complete
 
 
-def make_connection_list_legacy(triplet_list,
-                                t_mapping):
+def make_connection_list_legacy(triplets):
     """Creates a preferred connections list and returns a list of indices for the triplets
-    :param triplet_list: list of triplet objects
-    :param t_mapping: triplet mapping
+    :param triplets: TripletTable object
     :return:
         list of indices ordered from the highest connection value to the lowest connection value
     """
-    # function to pass to .sorted()
-    def sort_by_connection(connections_map_entry):
-        return connections_map_entry[0]
+    interactions = triplets.symmetric_interactions()
+    connections_map = connections_map_entries(interactions, range(len(triplets)), triplets.in_conflict_groups())
+    connections_map.sort(key=lambda x: x[0])
 
-    connections_map = []   # connection_value, triplet_1, triplet_2
-                           # -0.998          , t1       , t2
-                           # -0.993          , t2       , t234
-                           # ...
-    # To not run into value errors and making sure the whole list is filled, one has to take care of certain cases
-    for triplet in triplet_list:
-        # there are connections -> easy
-        for connection, value in zip(triplet.interactions.keys(), triplet.interactions.values()):
-            if value < 0:
-                connections_map.append([value, triplet.triplet_id, connection])
-        # no connection, no conflict, "single triplet"
-        if len(list(triplet.interactions.values())) == 0:
-            connections_map.append([0, triplet.triplet_id, None])
-        # no connection, but conflicts (maybe remove them before!?)
-        if len(list(triplet.interactions.values())) > 0:
-            if min(list(triplet.interactions.values())) > 0:
-                connections_map.append([1, triplet.triplet_id, None])
-
-    connections_map.sort(key=sort_by_connection)
-
-    # check if something is in a set is faster, also jsut using a string instead of an object
+    # check if something is in a set is faster
     triplet_used = set()
     triplet_ordering = []
-
-    for entry in connections_map:
-        # check if there are connections, otherwise skip
-        for i in [1, 2]:
-            if entry[i] is None:
-                continue
-            # don"t put the same connection two times in the list
-            if entry[i] not in triplet_used:
-                triplet_ordering.append(t_mapping[entry[i]])
-                triplet_used.add(entry[i])
-                # add connection, triplet 1 and triplet 2
-                for connection, value in zip(triplet_list[t_mapping[entry[i]]].interactions.keys(),
-                                             triplet_list[t_mapping[entry[i]]].interactions.values()):
-                    if value < 0:
-                        if connection not in triplet_used:
-                            triplet_used.add(connection)
-                            triplet_ordering.append(t_mapping[connection])
+    order_by_connections(interactions, connections_map, triplet_used, triplet_ordering)
 
     return triplet_ordering
 
 
-def make_paired_list(triplet_list,
-                     t_mapping):
+def make_paired_list(triplets):
     """Creates a preferred connections list and returns a list of indices for the triplets
-    :param triplet_list: list of triplet objects
-    :param t_mapping: triplet mapping
+    :param triplets: TripletTable object
     :return:
         list of connected pairs
     """
-    def sort_by_connection(connections_map_entry):
-        return connections_map_entry[0]
-
-    connections_map = []   # connection_value, triplet_1, triplet_2
-
-    for triplet in triplet_list:
-        for connection, value in zip(triplet.interactions.keys(), triplet.interactions.values()):
-            if value < 0:
-                connections_map.append([value, triplet.triplet_id, connection])
-        if len(list(triplet.interactions.values())) == 0:
-            connections_map.append([0, triplet.triplet_id, None])
-        if len(list(triplet.interactions.values())) > 0:
-            if min(list(triplet.interactions.values())) > 0:
-                connections_map.append([1, triplet.triplet_id, None])
-
-    connections_map.sort(key=sort_by_connection)
+    connections_map = connections_map_entries(triplets.symmetric_interactions(), range(len(triplets)),
+                                              triplets.in_conflict_groups())
+    connections_map.sort(key=lambda x: x[0])
 
     triplet_ordering = []
 
     for entry in connections_map:
-        triplet_ordering.append(t_mapping[entry[1]])
-        if entry[2]:
-            triplet_ordering.append(t_mapping[entry[2]])
+        triplet_ordering.append(entry[1])
+        if entry[2] is not None:
+            triplet_ordering.append(entry[2])
 
     return triplet_ordering
 
 
-def impact_without_conflicts(triplet_list,
-                             t_mapping,
-                             solution_candidate,
-                             local=False):
+def impact_without_conflicts(triplets,
+                             solution_candidate):
     """Creates an impact list based on how much influence on the energy a bit flip has
-    :param triplet_list: list of triplet objects
-    :param t_mapping: name of triplets consist of <hit_ID>_<hit_ID>_<hit_ID> and is mapped to its position
-                      inside the triplet list
+    :param triplets: TripletTable object
     :param solution_candidate: binary vector representing kept and discarded triplets e.g [0,1,..., 1]
-    :param local: if True, then triplets outside the given triplet subset are not considered
     :return:
         list of indices ordered from lowest to highest impact of triplets in triplet list, but no
         conflicts are taken into account!
     """
-    impact_list_values = []
-    t_indices = []
-    for triplet in triplet_list:
-        t_indices.append(triplet.triplet_id)
-
-    for triplet, t_i in zip(triplet_list, solution_candidate):
-        energy_change = 0
-        if t_i == 0:
-            energy_change += triplet.quality
-        else:
-            energy_change -= triplet.quality
-
-        for interaction, value in triplet.interactions.items():
-            if value > 0:
-                continue
-            if local:
-                if interaction not in t_indices:
-                    continue
-            if t_i == 0 and solution_candidate[t_mapping[interaction]] == 0:
-                pass
-            elif t_i == 0 and solution_candidate[t_mapping[interaction]] == 1:
-                energy_change += triplet.interactions[interaction]
-            elif t_i == 1 and solution_candidate[t_mapping[interaction]] == 0:
-                pass
-            else:
-                energy_change -= triplet.interactions[interaction]
-
-        impact_list_values.append(abs(energy_change))
-    return list(np.argsort(impact_list_values))
+    return list(np.argsort(np.abs(local_fields(triplets, solution_candidate, without_conflicts=True))))
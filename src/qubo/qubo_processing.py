@@ -11,6 +11,7 @@ from qubo.solver import Solver
 from qubo.hamiltonian import Hamiltonian
 from qubo.ansatz import Ansatz
 from qubo.qubo_logging import QuboLogging
+from pattern.triplet_table import TripletTable
 
 from utility.time_tracking import hms_string
 
@@ -19,7 +20,7 @@ algorithm_globals.massive = True
 
 class QuboProcessing:
     def __init__(self,
-                 triplet_list_file: str,
+                 triplet_table_file: str,
                  config: dict,
                  solver: Solver,
                  ansatz: Ansatz,
@@ -27,7 +28,7 @@ class QuboProcessing:
                  save_folder: str,
                  verbose=1):
         """Processes the Qubo and provides solving functions like a solving process via a chosen optimisation strategy.
-        :param triplet_list_file: .npy file with triplet objects
+        :param triplet_table_file: .npz file with the triplet table, triplets are identified by their index
         :param config: dictionary with configuration parameters
         :param solver: solver object
         :param ansatz: ansatz circuit
@@ -36,9 +37,9 @@ class QuboProcessing:
         :param verbose: 0: only energy output, 1: showing sub-QUBO process
         """
         self.verbose = verbose
-        self.triplets = np.load(triplet_list_file, allow_pickle=True)
-        self.t_mapping = {key: value for key, value in zip([t.triplet_id for t in self.triplets],
-                                                           np.arange(len(self.triplets)))}
+        self.triplets = TripletTable.load(triplet_table_file)
+        # Q + Q^T, row i holds all interactions of triplet i
+        self.interactions = self.triplets.symmetric_interactions()
 
         self.config = config
         self.solver = solver
@@ -78,10 +79,8 @@ class QuboProcessing:
             for i in range(self.config["bit flip optimisation"]["iterations"]):
                 new_solution_candidate, energy_change = bit_flip_optimisation(self.triplets,
                                                                               self.solution_candidate,
-                                                                              self.t_mapping,
                                                                               self.optimisation_strategy(
                                                                                    self.triplets,
-                                                                                   self.t_mapping,
                                                                                    self.solution_candidate),
                                                                               self.config["bit flip optimisation"]
                                                                               ["reverse"])
@@ -120,15 +119,11 @@ class QuboProcessing:
 
             if "impact" in self.config["qubo"]["optimisation strategy"]:
                 triplet_ordering = self.optimisation_strategy(self.triplets,
-                                                              self.t_mapping,
-                                                              self.solution_candidate,
-                                                              False)
+                                                              self.solution_candidate)
             if "connection list" in self.config["qubo"]["optimisation strategy"]:
-                triplet_ordering = self.optimisation_strategy(self.triplets,
-                                                              self.t_mapping)
+                triplet_ordering = self.optimisation_strategy(self.triplets)
             if "paired list" in self.config["qubo"]["optimisation strategy"]:
-                triplet_ordering = self.optimisation_strategy(self.triplets,
-                                                              self.t_mapping)
+                triplet_ordering = self.optimisation_strategy(self.triplets)
             if "reverse" in self.config["qubo"]["optimisation strategy"]:
                 triplet_ordering.reverse()
 
@@ -142,9 +137,8 @@ class QuboProcessing:
             for i in range(int(len(self.triplets) / self.config["qubo"]["num qubits"])):
                 if self.verbose == 1:
                     print(f"Processing Sub-QUBO {i + 1} of {num_sub_qubos}", end="\r")
-                result = self.solve_subqubos([self.triplets[i] for i in
-                                             triplet_ordering[self.config["qubo"]["num qubits"] * i:
-                                                              self.config["qubo"]["num qubits"] * (i + 1)]])
+                result = self.solve_subqubos(triplet_ordering[self.config["qubo"]["num qubits"] * i:
+                                                              self.config["qubo"]["num qubits"] * (i + 1)])
                 if result is None:
                     continue
                 for k, entry in enumerate(triplet_ordering[self.config["qubo"]["num qubits"] * i:
@@ -155,8 +149,7 @@ class QuboProcessing:
             if len(triplet_ordering) % self.config["qubo"]["num qubits"] != 0:
                 if self.verbose == 1:
                     print(f"Processing Sub-QUBO {num_sub_qubos} of {num_sub_qubos}", end="\r")
-                result = self.solve_subqubos([self.triplets[i] for i in
-                                              triplet_ordering[- self.config["qubo"]["num qubits"]:]])
+                result = self.solve_subqubos(triplet_ordering[- self.config["qubo"]["num qubits"]:])
                 if result is None:
                     pass
                 else:
@@ -221,12 +214,7 @@ class QuboProcessing:
         """Calculates the minimum energy state and value.
         :return:
             minimum energy state, minimum energy value """
-        minimum_energy_state = []
-        for t in self.triplets:
-            if t.from_same_particle():
-                minimum_energy_state.append(1)
-            else:
-                minimum_energy_state.append(0)
+        minimum_energy_state = self.triplets.from_same_particle().astype(int).tolist()
         return minimum_energy_state, self.hamiltonian_energy(minimum_energy_state)
 
     def hamiltonian_energy(self, binary_vector, triplet_subset=None):
@@ -237,34 +225,18 @@ class QuboProcessing:
             energy value
         """
 
-        hamiltonian_energy = 0
+        binary_vector = np.asarray(binary_vector, dtype=np.float64)
         if triplet_subset is None:
-            for i, b1 in enumerate(binary_vector):
-                if b1 == 1:
-                    hamiltonian_energy += self.triplets[i].quality
-                for j in self.triplets[i].interactions.keys():
-                    if self.t_mapping[j] < i:
-                        continue
-                    else:
-                        pass
-                        if binary_vector[i] == binary_vector[self.t_mapping[j]] == 1:
-                            hamiltonian_energy += self.triplets[i].interactions[j]
-            return hamiltonian_energy
+            return float(self.triplets.quality @ binary_vector +
+                         binary_vector @ (self.triplets.interactions @ binary_vector)) + \
+                self.triplets.conflict_energy(binary_vector)
 
         else:
-            for i, b1 in enumerate(binary_vector):
-                if b1 == 1:
-                    hamiltonian_energy += self.triplets[triplet_subset[i]].quality
-
-                for j in self.triplets[triplet_subset[i]].interactions.keys():
-                    if j < triplet_subset[i]:
-                        continue
-                    if j not in triplet_subset:
-                        continue
-                    position = triplet_subset.index(j)
-                    if binary_vector[i] == binary_vector[position] == 1:
-                        hamiltonian_energy += self.triplets[triplet_subset[i]].interactions[j]
-            return hamiltonian_energy
+            # each pair of the subset is contained once in the submatrix of the upper triangular matrix
+            interactions = self.triplets.interactions[triplet_subset][:, triplet_subset]
+            return float(self.triplets.quality[triplet_subset] @ binary_vector +
+                         binary_vector @ (interactions @ binary_vector)) + \
+                self.triplets.conflict_energy(binary_vector, triplet_subset)
 
     def log_truth_energy(self):
         """Obtaining minimal energy solution and minimal energy printing information about ideal solution and energy.
@@ -318,7 +290,7 @@ class QuboProcessing:
                        triplet_slice,
                        subsequent_list=None):
         """Function for solving a SubQUBO
-        :param triplet_slice: slice of triplets used for the SubQUBO
+        :param triplet_slice: indices of the triplets used for the SubQUBO
         :param subsequent_list if only triplets in a certain area should be considered
         :return
             result of computation
@@ -328,8 +300,11 @@ class QuboProcessing:
 
         # start timer sub-qubo creation and solving
 
-        hamiltonian = Hamiltonian(triplet_slice=triplet_slice,
-                                  t_mapping=self.t_mapping,
+        # conflict groups of the sub-QUBO triplets as interactions
+        interactions = self.triplets.expand_conflicts(self.interactions, triplet_slice)
+        hamiltonian = Hamiltonian(quality=self.triplets.quality,
+                                  interactions=interactions,
+                                  triplet_slice=triplet_slice,
                                   solution_candidate=self.solution_candidate,
                                   rescaling=self.config["qubo"]["hamiltonian rescaling"],
                                   only_specified_connections=subsequent_list)
@@ -347,8 +322,7 @@ class QuboProcessing:
             # Overwrite ansatz for vqe if HamiltonianDriven
 
             if self.config["ansatz"]["layout"] == "HamiltonianDriven":
-                triplet_slice = triplet_slice
-                self.ansatz.set_hamiltonian_driven(triplet_slice)
+                self.ansatz.set_hamiltonian_driven(interactions, triplet_slice)
                 self.solver.quantum_instance.ansatz = self.ansatz
 
             # Timestamps and solving the SubQUBO
@@ -403,12 +377,9 @@ class QuboProcessing:
             f.write("---\n")
 
     def get_kept_triplets(self):
-        """Collects the kept triplets from the triplet list
+        """Collects the kept triplets from the triplet table
         :return
-            kept triplets selected by the optimisation process
+            kept triplets selected by the optimisation process as Triplet objects
         """
-        kept_triplets = []
-        for triplet, entry in zip(self.triplets, self.solution_candidate):
-            if int(entry) == 1:
-                kept_triplets.append(triplet)
-        return kept_triplets
+        kept_triplets = [index for index, entry in enumerate(self.solution_candidate) if int(entry) == 1]
+        return self.triplets.to_triplets(kept_triplets)
@@ -4,6 +4,8 @@ import os
 
 from pathlib import Path
 
+from numba import config as numba_config
+
 from pattern_building.pattern_builder import PatternBuilder
 from pattern_building.segment_manager import LUXESegmentManager
 from pattern_building.qubo_coefficients import QuboCoefficients
@@ -17,6 +19,12 @@ from track_building.gen_multiplets import GenMultiplet
 from track_building.reco_multiplets import make_reco_multiplets
 from track_building.efficiency import get_efficiency
 
+from utility.data_format_handler import load_data, iterate_events
+
+# processes forking after a parallel numba call (process pools of pattern building and QUBO coefficients) do not exit
+# with the TBB threading layer
+numba_config.THREADING_LAYER_PRIORITY = ['omp', 'workqueue', 'tbb']
+
 parser = argparse.ArgumentParser(description='QUBO pattern_building Simplified LUXE',
                                  formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
@@ -32,10 +40,26 @@ parser.add_argument('--tracking_data',
                     default=None,
                     help='Tracking data csv file')
 
+parser.add_argument('--no_hit_cache',
+                    action='store_true',
+                    help='Do not read or write the binary hit cache of the tracking data file')
+
+parser.add_argument('--refresh_hit_cache',
+                    action='store_true',
+                    help='Parse the tracking data file again and rewrite its binary hit cache')
+
+parser.add_argument('--per_event',
+                    action='store_true',
+                    help='Stream the tracking data file event by event and run the pattern recognition for each '
+                         'event separately, results are stored in <tracking_data>_qubo/event_<n>')
+
 # get input
 parser_args = parser.parse_args()
 steering_file = parser_args.steering_file
 tracking_data = parser_args.tracking_data
+use_hit_cache = not parser_args.no_hit_cache
+refresh_hit_cache = parser_args.refresh_hit_cache
+per_event = parser_args.per_event
 
 # loading steering_file, creating folder
 with open(steering_file, 'r') as f:
@@ -62,99 +86,129 @@ s_manager = LUXESegmentManager(configuration, geometry_file)
 s_manager.create_LUXE_segments()
 s_manager.segment_mapping_LUXE()
 
-# setting up pattern builder object and loading data from specified file
-pattern_builder = PatternBuilder(configuration)
-pattern_builder.load_tracking_data(tracking_data, s_manager, tracking_data_format)
-pattern_builder.create_multiplets(s_manager)
-
-if sample_composition == 'blinded':
-    print('Truth information about particle tracks is not available in blinded sample!\n')
-    print('-----------------------------------\n')
-    print('Building multiplets is not possible from blinded sample!')
-else:
-    pattern_builder.information_about_particle_tracks(z_position_layers=s_manager.z_position_to_layer,
-                                                      setup=s_manager.setup,
-                                                      sample_composition=sample_composition,
-                                                      min_track_length=configuration['track']['minimum track length'])
-    print('Building multiplets on generator level with truth information...\n')
-    gen_multiplets = GenMultiplet(tracking_data_file=tracking_data,
-                                  min_track_length=configuration['track']['minimum track length'])
-
-    gen_multiplets.make_gen_multiplets(tracking_data_format)
-    gen_multiplets.save_multiplets(save_to_folder=qubo_preparation_folder)
-
 
-# set qubo parameters
-print('Calculate triplet coefficients a_i and b_ij...')
-qubo_coefficients = QuboCoefficients(configuration, qubo_preparation_folder)
-qubo_coefficients.set_triplet_coefficients(s_manager)
+def pattern_recognition(hit_table,
+                        qubo_preparation_folder: str,
+                        event_index: int = 0) -> None:
+    """Runs pattern building, QUBO preparation, solving and track building for the hits of one event or file.
+    :param hit_table: HitTable with the hits to process
+    :param qubo_preparation_folder: folder to store the results
+    :param event_index: index of the event in the tracking data file
+    """
+    # segments are reused, only the hits of previous events are removed
+    s_manager.reset_segments()
+
+    # setting up pattern builder object and placing the hits in the segments
+    pattern_builder = PatternBuilder(configuration)
+    pattern_builder.load_tracking_data(hit_table, s_manager)
+    pattern_builder.create_multiplets(s_manager)
+
+    if sample_composition == 'blinded':
+        print('Truth information about particle tracks is not available in blinded sample!\n')
+        print('-----------------------------------\n')
+        print('Building multiplets is not possible from blinded sample!')
+    else:
+        pattern_builder.information_about_particle_tracks(z_position_layers=s_manager.z_position_to_layer,
+                                                          setup=s_manager.setup,
+                                                          sample_composition=sample_composition,
+                                                          min_track_length=configuration['track'][
+                                                              'minimum track length'])
+        print('Building multiplets on generator level with truth information...\n')
+        gen_multiplets = GenMultiplet(tracking_data_file=tracking_data,
+                                      min_track_length=configuration['track']['minimum track length'])
+
+        gen_multiplets.make_gen_multiplets(hit_table)
+        gen_multiplets.save_multiplets(save_to_folder=qubo_preparation_folder)
+
+    # set qubo parameters
+    print('Calculate triplet coefficients a_i and b_ij...')
+    qubo_coefficients = QuboCoefficients(configuration, qubo_preparation_folder)
+    qubo_coefficients.set_triplet_coefficients(s_manager, pattern_builder.get_triplet_table())
+
+    # rescale parameters
+    qubo_coefficients.coefficient_rescaling()
 
-# rescale parameters
-qubo_coefficients.coefficient_rescaling()
-
-print('-----------------------------------\n')
-print('QUBO preparation finished successfully!\n')
-
-
-print('-----------------------------------\n')
+    print('-----------------------------------\n')
+    print('QUBO preparation finished successfully!\n')
 
-file_extension = f'{configuration["qubo"]["optimisation strategy"].replace(" ", "_")}_' \
-                 f'{configuration["solver"]["algorithm"].replace(" ","_")}_' \
-                 f'{configuration["qubo"]["num qubits"]}'
-qubo_folder = qubo_preparation_folder + "/" + file_extension
+    print('-----------------------------------\n')
 
-if Path(qubo_folder).is_dir():
-    pass
-else:
-    os.mkdir(qubo_folder)
-                 
-# Create logger
-qubo_logger = QuboLogging()
-
-# Create ansatz object and set parameters from config file
-if configuration['ansatz']['layout'] is None:
-    ansatz = None
-else:
-    ansatz = Ansatz(config=steering_file)
+    file_extension = f'{configuration["qubo"]["optimisation strategy"].replace(" ", "_")}_' \
+                     f'{configuration["solver"]["algorithm"].replace(" ","_")}_' \
+                     f'{configuration["qubo"]["num qubits"]}'
+    qubo_folder = qubo_preparation_folder + "/" + file_extension
 
-# If not "hamiltonian driven" additional parameters are set
-if configuration['ansatz']['layout'] == 'TwoLocal':
-    ansatz.set_two_local()
-elif configuration['ansatz']['layout'] is None:
-    if configuration['solver']['algorithm'] == 'QAOA':
+    if Path(qubo_folder).is_dir():
         pass
-    elif configuration['solver']['algorithm'] is not None:
-        if configuration['solver']['algorithm'] != 'Numpy Eigensolver':
-            ansatz.set_no_entanglements()
-
-# Create Solver object and set parameters from config file
-if configuration['solver']['algorithm'] != 'Numpy Eigensolver' and configuration['solver']['algorithm'] is not None:
-    solver = Solver(configuration)
+    else:
+        os.mkdir(qubo_folder)
+
+    # Create logger
+    qubo_logger = QuboLogging()
+
+    # Create ansatz object and set parameters from config file
+    if configuration['ansatz']['layout'] is None:
+        ansatz = None
+    else:
+        ansatz = Ansatz(config=steering_file)
+
+    # If not "hamiltonian driven" additional parameters are set
+    if configuration['ansatz']['layout'] == 'TwoLocal':
+        ansatz.set_two_local()
+    elif configuration['ansatz']['layout'] is None:
+        if configuration['solver']['algorithm'] == 'QAOA':
+            pass
+        elif configuration['solver']['algorithm'] is not None:
+            if configuration['solver']['algorithm'] != 'Numpy Eigensolver':
+                ansatz.set_no_entanglements()
+
+    # Create Solver object and set parameters from config file
+    if configuration['solver']['algorithm'] != 'Numpy Eigensolver' and configuration['solver']['algorithm'] is not None:
+        solver = Solver(configuration)
+    else:
+        solver = None
+
+    # Create and configure solving process
+    qubo_processor = QuboProcessing(qubo_preparation_folder + '/triplet_table.npz',
+                                    config=configuration,
+                                    solver=solver,
+                                    ansatz=ansatz,
+                                    qubo_logging=qubo_logger,
+                                    save_folder=qubo_folder,
+                                    verbose=1)
+    qubo_processor.qubo_processing()        
+    make_reco_multiplets(qubo_processor.get_kept_triplets(),
+                         qubo_folder,
+                         tracking_data,
+                         event_index=event_index)
+
+    gen_prefix = f'{qubo_folder}/reco_xplet_list.npy'.split('/')[-3].split('-')[0]
+    gen_xplet = f'{qubo_preparation_folder}/{tracking_data.split("/")[-1].split(".")[0]}_gen_xplet_list'
+
+    try:
+        get_efficiency(f'{qubo_folder}/reco_xplet_list_ambiguity_solved.npy',
+                       f'{gen_xplet}.npy')
+    except FileNotFoundError:
+        print('\nNo track reconstruction efficiency available in blinded samples!')
+
+
+if per_event:
+    # streaming the file, only the hits of the current event are kept in memory
+    print(f"Using tracking data file {tracking_data.split('/')[-1]}, processing event by event")
+    for event_index, event_hit_table in enumerate(iterate_events(tracking_data, tracking_data_format)):
+        print(f'\nProcessing event {event_index} with {len(event_hit_table)} hits')
+        event_folder = f'{qubo_preparation_folder}/event_{event_index}'
+        if not Path(event_folder).is_dir():
+            os.mkdir(event_folder)
+        pattern_recognition(event_hit_table, event_folder, event_index=event_index)
 else:
-    solver = None
-
-# Create and configure solving process
-qubo_processor = QuboProcessing(qubo_preparation_folder + '/triplet_list.npy',
-                                config=configuration,
-                                solver=solver,
-                                ansatz=ansatz,
-                                qubo_logging=qubo_logger,
-                                save_folder=qubo_folder,
-                                verbose=1)
-qubo_processor.qubo_processing()        
-make_reco_multiplets(qubo_processor.get_kept_triplets(),
-                     qubo_folder,
-                     tracking_data)
-
-
-gen_prefix = f'{qubo_folder}/reco_xplet_list.npy'.split('/')[-3].split('-')[0]
-gen_xplet = f'{qubo_preparation_folder}/{tracking_data.split("/")[-1].split(".")[0]}_gen_xplet_list'
-
-try:
-    get_efficiency(f'{qubo_folder}/reco_xplet_list_ambiguity_solved.npy',
-                   f'{gen_xplet}.npy')
-except FileNotFoundError:
-    print('\nNo track reconstruction efficiency available in blinded samples!')
+    # loading data from specified file, the hits are shared by all following steps
+    print(f"Using tracking data file {tracking_data.split('/')[-1]}")
+    pattern_recognition(load_data(tracking_data,
+                                  tracking_data_format,
+                                  use_cache=use_hit_cache,
+                                  refresh_cache=refresh_hit_cache),
+                        qubo_preparation_folder)
 
 print('-----------------------------------\n')
 print('Pattern recognition finished successfully!\n')
@@ -1,7 +1,10 @@
 import yaml
 import argparse
+import os
 import time
 
+from numba import config as numba_config
+
 from simplified_simulation.ptarmigan import PtargmiganSimData
 from simplified_simulation.experimental_results_MC_toy import ExperimentalResults
 from simplified_simulation.toy_experiment import MCToyExperiment
@@ -9,6 +12,14 @@ from simplified_simulation.detector_plane import DetectorPlane
 from simplified_simulation.dipole_magnet import DipoleMagnet
 from simplified_simulation.convert_to_csv import *
 from utility.time_tracking import hms_string
+from pattern.detector_geometry import Geometry
+from pattern_building.segment_manager import LUXESegmentManager
+from pattern_building.pattern_builder import PatternBuilder
+from pattern_building.qubo_coefficients import QuboCoefficients
+
+# processes forking after a parallel numba call (process pools of pattern building and QUBO coefficients) do not exit
+# with the TBB threading layer
+numba_config.THREADING_LAYER_PRIORITY = ['omp', 'workqueue', 'tbb']
 
 parser = argparse.ArgumentParser(description='Simplified Simulation',
                                  formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -37,11 +48,24 @@ parser.add_argument('--target_folder',
                     default=None,
                     help='Folder to store results')
 
+parser.add_argument('--steering_file',
+                    action='store',
+                    type=str,
+                    default=None,
+                    help='Pattern building configuration file, if given the smeared hits are passed in memory to the '
+                         'pattern building and QUBO preparation')
+
+parser.add_argument('--no_csv_export',
+                    action='store_true',
+                    help='Do not write the true and smeared hits into .csv files')
+
 parser_args = parser.parse_args()
 config_file = parser_args.config_file
 ptarmigan = parser_args.ptarmigan_file
 geometry = parser_args.geometry_file
 target_folder = parser_args.target_folder
+steering_file = parser_args.steering_file
+csv_export = not parser_args.no_csv_export
 
 outfile_name = ".".join(ptarmigan.split("/")[-1].split(".")[0:-1])
 print("\nStarting simulation...")
@@ -50,21 +74,7 @@ print(f"Loading file {ptarmigan}")
 with open(config_file) as f:
     input_file = yaml.safe_load(f)
 
-layer_inf = []
-with open(geometry, 'r') as file:
-    csv_reader_geometry = csv.reader(file)
-    csv_header_geometry = next(csv_reader_geometry)
-    x_start = csv_header_geometry.index("x_start")
-    x_end = csv_header_geometry.index("x_end")
-    y_start = csv_header_geometry.index("y_start")
-    y_end = csv_header_geometry.index("y_end")
-    z = csv_header_geometry.index("z")
-    for row in csv_reader_geometry:
-        layer_inf.append((float(row[x_start]),
-                          float(row[x_end]),
-                          float(row[y_start]),
-                          float(row[y_end]),
-                          float(row[z])))
+detector_geometry = Geometry.load(geometry)
 
 # In the simplified case, there is one big chip instead of 18 per layer. The pixel scale accounts for that.
 if "sl" in geometry:
@@ -78,10 +88,14 @@ else:
     exit()
 
 detector_plane_list = []
-for i in range(len(layer_inf)):
-    detector_plane_list.append(DetectorPlane((layer_inf[i][0], layer_inf[i][1]),
-                                             (layer_inf[i][2], layer_inf[i][3]),
-                                             layer_inf[i][4],
+for x_start, x_end, y_start, y_end, z in zip(detector_geometry.x_start.tolist(),
+                                            detector_geometry.x_end.tolist(),
+                                            detector_geometry.y_start.tolist(),
+                                            detector_geometry.y_end.tolist(),
+                                            detector_geometry.z.tolist()):
+    detector_plane_list.append(DetectorPlane((x_start, x_end),
+                                             (y_start, y_end),
+                                             z,
                                              (input_file["detector"]["num pixel x"] * pixel_scale,
                                               input_file["detector"]["num pixel y"]),
                                              input_file["detector"]["thickness"],
@@ -113,17 +127,44 @@ print(f"Time to run simulation: {hms_string(time_simulation_end - time_simulatio
 result.save_results(target_folder + "/" + outfile_name + outfile_appendix)
 print("Simulation finished!\n")
 
-time_converting_start = time.time()
-print("Converting to .csv files:")
-print("Processing true hits...")
-convert_to_csv_true(target_folder + "/" + outfile_name + outfile_appendix)
+# hits are kept in memory, the .csv files are only an export
+true_hits = result.to_hit_table()
+smeared_hits = result.to_hit_table(smearing=SMEARING_RESOLUTION)
+
+if csv_export:
+    time_converting_start = time.time()
+    print("Converting to .csv files:")
+    print("Processing true hits...")
+    convert_to_csv_true(target_folder + "/" + outfile_name + outfile_appendix, hit_table=true_hits)
+
+    print("Smearing hits...")
+    convert_to_csv_smeared(target_folder + "/" + outfile_name + outfile_appendix, hit_table=smeared_hits)
+
+    # print("Calculating mid of fired pixels...\n")
+    # convert_to_csv_pixel(target_folder + "/" + outfile_name + outfile_appendix)
+
+    print("Converting finished successfully!")
+    time_converting_end = time.time()
+    print(f"Time to convert results to .csv files: {hms_string(time_converting_end - time_converting_start)}")
+
+if steering_file is not None:
+    with open(steering_file, 'r') as f:
+        configuration = yaml.safe_load(f)
+
+    qubo_preparation_folder = f"{target_folder}/{outfile_name}{outfile_appendix}_qubo"
+    if not os.path.isdir(qubo_preparation_folder):
+        os.mkdir(qubo_preparation_folder)
 
-print("Smearing hits...")
-convert_to_csv_smeared(target_folder + "/" + outfile_name + outfile_appendix)
+    s_manager = LUXESegmentManager(configuration, geometry)
+    s_manager.create_LUXE_segments()
+    s_manager.segment_mapping_LUXE()
 
-# print("Calculating mid of fired pixels...\n")
-# convert_to_csv_pixel(target_folder + "/" + outfile_name + outfile_appendix)
+    pattern_builder = PatternBuilder(configuration)
+    pattern_builder.load_tracking_data(smeared_hits, s_manager)
+    pattern_builder.create_multiplets(s_manager)
 
-print("Converting finished successfully!")
-time_converting_end = time.time()
-print(f"Time to convert results to .csv files: {hms_string(time_converting_end - time_converting_start)}")
+    print('Calculate triplet coefficients a_i and b_ij...')
+    qubo_coefficients = QuboCoefficients(configuration, qubo_preparation_folder)
+    qubo_coefficients.set_triplet_coefficients(s_manager, pattern_builder.get_triplet_table())
+    qubo_coefficients.coefficient_rescaling()
+    print('QUBO preparation finished successfully!\n')
@@ -4,95 +4,106 @@ import os
 import matplotlib.pyplot as plt
 from numpy.linalg import norm
 
+from pattern.hit_table import HitTable
+from utility.data_format_handler import get_cell_ids, write_simplified_simulation_csv
 
-def convert_to_csv_true(path_to_file):
+# (sigma_x, sigma_y) of smeared hits [m]
+# pixel resolution would be (plane.limits_x[1] - plane.limits_x[0]) / (plane.num_bins[0]) / np.sqrt(12)
+SMEARING_RESOLUTION = (5e-6, 5e-6)
+
+
+def hit_table_from_planes(plane_list: dict,
+                          particle_momentum_history: dict,
+                          smearing: tuple[float, float] | None = None) -> HitTable:
+    """Creates a HitTable from the true hits stored in the detector planes of the simplified simulation.
+    :param plane_list: {<plane key>: <DetectorPlane>}
+    :param particle_momentum_history: {<particle ID>: {<plane key>: <momentum>}}
+    :param smearing: (sigma_x, sigma_y) of a gaussian smearing of the hit positions [m], None for true hits
+
+    :return
+        HitTable object
+    """
+    particle_ids = []
+    positions = []
+    energies = []
+    for key, plane in zip(plane_list.keys(), plane_list.values()):
+        for particle, hit in zip(plane.true_hits_dictionary.keys(), plane.true_hits_dictionary.values()):
+            particle_ids.append(int(particle))
+            positions.append(hit[0:3])
+            energies.append(norm(particle_momentum_history[particle][key]))
+    positions = np.array(positions, dtype=np.float64).reshape(-1, 3)
+
+    x, y, z = positions[:, 0], positions[:, 1], positions[:, 2]
+    if smearing is not None:
+        x = np.random.normal(x, smearing[0])
+        y = np.random.normal(y, smearing[1])
+
+    layers_and_modules = np.array([get_layer_and_module(x_hit, y_hit, z_hit)
+                                   for x_hit, y_hit, z_hit in zip(x.tolist(), y.tolist(), z.tolist())],
+                                  dtype=np.int32).reshape(-1, 2)
+
+    return HitTable(hit_id=np.arange(len(particle_ids)),
+                    x=x,
+                    y=y,
+                    z=z,
+                    layer_id=layers_and_modules[:, 0],
+                    module_id=layers_and_modules[:, 1],
+                    cell_id=get_cell_ids(layers_and_modules[:, 1], layers_and_modules[:, 0]),
+                    particle_id=np.array(particle_ids, dtype=np.int64),
+                    is_signal=None,  # all hits are signal
+                    particle_energy=np.array(energies, dtype=np.float64))
+
+
+def get_csv_file_name(path_to_file):
+    """Returns the name of the .csv file belonging to a simulation result file.
+    :param path_to_file: path to .npy file without extension
+    :return
+        file name without extension
+    """
+    file = path_to_file.split("/")[-1]
+    if "sl" in file:
+        return '_'.join(file.split("_")[0:-2]) + "_sl"
+    elif "fl" in file:
+        return '_'.join(file.split("_")[0:-2]) + "_fl"
+    print('Check LUXE geometry file!')
+    print('Exiting...')
+    exit()
+
+
+def convert_to_csv_true(path_to_file, hit_table=None):
     """Converts the .npy file into a .csv tracking file containing truth information
     :param path_to_file: path to .npy file
+    :param hit_table: true hits already in memory, if None they are loaded from the .npy file
     """
     folder = "/".join(path_to_file.split("/")[0:-1])
-    file = path_to_file.split("/")[-1]
     if not os.path.isdir(f"{folder}/true"):
         os.mkdir(f"{folder}/true")
+    file_name = get_csv_file_name(path_to_file)
 
-    file_name = None
-    if "sl" in file:
-        file_name = '_'.join(file.split("_")[0:-2]) + "_sl"
-    elif "fl" in file:
-        file_name = '_'.join(file.split("_")[0:-2]) + "_fl"
-    else:
-        print('Check LUXE geometry file!')
-        print('Exiting...')
-        exit()
+    if hit_table is None:
+        data = np.load(f"{path_to_file}.npy", allow_pickle=True)[()]
+        hit_table = hit_table_from_planes(data['Plane list'], data["Particle momentum history log"])
 
-    data = np.load(f"{path_to_file}.npy", allow_pickle=True)[()]
+    write_simplified_simulation_csv(f"{folder}/true/{file_name}.csv", hit_table)
 
-    hit_id = 0
-    with open(f"{folder}/true/{file_name}.csv", 'w', newline='') as csvfile:
-        fieldnames = ['hit_ID', 'x', 'y', 'z', 'layer_ID', 'module_ID', 'is_signal', 'particle_ID', 'particle_energy']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
 
-        for key, plane in zip(data['Plane list'].keys(), data['Plane list'].values()):
-            for particle, hit in zip(plane.true_hits_dictionary.keys(), plane.true_hits_dictionary.values()):
-                layer, module = get_layer_and_module(hit[0], hit[1], hit[2])
-                writer.writerow({'hit_ID': hit_id,
-                                 'x': hit[0],
-                                 'y': hit[1],
-                                 'z': hit[2],
-                                 'layer_ID': layer,
-                                 'module_ID': module,
-                                 'is_signal': True,
-                                 'particle_ID': particle,
-                                 'particle_energy': norm(data["Particle momentum history log"][particle][key])})
-                hit_id += 1
-
-
-def convert_to_csv_smeared(path_to_file):
+def convert_to_csv_smeared(path_to_file, hit_table=None):
     """Converts the .npy file into a .csv tracking file containing smeared hits
     :param path_to_file: path to .npy file
+    :param hit_table: smeared hits already in memory, if None they are loaded from the .npy file and smeared
     """
     folder = "/".join(path_to_file.split("/")[0:-1])
-    file = path_to_file.split("/")[-1]
     if not os.path.isdir(f"{folder}/smeared"):
         os.mkdir(f"{folder}/smeared")
+    file_name = get_csv_file_name(path_to_file)
 
-    file_name = None
-    if "sl" in file:
-        file_name = '_'.join(file.split("_")[0:-2]) + "_sl"
-    elif "fl" in file:
-        file_name = '_'.join(file.split("_")[0:-2]) + "_fl"
-    else:
-        print('Check LUXE geometry file!')
-        print('Exiting...')
-        exit()
-
-    data = np.load(f"{path_to_file}.npy", allow_pickle=True)[()]
-
-    hit_id = 0
-    with open(f"{folder}/smeared/{file_name}.csv", 'w', newline='') as csvfile:
-        fieldnames = ['hit_ID', 'x', 'y', 'z', 'layer_ID', 'module_ID', 'is_signal', 'particle_ID', 'particle_energy']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
+    if hit_table is None:
+        data = np.load(f"{path_to_file}.npy", allow_pickle=True)[()]
+        hit_table = hit_table_from_planes(data['Plane list'],
+                                          data["Particle momentum history log"],
+                                          smearing=SMEARING_RESOLUTION)
 
-        for key, plane in zip(data['Plane list'].keys(), data['Plane list'].values()):
-            # sigma_x_resolution = (plane.limits_x[1] - plane.limits_x[0]) / (plane.num_bins[0]) / np.sqrt(12)
-            # sigma_y_resolution = (plane.limits_y[1] - plane.limits_y[0]) / (plane.num_bins[1]) / np.sqrt(12)
-            sigma_x_resolution = 5e-6
-            sigma_y_resolution = 5e-6
-            for particle, hit in zip(plane.true_hits_dictionary.keys(), plane.true_hits_dictionary.values()):
-                smeared_x = np.random.normal(hit[0], sigma_x_resolution)
-                smeared_y = np.random.normal(hit[1], sigma_y_resolution)
-                layer, module = get_layer_and_module(smeared_x, smeared_y, hit[2])
-                writer.writerow({'hit_ID': hit_id,
-                                 'x': smeared_x,
-                                 'y': smeared_y,
-                                 'z': hit[2],
-                                 'layer_ID': layer,
-                                 'module_ID': module,
-                                 'is_signal': True,
-                                 'particle_ID': particle,
-                                 'particle_energy': norm(data["Particle momentum history log"][particle][key])})
-                hit_id += 1
+    write_simplified_simulation_csv(f"{folder}/smeared/{file_name}.csv", hit_table)
 
 
 def convert_to_csv_pixel(path_to_file):
@@ -1,5 +1,8 @@
 import numpy as np
 
+from pattern.hit_table import HitTable
+from simplified_simulation.convert_to_csv import hit_table_from_planes
+
 
 class ExperimentalResults:
     """Container class for storing the experiment results of the simplified simulation.
@@ -19,3 +22,13 @@ class ExperimentalResults:
                                      "Particle position history log": self.particle_position_history,
                                      "Particle time log": self.particle_time_history,
                                      "Plane list": self.list_of_planes}))
+
+    def to_hit_table(self,
+                     smearing: tuple[float, float] | None = None) -> HitTable:
+        """Returns the detector hits as HitTable, which can be passed directly to the pattern building.
+        :param smearing: (sigma_x, sigma_y) of a gaussian smearing of the hit positions [m], None for true hits
+
+        :return
+            HitTable object
+        """
+        return hit_table_from_planes(self.list_of_planes, self.particle_momentum_history, smearing=smearing)
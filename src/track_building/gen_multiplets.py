@@ -1,9 +1,7 @@
-import csv
 import numpy as np
 
-from pattern.detector_hit import DetectorHit
 from pattern.multiplet import Multiplet
-from utility.data_format_handler import load_data
+from pattern.hit_table import HitTable
 
 
 class GenMultiplet:
@@ -16,8 +14,8 @@ class GenMultiplet:
         :param tracking_data_file: file with tracking data information
         :param min_track_length: minimum required length of multiplet to be considered a track candidate
         """
-        self.multiplets_dict = {}
         self.gen_multiplets = []
+        self.num_background_hits = 0
         self.tracking_data_file = tracking_data_file
         self.output_name = ".".join(tracking_data_file.split("/")[-1].split(".")[0:-1])
 
@@ -34,44 +32,22 @@ class GenMultiplet:
               f"{len([g for g in self.gen_multiplets if len(g.hit_id) >= self.min_track_length])}\n")
         print("-----------------------------------\n")
 
-    def create_multiplets(self):
-        """Creates the multiplets from the sorted particle dictionary.
+    def make_gen_multiplets(self,
+                            hit_table: HitTable) -> None:
+        """Creates all signal multiplets from the hits of the specified tracking data file.
+        :param hit_table: hits loaded from the tracking data file
         """
-        for particle_entry in self.multiplets_dict.values():
-            particle_entry.sort(key=lambda entry: entry.z)
+        self.num_background_hits = int(np.count_nonzero(~hit_table.is_signal))
 
-            truth_multiplet = Multiplet()
-            for value in particle_entry:
-                truth_multiplet.add_hit(value)
+        # signal hits ordered by particle and by z inside a particle
+        signal_hits = np.flatnonzero(hit_table.is_signal)
+        order = signal_hits[np.lexsort((hit_table.z[signal_hits], hit_table.particle_id[signal_hits]))]
+        _, group_starts = np.unique(hit_table.particle_id[order], return_index=True)
 
+        for particle_hits in np.split(order, group_starts[1:]):
+            if len(particle_hits) == 0:
+                continue
+            truth_multiplet = Multiplet()
+            for hit_index in particle_hits:
+                truth_multiplet.add_hit(hit_table.hit(hit_index))
             self.gen_multiplets.append(truth_multiplet)
-
-    def add_hit_to_multiplet_dict(self,
-                                  hit: DetectorHit) -> None:
-        """Adds a hit to the multiplet dictionary.
-        :param hit: DetectorHit object
-        """
-        # background hit
-        if not hit.is_signal:
-            self.num_background_hits += 1
-
-        # signal hit
-        else:
-            if hit.particle_id in self.multiplets_dict.keys():
-                self.multiplets_dict[hit.particle_id].append(hit)
-            else:
-                self.multiplets_dict.update({hit.particle_id: [hit]})
-
-    def make_gen_multiplets(self,
-                            tracking_data_format) -> None:
-        """Creates all signal multiplets from the specified simplified simulation tracking data file.
-        :param tracking_data_format: format of the tracking data
-                                     --> 'key4hep slcio', 'key4hep csv', 'simplified simulation csv'
-        """
-        hits = load_data(self.tracking_data_file, tracking_data_format)
-        for hit in hits:
-            # add to multiplet dictionary
-            self.add_hit_to_multiplet_dict(hit)
-
-        # create multiplets from sorted particle dictionary
-        self.create_multiplets()
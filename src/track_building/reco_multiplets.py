@@ -9,12 +9,15 @@ from utility.data_format_handler import write_tracks_to_slcio_file
 def make_reco_multiplets(triplets,
                          save_folder,
                          tracking_data,
-                         fit="chi squared lin track"):
+                         fit="chi squared lin track",
+                         event_index=0):
     """Creates xplets from the kept triplets.
     :param fit: 
             "chi squared lin track: assuming a linear track and fitting  a chi squared assuming f(z) = x_i, f(z) = y_j
     :param triplets: list of kept triplets
     :param save_folder: folder to store reco xplet list
+    :param tracking_data: tracking data file, tracks are written into a copy of .slcio files
+    :param event_index: index of the event in the tracking data file
     """
     print("\n-----------------------------------\n")
     print("Creating reco Xplets and fitting resulting tracks...\n")
@@ -83,7 +86,8 @@ def make_reco_multiplets(triplets,
     if '.slcio' in tracking_data:
         write_tracks_to_slcio_file(tracking_data,
                                    reco_track_candidates,
-                                   save_folder)
+                                   save_folder,
+                                   event_index=event_index)
 
     np.save(f"{save_folder}/reco_xplet_list", reco_track_candidates)
 
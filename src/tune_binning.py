@@ -0,0 +1,72 @@
+import yaml
+import argparse
+
+from numba import config as numba_config
+
+from pattern_building.binning_tuner import tune_binning
+from utility.data_format_handler import load_data
+
+# processes forking after a parallel numba call (process pool of pattern building) do not exit with the TBB threading
+# layer
+numba_config.THREADING_LAYER_PRIORITY = ['omp', 'workqueue', 'tbb']
+
+parser = argparse.ArgumentParser(description='Tuning of the segmentation binning on a representative event',
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+parser.add_argument('--steering_file',
+                    action='store',
+                    type=str,
+                    default=None,
+                    help='Pattern recognition configuration file, its binning is the reference')
+
+parser.add_argument('--tracking_data',
+                    action='store',
+                    type=str,
+                    default=None,
+                    help='Tracking data file of a representative event')
+
+parser.add_argument('--bins_x',
+                    action='store',
+                    type=int,
+                    nargs='+',
+                    default=[8, 16, 32, 64, 128, 256],
+                    help='Candidate numbers of bins in x')
+
+parser.add_argument('--bins_y',
+                    action='store',
+                    type=int,
+                    nargs='+',
+                    default=[1, 2, 4, 8, 16],
+                    help='Candidate numbers of bins in y')
+
+parser.add_argument('--output',
+                    action='store',
+                    type=str,
+                    default=None,
+                    help='File for the recommended binning block, default is <tracking_data>_binning.yaml')
+
+parser_args = parser.parse_args()
+
+with open(parser_args.steering_file, 'r') as f:
+    configuration = yaml.safe_load(f)
+
+hit_table = load_data(parser_args.tracking_data, configuration['tracking data']['tracking data format'])
+
+print('\n-----------------------------------')
+print('Sweeping segmentation binnings...\n')
+selected, _ = tune_binning(configuration,
+                           configuration['tracking data']['detector geometry'],
+                           hit_table,
+                           parser_args.bins_x,
+                           parser_args.bins_y)
+
+recommended = {'binning': {'num bins x': selected['num bins x'],
+                           'num bins y': selected['num bins y']}}
+output_file = parser_args.output if parser_args.output is not None else f'{parser_args.tracking_data}_binning.yaml'
+with open(output_file, 'w') as f:
+    f.write(f"# fastest binning with identical doublets for {parser_args.tracking_data.split('/')[-1]}, "
+            f"{selected['segment pairs']} segment pairs, {selected['total time']:.3f} s for mapping and doublets\n")
+    yaml.safe_dump(recommended, f, sort_keys=False)
+
+print(f"\nRecommended binning: {selected['num bins x']}x{selected['num bins y']}, written to {output_file}")
+print('-----------------------------------\n')
@@ -0,0 +1,104 @@
+import glob
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from pattern.hit_table import HitTable
+from utility.data_format_handler import load_data, parse_tracking_data
+from utility.time_tracking import hms_string
+
+
+def get_tracking_data_extension(tracking_data_format: str) -> str:
+    """Returns the file extension of a tracking data format.
+    :param tracking_data_format: format of the tracking data
+                                 --> 'key4hep slcio', 'key4hep csv', 'simplified simulation csv'
+
+    :return
+        file extension including the dot
+    """
+    if tracking_data_format in ['key4hep csv', 'simplified simulation csv']:
+        return '.csv'
+    elif tracking_data_format == 'key4hep slcio':
+        return '.slcio'
+    print(f'Tracking data format {tracking_data_format} not supported!')
+    print('Exiting...')
+    exit()
+
+
+def find_tracking_data_files(tracking_data_path: str,
+                             tracking_data_format: str) -> list[str]:
+    """Returns the tracking data files of a directory or a glob pattern, e.g. <folder>/e0gpc_7.0_*_sl.csv.
+    :param tracking_data_path: directory or glob pattern
+    :param tracking_data_format: format of the tracking data, for directories only files with the matching extension
+                                 are used
+
+    :return
+        sorted list of files
+    """
+    if os.path.isdir(tracking_data_path):
+        extension = get_tracking_data_extension(tracking_data_format)
+        return sorted([os.path.join(tracking_data_path, file) for file in os.listdir(tracking_data_path)
+                       if file.endswith(extension) and os.path.isfile(os.path.join(tracking_data_path, file))])
+    return sorted([file for file in glob.glob(tracking_data_path) if os.path.isfile(file)])
+
+
+def load_file(tracking_data_file: str,
+              tracking_data_format: str,
+              write_cache: bool,
+              refresh_cache: bool) -> HitTable | int:
+    """Loads a single file inside a worker process.
+    :param tracking_data_file: tracking data file
+    :param tracking_data_format: format of the tracking data
+    :param write_cache: if True, the hits are written into the binary hit cache and only their number is returned
+    :param refresh_cache: if True, existing caches are rewritten
+
+    :return
+        HitTable object or number of hits if write_cache is True
+    """
+    if write_cache:
+        return len(load_data(tracking_data_file, tracking_data_format, refresh_cache=refresh_cache))
+    return parse_tracking_data(tracking_data_file, tracking_data_format)
+
+
+def load_tracking_data_files(tracking_data_files: list[str],
+                             tracking_data_format: str,
+                             num_workers: int | None = None,
+                             write_cache: bool = False,
+                             refresh_cache: bool = False) -> dict[str, HitTable]:
+    """Parses tracking data files in a process pool and reports the throughput.
+    :param tracking_data_files: list of tracking data files
+    :param tracking_data_format: format of the tracking data
+                                 --> 'key4hep slcio', 'key4hep csv', 'simplified simulation csv'
+    :param num_workers: number of processes, default is the number of CPUs
+    :param write_cache: if True, the workers write the hits into the binary hit cache of each file and the returned
+                        tables are opened memory-mapped from the cache instead of being sent between processes
+    :param refresh_cache: if True, existing caches are rewritten, only used together with write_cache
+
+    :return
+        {<tracking data file>: <HitTable>} in the order of the given files
+    """
+    # validates the format before any worker is started
+    get_tracking_data_extension(tracking_data_format)
+
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        results = list(executor.map(load_file,
+                                    tracking_data_files,
+                                    [tracking_data_format] * len(tracking_data_files),
+                                    [write_cache] * len(tracking_data_files),
+                                    [refresh_cache] * len(tracking_data_files)))
+    end = time.time()
+
+    if write_cache:
+        hit_tables = {file: load_data(file, tracking_data_format) for file in tracking_data_files}
+    else:
+        hit_tables = dict(zip(tracking_data_files, results))
+
+    num_hits = sum([len(hit_table) for hit_table in hit_tables.values()])
+    elapsed = end - start
+    hits_per_second = num_hits / elapsed if elapsed > 0 else float('inf')
+    print(f'Loaded {num_hits} hits from {len(tracking_data_files)} files in {hms_string(elapsed)} '
+          f'({hits_per_second:.0f} hits/s)')
+
+    return hit_tables
@@ -1,7 +1,11 @@
 import numpy as np
 import csv
-from pattern.detector_hit import DetectorHit
+
+from itertools import islice
+
+from pattern.hit_table import HitTable
 from pattern.multiplet import Multiplet
+from utility.file_cache import file_fingerprint, load_arrays, save_arrays
 
 try:
     from pyLCIO import IMPL, IOIMPL, UTIL, EVENT
@@ -10,6 +14,16 @@ except ImportError:
     print('pyLCIO not available in the environment!')
 
 
+# cell id layout used for the ACTS Kalman Filter for LUXE inside key4hep, fields are ordered from the lowest bit:
+# system (1 bit) = 0, side (1 bit) = 1, layer (3 bits), module (5 bits)
+CELL_ID_ENCODING = 'system:1,side:1,layer:3,module:5,sensor:0,x:32:-16,y:-16'
+CELL_ID_SIDE = 1 << 1
+CELL_ID_LAYER_SHIFT = 2
+CELL_ID_LAYER_MASK = 0b111
+CELL_ID_MODULE_SHIFT = 5
+CELL_ID_MODULE_MASK = 0b11111
+
+
 def get_simplified_simulation_csv_format() -> list[str]:
     """Returns list of strings matching the key4hep_csv header
     :return
@@ -26,6 +40,26 @@ def get_simplified_simulation_csv_format() -> list[str]:
             'particle_energy']
 
 
+def write_simplified_simulation_csv(tracking_data_file: str,
+                                    hit_table: HitTable) -> None:
+    """Writes hits into a .csv file in the simplified simulation format.
+    :param tracking_data_file: .csv file to write
+    :param hit_table: HitTable object
+    """
+    with open(tracking_data_file, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(get_simplified_simulation_csv_format())
+        writer.writerows(zip(hit_table.hit_id.tolist(),
+                             hit_table.x.tolist(),
+                             hit_table.y.tolist(),
+                             hit_table.z.tolist(),
+                             hit_table.layer_id.tolist(),
+                             hit_table.module_id.tolist(),
+                             hit_table.is_signal.tolist(),
+                             hit_table.particle_id.tolist(),
+                             hit_table.particle_energy.tolist()))
+
+
 def get_key4hep_csv_format() -> list[str]:
     """Returns list of strings matching the key4hep_csv header
     :return
@@ -54,77 +88,341 @@ def get_key4hep_csv_format() -> list[str]:
 
 
 def load_data(tracking_data_file: str,
-              tracking_data_format: str) -> list[DetectorHit]:
-    """Handles the data loading and picks the correct function according to the data format
+              tracking_data_format: str,
+              use_cache: bool = True,
+              refresh_cache: bool = False) -> HitTable:
+    """Handles the data loading and picks the correct function according to the data format. The parsed hits are
+    stored in a binary sidecar folder <tracking_data_file>.hit_cache, which is opened memory-mapped by later calls as
+    long as path, size, modification time and format of the tracking data file are unchanged.
     
     :param tracking_data_file:    tracking dat file
     :param tracking data format:  format of the tracking data 
                                   --> 'key4hep slcio', 'key4hep csv', 'simplified simulation csv'
-        
+    :param use_cache:             if False, the file is parsed and no cache is read or written
+    :param refresh_cache:         if True, an existing cache is ignored and rewritten
+
+    :return
+        HitTable object
     """
+    if not use_cache:
+        return parse_tracking_data(tracking_data_file, tracking_data_format)
+
+    cache_folder = get_hit_cache_folder(tracking_data_file)
+    fingerprint = file_fingerprint(tracking_data_file, tracking_data_format)
+    if not refresh_cache:
+        cached_columns = load_arrays(cache_folder, fingerprint)
+        if cached_columns is not None:
+            print(f"Using cached hits from {cache_folder.split('/')[-1]}")
+            return HitTable(**cached_columns)
+
+    hit_table = parse_tracking_data(tracking_data_file, tracking_data_format)
+    save_arrays(cache_folder, fingerprint, hit_table.columns())
+    return hit_table
+
+
+def get_hit_cache_folder(tracking_data_file: str) -> str:
+    """Returns the folder of the binary hit cache of a tracking data file.
+    :param tracking_data_file: tracking data file
 
+    :return
+        path of the cache folder
+    """
+    return f'{tracking_data_file}.hit_cache'
+
+
+def parse_tracking_data(tracking_data_file: str,
+                        tracking_data_format: str) -> HitTable:
+    """Parses a tracking data file with the loader matching the data format.
+
+    :param tracking_data_file:    tracking dat file
+    :param tracking data format:  format of the tracking data
+                                  --> 'key4hep slcio', 'key4hep csv', 'simplified simulation csv'
+
+    :return
+        HitTable object
+    """
     if tracking_data_format == 'simplified simulation csv':
         return load_tracking_data_from_simplified_simulation_csv(tracking_data_file)
     elif tracking_data_format == 'key4hep csv':
         return load_tracking_data_from_key4hep_csv(tracking_data_file)
     elif tracking_data_format == 'key4hep slcio':
         return load_tracking_data_from_slcio(tracking_data_file)
+    else:
+        print(f'Tracking data format {tracking_data_format} not supported!')
+        print('Exiting...')
+        exit()
 
 
-def load_tracking_data_from_simplified_simulation_csv(tracking_data_file: str) -> list[DetectorHit]:
-    """Loads tracking data from .csv file and returns a list of DetectorHit objects created from the file entries.
-    :param tracking_data_file: .csv tracking data file
+def hit_table_from_rows(rows: list[tuple]) -> HitTable:
+    """Creates a HitTable from a list of rows, each row holding the values in the order of HitTable.fields.
+    :param rows: list of tuples (hit_id, x, y, z, layer_id, module_id, cell_id, particle_id, is_signal,
+                                 particle_energy)
+
+    :return
+        HitTable object
+    """
+    if len(rows) == 0:
+        return HitTable.empty()
+    return HitTable(*zip(*rows))
+
+
+def read_csv_columns(tracking_data_file: str,
+                     columns: dict[str, type]) -> dict[str, np.ndarray | None]:
+    """Reads the requested columns of a .csv file in one pass into typed arrays. The column positions are resolved
+    once from the header line. The time is spent in the tokenizer of np.loadtxt, 1.4 to 1.8 s for a key4hep file with
+    1M rows and 20 columns, later calls of load_data use the hit cache.
+    :param tracking_data_file: .csv file with one line of header
+    :param columns: {<column name>: <dtype>}
 
     :return:
-        list of DetectorHit objects
+        {<column name>: <array>}, None for columns not present in the header
     """
-    detector_hits = []
     with open(tracking_data_file, 'r') as file:
-        csv_reader = csv.reader(file)
-        _ = next(csv_reader)  # access header, csv files should consist of one line of header
+        header = next(csv.reader(file))  # csv files should consist of one line of header
+        return parse_csv_lines(file, header, columns)
+
+
+def parse_csv_lines(lines,
+                    header: list[str],
+                    columns: dict[str, type]) -> dict[str, np.ndarray | None]:
+    """Parses .csv lines without header into typed arrays of the requested columns.
+    :param lines: open file positioned after the header or list of lines
+    :param header: column names of the .csv file
+    :param columns: {<column name>: <dtype>}
+
+    :return:
+        {<column name>: <array>}, None for columns not present in the header
+    """
+    available_columns = [name for name in columns.keys() if name in header]
+    data = np.loadtxt(lines,
+                      delimiter=',',
+                      usecols=[header.index(name) for name in available_columns],
+                      dtype=[(name, columns[name]) for name in available_columns],
+                      ndmin=1)
+
+    return {name: data[name] if name in available_columns else None for name in columns.keys()}
+
+
+def get_simplified_simulation_csv_columns() -> dict[str, type]:
+    """Returns the columns of a simplified simulation csv file needed for a HitTable and their types.
+    :return
+        {<column name>: <dtype>}
+    """
+    return {'hit_ID': np.int64,
+            'x': np.float64,
+            'y': np.float64,
+            'z': np.float64,
+            'layer_ID': np.int32,
+            'module_ID': np.int32,
+            'particle_ID': np.int64,
+            'particle_energy': np.float64}
+
+
+def get_key4hep_csv_columns() -> dict[str, type]:
+    """Returns the columns of a key4hep csv file needed for a HitTable and their types.
+    :return
+        {<column name>: <dtype>}
+    """
+    return {'index': np.int64,
+            'tx': np.float64,
+            'ty': np.float64,
+            'tz': np.float64,
+            'layer_id': np.int32,
+            'module_id': np.int32,
+            'particle_id': np.int64}
 
-        for row in csv_reader:
-            hit = from_simplified_simulation(row)
-            detector_hits.append(hit)
 
-    return detector_hits
+def hit_table_from_simplified_simulation_columns(data: dict[str, np.ndarray | None]) -> HitTable:
+    """Creates a HitTable from the columns of a simplified simulation csv file.
+    :param data: {<column name>: <array>} as returned by read_csv_columns
 
+    :return:
+        HitTable object
+    """
+    # old versions don't have layer_ID and module_ID matching key4hep sample --> filled with -1
+    cell_id = None
+    if data['layer_ID'] is not None and data['module_ID'] is not None:
+        cell_id = get_cell_ids(data['module_ID'], data['layer_ID'])
+
+    return HitTable(hit_id=data['hit_ID'],
+                    x=data['x'],
+                    y=data['y'],
+                    z=data['z'],
+                    layer_id=data['layer_ID'],
+                    module_id=data['module_ID'],
+                    cell_id=cell_id,
+                    particle_id=data['particle_ID'],
+                    is_signal=None,  # all hits are treated as signal
+                    particle_energy=data['particle_energy'])
+
+
+def hit_table_from_key4hep_columns(data: dict[str, np.ndarray | None]) -> HitTable:
+    """Creates a HitTable from the columns of a key4hep csv file.
+    :param data: {<column name>: <array>} as returned by read_csv_columns
 
-def load_tracking_data_from_key4hep_csv(tracking_data_file: str) -> list[DetectorHit]:
-    """Loads tracking data from .csv file and returns a list of DetectorHit objects created from the file entries.
+    :return:
+        HitTable object
+    """
+    # positions are given in mm
+    return HitTable(hit_id=data['index'],
+                    x=np.around(1e-3 * data['tx'], 8),
+                    y=np.around(1e-3 * data['ty'], 8),
+                    z=np.around(1e-3 * data['tz'], 8),
+                    layer_id=data['layer_id'],
+                    module_id=data['module_id'],
+                    cell_id=get_cell_ids(data['module_id'], data['layer_id']),
+                    particle_id=data['particle_id'],
+                    is_signal=None)  # all hits are treated as signal
+
+
+def load_tracking_data_from_simplified_simulation_csv(tracking_data_file: str) -> HitTable:
+    """Loads tracking data from .csv file and returns a HitTable created from the file entries.
     :param tracking_data_file: .csv tracking data file
 
     :return:
-        list of DetectorHit objects
+        HitTable object
     """
-    detector_hits = []
-    with open(tracking_data_file, 'r') as file:
-        csv_reader = csv.reader(file)
-        _ = next(csv_reader)  # access header, csv files should consist of one line of header
+    return hit_table_from_simplified_simulation_columns(read_csv_columns(tracking_data_file,
+                                                                         get_simplified_simulation_csv_columns()))
 
-        for row in csv_reader:
-            hit = from_key4hep_csv(row)
-            detector_hits.append(hit)
 
-    return detector_hits
+def load_tracking_data_from_key4hep_csv(tracking_data_file: str) -> HitTable:
+    """Loads tracking data from .csv file and returns a HitTable created from the file entries.
+    :param tracking_data_file: .csv tracking data file
+
+    :return:
+        HitTable object
+    """
+    return hit_table_from_key4hep_columns(read_csv_columns(tracking_data_file, get_key4hep_csv_columns()))
+
 
+def iterate_events(tracking_data_file: str,
+                   tracking_data_format: str,
+                   as_table: bool = True,
+                   chunk_size: int = 100000):
+    """Generator yielding the hits of one event at a time, so files with many bunch crossings can be processed with
+    bounded memory. In .slcio files every LCIO event is an event. In .csv files the rows of an event are expected to
+    be consecutive and labelled by an 'event_ID' (simplified simulation) or 'event_id' (key4hep) column, files without
+    such a column hold exactly one event.
 
-def load_tracking_data_from_slcio(tracking_data_file: str) -> list[DetectorHit]:
-    """Loads tracking data from .csv file and returns a list of DetectorHit objects created from the file entries.
+    :param tracking_data_file:    tracking dat file
+    :param tracking data format:  format of the tracking data
+                                  --> 'key4hep slcio', 'key4hep csv', 'simplified simulation csv'
+    :param as_table:              if True, events are yielded as HitTable, else as list of DetectorHit objects
+    :param chunk_size:            number of .csv lines parsed at once
+
+    :return
+        generator of HitTable objects or lists of DetectorHit objects
+    """
+    if tracking_data_format == 'simplified simulation csv':
+        events = iterate_csv_events(tracking_data_file,
+                                    get_simplified_simulation_csv_columns(),
+                                    'event_ID',
+                                    hit_table_from_simplified_simulation_columns,
+                                    chunk_size)
+    elif tracking_data_format == 'key4hep csv':
+        events = iterate_csv_events(tracking_data_file,
+                                    get_key4hep_csv_columns(),
+                                    'event_id',
+                                    hit_table_from_key4hep_columns,
+                                    chunk_size)
+    elif tracking_data_format == 'key4hep slcio':
+        events = iterate_slcio_events(tracking_data_file)
+    else:
+        print(f'Tracking data format {tracking_data_format} not supported!')
+        print('Exiting...')
+        exit()
+
+    for hit_table in events:
+        if as_table:
+            yield hit_table
+        else:
+            yield hit_table.to_detector_hits()
+
+
+def iterate_csv_events(tracking_data_file: str,
+                       columns: dict[str, type],
+                       event_column: str,
+                       to_hit_table,
+                       chunk_size: int):
+    """Generator yielding one HitTable per event of a .csv file. The file is parsed in chunks of lines, the last and
+    possibly incomplete event of a chunk is carried over to the next one.
     :param tracking_data_file: .csv tracking data file
+    :param columns: {<column name>: <dtype>} needed for the HitTable
+    :param event_column: name of the column labelling the events
+    :param to_hit_table: function creating a HitTable from the parsed columns
+    :param chunk_size: number of lines parsed at once
+
+    :return
+        generator of HitTable objects
+    """
+    with open(tracking_data_file, 'r') as file:
+        header = next(csv.reader(file))
+
+        if event_column not in header:
+            yield to_hit_table(parse_csv_lines(file, header, columns))
+            return
+
+        columns = dict(columns, **{event_column: np.int64})
+        carried_over = None
+        while True:
+            lines = list(islice(file, chunk_size))
+            if len(lines) == 0:
+                break
+            data = parse_csv_lines(lines, header, columns)
+            if carried_over is not None:
+                data = {name: np.concatenate([carried_over[name], values]) if values is not None else None
+                        for name, values in data.items()}
+
+            event_ids = data[event_column]
+            event_starts = np.concatenate([[0], np.flatnonzero(event_ids[1:] != event_ids[:-1]) + 1])
+            for start, end in zip(event_starts[:-1], event_starts[1:]):
+                yield to_hit_table(slice_columns(data, start, end))
+            carried_over = slice_columns(data, event_starts[-1], len(event_ids))
+
+        if carried_over is not None:
+            yield to_hit_table(carried_over)
+
+
+def slice_columns(data: dict[str, np.ndarray | None],
+                  start: int,
+                  end: int) -> dict[str, np.ndarray | None]:
+    """Returns the rows [start, end) of parsed .csv columns.
+    :param data: {<column name>: <array>}
+    :param start: first row
+    :param end: end row, not included
+
+    :return
+        {<column name>: <array>}
+    """
+    return {name: values[start:end] if values is not None else None for name, values in data.items()}
+
+
+def load_tracking_data_from_slcio(tracking_data_file: str) -> HitTable:
+    """Loads tracking data from .slcio file and returns a HitTable created from the file entries. Hits of all events
+    in the file are combined.
+    :param tracking_data_file: .slcio tracking data file
 
     :return:
-        list of DetectorHit objects
+        HitTable object
+    """
+    return HitTable.concatenate(list(iterate_slcio_events(tracking_data_file)))
+
+
+def iterate_slcio_events(tracking_data_file: str):
+    """Generator yielding one HitTable per event of a .slcio file.
+    :param tracking_data_file: .slcio tracking data file
+
+    :return:
+        generator of HitTable objects
     """
-    detector_hits = []
-    
     # file reader
     reader = IOIMPL.LCFactory.getInstance().createLCReader()
     reader.open(tracking_data_file)
-    
-    # there should only be one event in the file
-    for i, event in enumerate(reader):
-        
+
+    for event in reader:
+        rows = []
+
         tracker_hits = event.getCollection('SiTrackerHits')
         relation_collection = event.getCollection('SiTrackerHitRelations')
         relation = UTIL.LCRelationNavigator(relation_collection)
@@ -153,144 +451,73 @@ def load_tracking_data_from_slcio(tracking_data_file: str) -> list[DetectorHit]:
                 particle_id = None
                 is_signal = False
 
-            hit = from_slcio(i,
-                             position,
-                             layer,
-                             particle_id,
-                             cell_id,
-                             is_signal)
-            detector_hits.append(hit)
+            rows.append(from_slcio(i,
+                                   position,
+                                   layer,
+                                   particle_id,
+                                   cell_id,
+                                   is_signal))
 
-    return detector_hits
+        yield hit_table_from_rows(rows)
+
+    reader.close()
 
 
-def from_slcio(hit_id: str,
+def from_slcio(hit_id: int,
                position: list[float, float, float],
                layer_id: int,
                particle_id: int | None,
                cell_id: int,
-               is_signal: bool) -> DetectorHit:
-    """Converts row entry of a key4hep slcio tracking data file
+               is_signal: bool) -> tuple:
+    """Converts a tracker hit of a key4hep slcio tracking data file into a HitTable row
     
-    :param simplified_sim_entry one row from a key4hep .slcio tracking file
-    
-
-    :return
-        DetectorHit object
-    """
-    hit_dictionary = {}
-    hit_dictionary.update({'hit_ID': hit_id})
-    hit_dictionary.update({'x': position[0]})
-    hit_dictionary.update({'y': position[1]})
-    hit_dictionary.update({'z': position[2]})
-
-    hit_dictionary.update({'layer_ID': layer_id})
-    
-    # not provided, set to -1
-    hit_dictionary.update({'module_ID': -1})
-    hit_dictionary.update({'is_signal': particle_id})
-
-    hit_dictionary.update({'cell_ID': cell_id})
-    hit_dictionary.update({'particle_ID': particle_id})
-    hit_dictionary.update({'is_signal': True})
-
-    # create detector hit object
-    hit = DetectorHit(hit_dictionary)
-    
-    return hit
-
-
-def from_simplified_simulation(simplified_sim_entry: list[str]) -> DetectorHit:
-    """Converts row entry of a key4hep tracking data file
-    :param simplified_sim_entry one row from a simplified simulation .csv tracking file
+    :param hit_id: index of the hit inside the tracker hit collection
+    :param position: [x, y, z] of the hit [m]
+    :param layer_id: layer of the hit
+    :param particle_id: id of the related MC particle, None if produced by a secondary
+    :param cell_id: cell id of the hit
+    :param is_signal: True if a MC particle is related to the hit
 
     :return
-        DetectorHit object
+        row in the order of HitTable.fields
     """
-    # get structure of key4hep_csv
-    fieldnames = get_simplified_simulation_csv_format()
-
-    hit_dictionary = {}
-    hit_dictionary.update({'hit_ID': simplified_sim_entry[fieldnames.index('hit_ID')]})
-    hit_dictionary.update({'x': simplified_sim_entry[fieldnames.index('x')]})
-    hit_dictionary.update({'y': simplified_sim_entry[fieldnames.index('y')]})
-    hit_dictionary.update({'z': simplified_sim_entry[fieldnames.index('z')]})
-
-    # old versions don't have layer_ID and module_ID matching key4hep sample --> rework
-    try:
-        hit_dictionary.update({'layer_ID': simplified_sim_entry[fieldnames.index('layer_ID')]})
-    except IndexError:
-        hit_dictionary.update({'layer_ID': -1})
-    try:
-        hit_dictionary.update({'module_ID': simplified_sim_entry[fieldnames.index('module_ID')]})
-    except IndexError:
-        hit_dictionary.update({'module_ID': -1})
-    hit_dictionary.update({'is_signal': simplified_sim_entry[fieldnames.index('is_signal')]})
-    hit_dictionary.update({'cell_ID': get_cell_id_simplified_simulation(simplified_sim_entry)})
-    hit_dictionary.update({'particle_ID': simplified_sim_entry[fieldnames.index('particle_ID')]})
-    hit_dictionary.update({'is_signal': True})
-
-    # create detector hit object
-    hit = DetectorHit(hit_dictionary)
-
-    return hit
-
-
-def from_key4hep_csv(key4hep_csv_entry: list[str]) -> DetectorHit:
-    """Converts row entry of a key4hep tracking data file
-    :param key4hep_csv_entry: one row from a key4hep_csv tracking file
-
-    :return
-        DetectorHit object
-    """
-    # get structure of key4hep_csv
-    fieldnames = get_key4hep_csv_format()
-
-    hit_dictionary = {}
-    hit_dictionary.update({'hit_ID': key4hep_csv_entry[fieldnames.index('index')]})
-    hit_dictionary.update({'x': np.around(1e-3 * float(key4hep_csv_entry[fieldnames.index('tx')]), 8)})
-    hit_dictionary.update({'y': np.around(1e-3 * float(key4hep_csv_entry[fieldnames.index('ty')]), 8)})
-    hit_dictionary.update({'z': np.around(1e-3 * float(key4hep_csv_entry[fieldnames.index('tz')]), 8)})
-    hit_dictionary.update({'layer_ID': key4hep_csv_entry[fieldnames.index('layer_id')]})
-    hit_dictionary.update({'module_ID': key4hep_csv_entry[fieldnames.index('module_id')]})
-    hit_dictionary.update({'cell_ID': int(get_cell_id_key4hep(key4hep_csv_entry), base=2)})
-    hit_dictionary.update({'particle_ID': key4hep_csv_entry[fieldnames.index('particle_id')]})
-    hit_dictionary.update({'is_signal': True})
-
-    # create detector hit object
-    hit = DetectorHit(hit_dictionary)
-
-    return hit
-
-
-def get_cell_id_key4hep(csv_entry: list[str]) -> str:
-    """Returns the cell id, used for ACTS Kalman Filter for LUXE inside key4hep environment for.
-    :param csv_entry: list of str with information about particle hit in detector
-
-    :return
-        concatenated string of module and stave to identify region where hit stems from
-    """
-    return f'{bin(int(csv_entry[get_key4hep_csv_format().index("module_id")]))[2:].zfill(3)}' \
-           f'{bin(int(csv_entry[get_key4hep_csv_format().index("layer_id")]))[2:].zfill(3)}10'
-
-
-def get_cell_id_simplified_simulation(csv_entry: list[str]) -> str:
-    """Returns the cell id, used for ACTS Kalman Filter for LUXE inside key4hep environment for.
-    :param csv_entry: list of str with information about particle hit in detector
+    # module is not provided, set to -1, particle_id None is stored as -1, all hits are treated as signal
+    return (int(hit_id),
+            position[0],
+            position[1],
+            position[2],
+            layer_id,
+            -1,
+            cell_id,
+            particle_id if particle_id is not None else -1,
+            True,
+            np.nan)
+
+
+def get_cell_ids(module_ids: np.ndarray,
+                 layer_ids: np.ndarray) -> np.ndarray:
+    """Returns the cell ids, used for ACTS Kalman Filter for LUXE inside key4hep environment, of all hits. The
+    layout is given by CELL_ID_ENCODING.
+    :param module_ids: module id of each hit
+    :param layer_ids: layer id of each hit
 
     :return
-        concatenated string of module and stave to identify region where hit stems from
+        integer cell id of each hit
     """
-    return f'{bin(int(csv_entry[get_simplified_simulation_csv_format().index("module_ID")]))[2:].zfill(3)}' \
-           f'{bin(int(csv_entry[get_simplified_simulation_csv_format().index("layer_ID")]))[2:].zfill(3)}10'
+    module_ids = np.asarray(module_ids, dtype=np.int64)
+    layer_ids = np.asarray(layer_ids, dtype=np.int64)
+    return ((module_ids & CELL_ID_MODULE_MASK) << CELL_ID_MODULE_SHIFT) | \
+        ((layer_ids & CELL_ID_LAYER_MASK) << CELL_ID_LAYER_SHIFT) | CELL_ID_SIDE
 
 
 def write_tracks_to_slcio_file(input_slcio_file: str,
                                multiplets: list[Multiplet],
-                               qubo_folder) -> None:
+                               qubo_folder,
+                               event_index: int = 0) -> None:
     """Writes the multiplets as additional collection into an existing slcio file.
     :param input_slcio_file: file into which the multiplets are written as tracks
     :param multiplets: listo of multiplet objects
+    :param event_index: index of the event in the input file the multiplets were reconstructed from
     """
     output_slcio_file = f'{qubo_folder}/reco_tracks.slcio'
     print(output_slcio_file)
@@ -303,6 +530,7 @@ def write_tracks_to_slcio_file(input_slcio_file: str,
     writer = IOIMPL.LCFactory.getInstance().createLCWriter()
     writer.open(output_slcio_file, EVENT.LCIO.WRITE_NEW)
 
+    reader.skipNEvents(event_index)
     event = reader.readNextEvent()
 
     # Access or modify existing collections in the event if needed
@@ -341,7 +569,7 @@ def write_tracks_to_slcio_file(input_slcio_file: str,
         tcol.addElement(trk)
 
     # Write the new event to the output file
-    new_event.setEventNumber(0)
+    new_event.setEventNumber(event_index)
     new_event.addCollection(tcol, 'TrackCandidates')
 
     writer.writeEvent(new_event)
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# increase if the layout of cached arrays changes, invalidates all existing caches
+CACHE_VERSION = 1
+
+
+def file_fingerprint(file: str,
+                     *parameters) -> str:
+    """Returns a fingerprint of a file, based on its absolute path, size and modification time and on additional
+    parameters which influence the content derived from the file (e.g. data format, binning).
+    :param file: path to file
+    :param parameters: additional parameters, converted to strings
+
+    :return
+        hex digest identifying file and parameters
+    """
+    file_stat = os.stat(file)
+    key = [CACHE_VERSION,
+           os.path.abspath(file),
+           file_stat.st_size,
+           file_stat.st_mtime_ns] + list(parameters)
+    return hashlib.sha1('|'.join([str(k) for k in key]).encode()).hexdigest()
+
+
+def load_arrays(cache_folder: str,
+                fingerprint: str,
+                mmap_mode: str | None = 'r') -> dict[str, np.ndarray] | None:
+    """Loads arrays from a cache folder if the stored fingerprint matches.
+    :param cache_folder: folder with one .npy file per array
+    :param fingerprint: expected fingerprint
+    :param mmap_mode: mode passed to np.load, 'r' opens the arrays memory-mapped and read-only
+
+    :return
+        {<name>: <array>} or None if there is no valid cache
+    """
+    try:
+        with open(os.path.join(cache_folder, 'fingerprint'), 'r') as f:
+            if f.read() != fingerprint:
+                return None
+        with open(os.path.join(cache_folder, 'arrays'), 'r') as f:
+            names = f.read().split()
+        return {name: np.load(os.path.join(cache_folder, f'{name}.npy'), mmap_mode=mmap_mode) for name in names}
+    except (OSError, ValueError):
+        return None
+
+
+def save_arrays(cache_folder: str,
+                fingerprint: str,
+                arrays: dict[str, np.ndarray]) -> bool:
+    """Stores arrays in a cache folder, an existing cache is replaced. The arrays are written into a temporary folder
+    which is moved into place afterwards, so concurrent jobs never read a partially written cache.
+    :param cache_folder: folder to store one .npy file per array
+    :param fingerprint: fingerprint identifying the content
+    :param arrays: {<name>: <array>}
+
+    :return
+        True if cache was written, else False
+    """
+    parent_folder = os.path.dirname(os.path.abspath(cache_folder))
+    try:
+        tmp_folder = tempfile.mkdtemp(dir=parent_folder, prefix='.tmp_cache_')
+    except OSError:
+        print(f'Cache folder {cache_folder} not writable, continuing without cache')
+        return False
+
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_folder, f'{name}.npy'), np.asarray(array))
+        with open(os.path.join(tmp_folder, 'arrays'), 'w') as f:
+            f.write('\n'.join(arrays.keys()))
+        with open(os.path.join(tmp_folder, 'fingerprint'), 'w') as f:
+            f.write(fingerprint)
+
+        remove_cache(cache_folder)
+        os.rename(tmp_folder, cache_folder)
+    except OSError:
+        # e.g. another job placed its cache first
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        return False
+    return True
+
+
+def remove_cache(cache_folder: str) -> None:
+    """Removes a cache folder if it exists.
+    :param cache_folder: cache folder
+    """
+    if os.path.isdir(cache_folder):
+        shutil.rmtree(cache_folder, ignore_errors=True)
@@ -5,6 +5,7 @@ import os
 import numpy as np
 from pattern.detector_hit import DetectorHit
 from pattern.multiplet import Multiplet
+from utility.data_format_handler import CELL_ID_ENCODING
  
 
 file = '/nfs/dust/luxe/user/spatarod/key4hepcsv/p0xi3BX0000/' \
@@ -16,7 +17,6 @@ reco_ambiguity_solved = 'reco_xplet_list_ambiguity_solved.npy'
 wrt = IOIMPL.LCFactory.getInstance().createLCWriter()
 wrt.open(f"{file}/ACTS", EVENT.LCIO.WRITE_NEW)
 
-string_encoding = 'system:1,side:1,layer:3,module:5,sensor:0,x:32:-16,y:-16'
 xplets = np.load(f'{file}/{reco_raw}',allow_pickle=True)
 
 for i, xplet in enumerate(xplets):
@@ -29,7 +29,7 @@ for i, xplet in enumerate(xplets):
         hit.setPosition(np.array([1e3 * x, 1e3 * y, 1e3 * z]))
         hit.setCellID0(cell_id)
         param = col.parameters()
-        param.setValue(EVENT.LCIO.CellIDEncoding, string_encoding)
+        param.setValue(EVENT.LCIO.CellIDEncoding, CELL_ID_ENCODING)
         col.addElement(hit)
             
     evt.setEventNumber(i)
@@ -0,0 +1,47 @@
+import numpy as np
+
+DOUBLET_CRITERIA = {'dx/x0': 0.04, 'dx/x0 eps': 0.01, 'dy/x0': 0.0, 'dy/x0 eps': 0.01}
+Z_REF = 3.5
+
+
+def straight_tracks(seed: int,
+                    num_tracks: int,
+                    z_layers: list[float],
+                    x0_range: tuple[float, float] = (-0.05, 0.2),
+                    slope_x_range: tuple[float, float] = (0.03, 0.05),
+                    slope_y_range: tuple[float, float] = (0., 0.),
+                    noise: float = 0.,
+                    num_random_hits: int = 0) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Straight tracks from the reference layer at Z_REF with dx/x0 around the doublet criterion, one hit per layer,
+    followed by random hits.
+    :param seed: seed of the random generator
+    :param num_tracks: number of tracks
+    :param z_layers: z of the layers
+    :param x0_range: range of x at the reference layer, includes negative x by default
+    :param slope_x_range: range of dx/x0 per z
+    :param slope_y_range: range of dy/x0 per z
+    :param noise: standard deviation of gaussian noise added to x and y of the track hits
+    :param num_random_hits: number of uniformly distributed hits on random layers
+
+    :return
+        (x, y, z, layer) of all hits, the hits of a track are consecutive
+    """
+    rng = np.random.default_rng(seed)
+    z_layers = np.asarray(z_layers)
+    x0 = rng.uniform(*x0_range, num_tracks)
+    slope_x = rng.uniform(*slope_x_range, num_tracks)
+    slope_y = rng.uniform(*slope_y_range, num_tracks)
+    z = np.tile(z_layers, num_tracks)
+    x = np.repeat(x0, len(z_layers)) * (1 + np.repeat(slope_x, len(z_layers)) * (z - Z_REF))
+    y = np.repeat(x0 * slope_y, len(z_layers)) * (z - Z_REF)
+    if noise > 0:
+        x = x + rng.normal(0, noise, len(z))
+        y = y + rng.normal(0, noise, len(z))
+    layer = np.tile(np.arange(len(z_layers)), num_tracks)
+
+    random_layer = rng.integers(0, len(z_layers), num_random_hits)
+    x = np.concatenate([x, rng.uniform(-0.05, 0.3, num_random_hits)])
+    y = np.concatenate([y, rng.uniform(-0.005, 0.005, num_random_hits)])
+    z = np.concatenate([z, z_layers[random_layer]])
+    layer = np.concatenate([layer, random_layer])
+    return x, y, z, layer
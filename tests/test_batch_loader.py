@@ -0,0 +1,53 @@
+import unittest
+import tempfile
+import os
+import sys
+sys.path.insert(0, "../src")
+
+from utility.batch_loader import find_tracking_data_files, load_tracking_data_files
+from utility.data_format_handler import get_hit_cache_folder
+
+from numba import config as numba_config
+
+# like the command line scripts, processes forking after a parallel numba call of another test module do not exit with
+# the TBB threading layer
+numba_config.THREADING_LAYER_PRIORITY = ['omp', 'workqueue', 'tbb']
+
+
+class TestBatchLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.files = []
+        for i in range(3):
+            file = os.path.join(self.folder.name, f'e0gpc_7.0_000{i}_sl.csv')
+            with open(file, 'w') as f:
+                f.write('hit_ID,x,y,z,layer_ID,module_ID,particle_ID,particle_energy\n')
+                for hit in range(i + 1):
+                    f.write(f'{hit},0.1,0.0,3.95,0,0,{hit},3.2\n')
+            self.files.append(file)
+        with open(os.path.join(self.folder.name, 'notes.txt'), 'w') as f:
+            f.write('not a tracking data file')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_find_files(self):
+        self.assertEqual(find_tracking_data_files(self.folder.name, 'simplified simulation csv'), self.files)
+        self.assertEqual(find_tracking_data_files(os.path.join(self.folder.name, 'e0gpc_7.0_000[12]_sl.csv'),
+                                                  'simplified simulation csv'), self.files[1:])
+
+    def test_load_files(self):
+        hit_tables = load_tracking_data_files(self.files, 'simplified simulation csv', num_workers=2)
+        self.assertEqual(list(hit_tables.keys()), self.files)
+        self.assertSequenceEqual([len(hit_table) for hit_table in hit_tables.values()], [1, 2, 3])
+        self.assertFalse(os.path.isdir(get_hit_cache_folder(self.files[0])))
+
+        hit_tables = load_tracking_data_files(self.files, 'simplified simulation csv', num_workers=2,
+                                              write_cache=True)
+        self.assertTrue(all([os.path.isdir(get_hit_cache_folder(file)) for file in self.files]))
+        self.assertSequenceEqual(hit_tables[self.files[2]].particle_id.tolist(), [0, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import tempfile
+import os
+import sys
+sys.path.insert(0, "../src")
+
+from utility.data_format_handler import load_data, get_key4hep_csv_format, get_hit_cache_folder, iterate_events, \
+    get_cell_ids
+
+
+class TestDataFormatHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+        self.simplified_simulation_file = os.path.join(self.folder.name, 'simplified.csv')
+        with open(self.simplified_simulation_file, 'w') as f:
+            f.write('hit_ID,x,y,z,layer_ID,module_ID,is_signal,particle_ID,particle_energy\n'
+                    '0,0.1,0.0,3.95,1,0,True,5,3.2\n'
+                    '1,0.2,0.001,4.05,3,1,True,5,3.2\n')
+
+        self.key4hep_file = os.path.join(self.folder.name, 'key4hep.csv')
+        with open(self.key4hep_file, 'w') as f:
+            f.write(','.join(get_key4hep_csv_format()) + '\n')
+            f.write('4503599627370497,0,0,2,1,3,0,123.456789012,-1.5,4062.0,0,0,0,1,1.5,0,0,0,0,7\n')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_simplified_simulation_csv(self):
+        hit_table = load_data(self.simplified_simulation_file, 'simplified simulation csv')
+        self.assertSequenceEqual(hit_table.hit_id.tolist(), [0, 1])
+        self.assertSequenceEqual(hit_table.z.tolist(), [3.95, 4.05])
+        self.assertSequenceEqual(hit_table.layer_id.tolist(), [1, 3])
+        self.assertSequenceEqual(hit_table.cell_id.tolist(), [0b00000110, 0b00101110])
+        self.assertSequenceEqual(hit_table.particle_energy.tolist(), [3.2, 3.2])
+
+    def test_key4hep_csv(self):
+        hit_table = load_data(self.key4hep_file, 'key4hep csv')
+        self.assertEqual(len(hit_table), 1)
+        self.assertEqual(hit_table.hit_id[0], 7)
+        self.assertEqual(hit_table.particle_id[0], 4503599627370497)  # no precision loss for large ids
+        self.assertEqual(hit_table.x[0], 0.12345679)
+        self.assertEqual(hit_table.y[0], -0.0015)
+        self.assertEqual(hit_table.z[0], 4.062)
+        self.assertEqual(hit_table.cell_id[0], 0b01101010)
+
+    def test_cell_ids(self):
+        # module in bits 5-9, layer in bits 2-4, side bit set
+        self.assertSequenceEqual(get_cell_ids([0, 3, 8], [0, 2, 7]).tolist(),
+                                 [0b0000000010, 0b0001101010, 0b0100011110])
+
+    def test_hit_cache(self):
+        hit_table = load_data(self.key4hep_file, 'key4hep csv', use_cache=False)
+        self.assertFalse(os.path.isdir(get_hit_cache_folder(self.key4hep_file)))
+
+        load_data(self.key4hep_file, 'key4hep csv')
+        self.assertTrue(os.path.isdir(get_hit_cache_folder(self.key4hep_file)))
+        cached_hit_table = load_data(self.key4hep_file, 'key4hep csv')
+        self.assertEqual(cached_hit_table.x[0], hit_table.x[0])
+        self.assertEqual(cached_hit_table.particle_id[0], hit_table.particle_id[0])
+
+        refreshed_hit_table = load_data(self.key4hep_file, 'key4hep csv', refresh_cache=True)
+        self.assertEqual(refreshed_hit_table.z[0], hit_table.z[0])
+
+    def test_iterate_events(self):
+        multi_event_file = os.path.join(self.folder.name, 'multi_event.csv')
+        with open(multi_event_file, 'w') as f:
+            f.write('event_ID,hit_ID,x,y,z,layer_ID,module_ID,particle_ID,particle_energy\n')
+            for event, num_hits in enumerate([3, 1, 4]):
+                for hit in range(num_hits):
+                    f.write(f'{event},{hit},0.1,0.0,{3.95 + 0.1 * hit},{hit},0,{event},3.2\n')
+
+        # chunks smaller than and not aligned with the events
+        events = list(iterate_events(multi_event_file, 'simplified simulation csv', chunk_size=2))
+        self.assertSequenceEqual([len(event) for event in events], [3, 1, 4])
+        self.assertSequenceEqual(events[2].hit_id.tolist(), [0, 1, 2, 3])
+        self.assertSequenceEqual(events[2].particle_id.tolist(), [2, 2, 2, 2])
+
+        hits = next(iterate_events(multi_event_file, 'simplified simulation csv', as_table=False))
+        self.assertEqual([hit.hit_id for hit in hits], ['0', '1', '2'])
+
+        # files without event column hold one event
+        events = list(iterate_events(self.simplified_simulation_file, 'simplified simulation csv'))
+        self.assertEqual(len(events), 1)
+        self.assertSequenceEqual(events[0].hit_id.tolist(), [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import tempfile
+import os
+import sys
+sys.path.insert(0, "../src")
+
+from pattern.detector_geometry import Geometry
+
+
+class TestDetectorGeometry(unittest.TestCase):
+
+    def setUp(self):
+        self.geometry = Geometry.load('../geometry/LUXE_key4hep.csv', use_cache=False)
+
+    def test_layers(self):
+        self.assertEqual(self.geometry.num_layers(), 8)
+        self.assertEqual(list(self.geometry.layer_z), sorted(set(self.geometry.z.tolist())))
+        self.assertEqual(self.geometry.z_to_layer[3.950], 0)
+        self.assertEqual(self.geometry.z_to_layer[4.262], 7)
+        self.assertSequenceEqual(self.geometry.layer_at_z([3.950, 4.262, 4.0621, 3.0]).tolist(), [0, 7, -1, -1])
+        self.assertSequenceEqual(self.geometry.layer_at_z([4.0621], tolerance=1e-3).tolist(), [3])
+
+    def test_chip_lookup(self):
+        layer = self.geometry.z_to_layer[3.962]
+        chip = self.geometry.chip_at([0.06, 0.09, 0.0828, 0.06, 0.0], [0.0, 0.001, 0.0, 0.01, 0.0], [layer] * 5)
+        self.assertSequenceEqual(chip[:2].tolist(), [0, 1])
+        self.assertSequenceEqual(chip[2:].tolist(), [-1, -1, -1])  # gap between chips, outside in y and x
+        self.assertEqual(self.geometry.chip_layer[0], layer)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as folder:
+            geometry_file = os.path.join(folder, 'geometry.csv')
+            with open('../geometry/LUXE_sl.csv', 'r') as source, open(geometry_file, 'w') as target:
+                target.write(source.read())
+            geometry = Geometry.load(geometry_file)
+            self.assertTrue(os.path.isdir(f'{geometry_file}.geometry_cache'))
+            cached_geometry = Geometry.load(geometry_file)
+            self.assertSequenceEqual(cached_geometry.name.tolist(), geometry.name.tolist())
+            self.assertSequenceEqual(cached_geometry.layer_z.tolist(), geometry.layer_z.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import numpy as np
+import sys
+sys.path.insert(0, "../src")
+
+from math_functions.checks import is_valid_doublet
+from pattern.hit_table import HitTable
+from pattern_building.doublet_engine import find_doublets, find_doublets_in_groups, find_truth_doublets
+from straight_tracks import DOUBLET_CRITERIA, Z_REF, straight_tracks
+
+
+class TestDoubletEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.configuration = {'doublet': DOUBLET_CRITERIA}
+        self.z_layers = [3.9, 3.91, 4.0, 4.01]
+        self.z_ref = Z_REF
+        # straight tracks with dx/x0 around the criterion, including tracks at negative x, and random hits
+        x, y, z, layer = straight_tracks(3, 60, self.z_layers, slope_x_range=(0.025, 0.055),
+                                         slope_y_range=(-0.015, 0.015), num_random_hits=100)
+
+        self.hit_table = HitTable(hit_id=np.arange(len(x)), x=x, y=y, z=z)
+        self.layer = layer
+
+    def brute_force(self, max_layer_distance):
+        hits = self.hit_table.to_detector_hits()
+        doublets = set()
+        for i, hit_1 in enumerate(hits):
+            for j, hit_2 in enumerate(hits):
+                if 1 <= self.layer[j] - self.layer[i] <= max_layer_distance and \
+                        is_valid_doublet(hit_1, hit_2, self.z_ref, self.configuration):
+                    doublets.add((i, j))
+        return doublets
+
+    def test_simplified_setup(self):
+        first_hits, second_hits = find_doublets(self.hit_table.x, self.hit_table.y, self.hit_table.z, self.layer,
+                                                len(self.z_layers), 'simplified', self.z_ref,
+                                                self.configuration['doublet'])
+        doublets = set(zip(first_hits.tolist(), second_hits.tolist()))
+        self.assertEqual(len(doublets), len(first_hits))
+        self.assertGreater(len(doublets), 0)
+        self.assertEqual(doublets, self.brute_force(1))
+
+    def test_full_setup(self):
+        first_hits, second_hits = find_doublets(self.hit_table.x, self.hit_table.y, self.hit_table.z, self.layer,
+                                                len(self.z_layers), 'full', self.z_ref,
+                                                self.configuration['doublet'])
+        doublets = set(zip(first_hits.tolist(), second_hits.tolist()))
+        self.assertEqual(len(doublets), len(first_hits))
+        self.assertGreater(len(doublets), 0)
+        self.assertEqual(doublets, self.brute_force(2))
+
+    def test_segment_groups(self):
+        # two segments per layer split at x = 0.1, the lower segment of layer 1 has no targets, the lower segment of
+        # layer 2 only targets the lower segment of layer 3 and the last layer has no targets
+        segment = 2 * self.layer + (self.hit_table.x > 0.1)
+        target_indptr = np.array([0, 2, 3, 3, 5, 6, 7, 7, 7])
+        target_indices = np.array([2, 3, 3, 4, 5, 6, 7])
+        first_hits, second_hits = find_doublets_in_groups(self.hit_table.x, self.hit_table.y, self.hit_table.z,
+                                                          segment, target_indptr, target_indices, self.z_ref,
+                                                          self.configuration['doublet'])
+        doublets = set(zip(first_hits.tolist(), second_hits.tolist()))
+        self.assertEqual(len(doublets), len(first_hits))
+        expected = {(i, j) for i, j in self.brute_force(1)
+                    if segment[j] in target_indices[target_indptr[segment[i]]:target_indptr[segment[i] + 1]]}
+        self.assertGreater(len(expected), 0)
+        self.assertLess(len(expected), len(self.brute_force(1)))
+        self.assertEqual(doublets, expected)
+
+    def test_truth_doublets(self):
+        rng = np.random.default_rng(5)
+        particle_id = rng.integers(-1, 6, 80)
+        layer = rng.integers(0, 8, 80)
+        for max_layer_distance in [1, 2]:
+            expected = {(i, j) for i in range(80) for j in range(80)
+                        if particle_id[i] == particle_id[j] and 1 <= layer[j] - layer[i] <= max_layer_distance}
+            first_hits, second_hits = find_truth_doublets(particle_id, layer, max_layer_distance)
+            self.assertEqual(len(first_hits), len(expected))
+            self.assertEqual(set(zip(first_hits.tolist(), second_hits.tolist())), expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import numpy as np
+import pickle
+import sys
+from unittest import mock
+sys.path.insert(0, "../src")
+
+import pattern.detector_hit
+from pattern.detector_hit import DetectorHit
+from pattern.hit_table import HitTable
+
+
+class OldDetectorHit:
+    """DetectorHit layout before __slots__, pickled with the instance __dict__ as state.
+    """
+    def __init__(self, state):
+        self.__dict__.update(state)
+
+
+OldDetectorHit.__qualname__ = 'DetectorHit'
+OldDetectorHit.__module__ = 'pattern.detector_hit'
+
+
+class TestHitTable(unittest.TestCase):
+
+    def setUp(self):
+        self.hit_table = HitTable(hit_id=[0, 1, 2],
+                                  x=[0.1, 0.2, 0.3],
+                                  y=[0.0, 0.001, -0.001],
+                                  z=[3.95, 4.05, 3.95],
+                                  layer_id=[1, 3, 1],
+                                  particle_id=[5, 5, -1])
+
+    def test_fill_values(self):
+        self.assertEqual(len(self.hit_table), 3)
+        self.assertSequenceEqual(self.hit_table.module_id.tolist(), [-1, -1, -1])
+        self.assertTrue(np.all(self.hit_table.is_signal))
+        self.assertTrue(np.all(np.isnan(self.hit_table.particle_energy)))
+
+    def test_detector_hit_view(self):
+        hit = self.hit_table.hit(1)
+        self.assertEqual(hit.hit_id, '1')
+        self.assertEqual(hit.z, 4.05)
+        self.assertEqual(hit.particle_id, 5)
+        self.assertIsNone(hit.particle_energy)
+        self.assertIsNone(self.hit_table.hit(2).particle_id)
+
+        hits = self.hit_table.to_detector_hits()
+        self.assertEqual([h.hit_id for h in hits], ['0', '1', '2'])
+        self.assertEqual([h.layer_id for h in hits], [1, 3, 1])
+
+    def test_take_and_concatenate(self):
+        first_layer = self.hit_table.take(self.hit_table.layer_id == 1)
+        self.assertSequenceEqual(first_layer.hit_id.tolist(), [0, 2])
+
+        combined = HitTable.concatenate([first_layer, self.hit_table])
+        self.assertEqual(len(combined), 5)
+        self.assertSequenceEqual(combined.x.tolist(), [0.1, 0.3, 0.1, 0.2, 0.3])
+
+    def test_detector_hit_immutable_and_pickled(self):
+        hit = self.hit_table.hit(0)
+        with self.assertRaises(AttributeError):
+            hit.x = 1.0
+        self.assertFalse(hasattr(hit, '__dict__'))
+
+        unpickled_hit = pickle.loads(pickle.dumps(hit))
+        self.assertEqual((unpickled_hit.hit_id, unpickled_hit.x, unpickled_hit.particle_id), ('0', 0.1, 5))
+
+    def test_detector_hit_old_pickle_layout(self):
+        state = {'hit_dictionary': {'hit_ID': 7, 'x': 0.1}, 'hit_id': '7', 'x': 0.1, 'y': 0.0, 'z': 3.95,
+                 'layer_id': 1, 'module_id': 2, 'cell_id': 3, 'particle_id': 5, 'is_signal': True,
+                 'particle_energy': 1.5}
+        with mock.patch.object(pattern.detector_hit, 'DetectorHit', OldDetectorHit):
+            old_pickle = pickle.dumps([OldDetectorHit(state)])
+        hit = pickle.loads(old_pickle)[0]
+        self.assertIsInstance(hit, DetectorHit)
+        self.assertEqual((hit.hit_id, hit.x, hit.layer_id, hit.particle_id, hit.is_signal, hit.particle_energy),
+                         ('7', 0.1, 1, 5, True, 1.5))
+        self.assertFalse(hasattr(hit, 'hit_dictionary'))
+        with self.assertRaises(AttributeError):
+            hit.x = 1.0
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+import sys
+sys.path.insert(0, "../src")
+
+from pattern_building.doublet_engine import find_doublets, find_doublets_in_groups
+from pattern_building.triplet_engine import find_triplets
+from pattern_building.multiplet_kernel import find_multiplets, find_multiplets_in_groups
+from straight_tracks import DOUBLET_CRITERIA, Z_REF, straight_tracks
+
+
+class TestMultipletKernel(unittest.TestCase):
+
+    def test_kernel_matches_engines(self):
+        z_layers = [3.9, 3.91, 4.0, 4.01, 4.1]
+        max_scattering = 0.01
+        x, y, z, layer = straight_tracks(5, 50, z_layers, noise=2e-5)
+        layer[::17] = -1
+
+        for setup in ['simplified', 'full']:
+            first_hits, second_hits = find_doublets(x, y, z, layer, len(z_layers), setup, Z_REF, DOUBLET_CRITERIA)
+            first_doublets, second_doublets = find_triplets(first_hits, second_hits, x, y, z, max_scattering)
+            doublets = set(zip(first_hits.tolist(), second_hits.tolist()))
+            triplets = set(zip(first_hits[first_doublets].tolist(),
+                               second_hits[first_doublets].tolist(),
+                               second_hits[second_doublets].tolist()))
+
+            kernel_first_hits, kernel_second_hits, kernel_first_doublets, kernel_second_doublets = \
+                find_multiplets(x, y, z, layer, len(z_layers), setup, Z_REF, DOUBLET_CRITERIA, max_scattering)
+            self.assertEqual(set(zip(kernel_first_hits.tolist(), kernel_second_hits.tolist())), doublets)
+            self.assertEqual(set(zip(kernel_first_hits[kernel_first_doublets].tolist(),
+                                     kernel_second_hits[kernel_first_doublets].tolist(),
+                                     kernel_second_hits[kernel_second_doublets].tolist())), triplets)
+            self.assertEqual(len(kernel_first_doublets), len(triplets))
+            self.assertGreater(len(triplets), 0)
+
+        # two segments per layer split at x = 0.1, the lower segment of layer 1 has no targets
+        segment = np.where(layer >= 0, 2 * layer + (x > 0.1), -1)
+        target_indptr = np.array([0, 2, 4, 4, 6, 8, 10, 10, 10, 10, 10])
+        target_indices = np.array([2, 3, 2, 3, 4, 5, 6, 7, 6, 7])
+        first_hits, second_hits = find_doublets_in_groups(x, y, z, segment, target_indptr, target_indices, Z_REF,
+                                                          DOUBLET_CRITERIA)
+        first_doublets, second_doublets = find_triplets(first_hits, second_hits, x, y, z, max_scattering)
+        triplets = set(zip(first_hits[first_doublets].tolist(), second_hits[first_doublets].tolist(),
+                           second_hits[second_doublets].tolist()))
+        self.assertGreater(len(triplets), 0)
+        kernel_first_hits, kernel_second_hits, kernel_first_doublets, kernel_second_doublets = \
+            find_multiplets_in_groups(x, y, z, segment, target_indptr, target_indices, Z_REF, DOUBLET_CRITERIA,
+                                      max_scattering)
+        self.assertEqual(set(zip(kernel_first_hits.tolist(), kernel_second_hits.tolist())),
+                         set(zip(first_hits.tolist(), second_hits.tolist())))
+        self.assertEqual(set(zip(kernel_first_hits[kernel_first_doublets].tolist(),
+                                 kernel_second_hits[kernel_first_doublets].tolist(),
+                                 kernel_second_hits[kernel_second_doublets].tolist())), triplets)
+
+
+if __name__ == '__main__':
+    unittest.main()
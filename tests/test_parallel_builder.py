@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+import sys
+sys.path.insert(0, "../src")
+
+from pattern_building.doublet_engine import find_doublets, find_doublets_in_groups
+from pattern_building.triplet_engine import find_triplets
+from pattern_building.parallel_builder import find_multiplets_parallel, find_multiplets_parallel_in_groups
+from straight_tracks import DOUBLET_CRITERIA, Z_REF, straight_tracks
+
+from numba import config as numba_config
+
+# like the command line scripts, processes forking after a parallel numba call of another test module do not exit with
+# the TBB threading layer
+numba_config.THREADING_LAYER_PRIORITY = ['omp', 'workqueue', 'tbb']
+
+
+class TestParallelBuilder(unittest.TestCase):
+
+    def test_parallel_matches_sequential(self):
+        z_layers = [3.9, 3.91, 4.0, 4.01, 4.1]
+        max_scattering = 0.01
+        x, y, z, layer = straight_tracks(6, 80, z_layers, x0_range=(0.01, 0.2), noise=2e-5)
+        layer[::13] = -1
+        empty_layer = np.where(layer == 2, -1, layer)
+
+        for setup, hit_layer in [('full', layer), ('simplified', layer), ('full', empty_layer)]:
+            first_hits, second_hits = find_doublets(x, y, z, hit_layer, len(z_layers), setup, Z_REF, DOUBLET_CRITERIA)
+            first_doublets, second_doublets = find_triplets(first_hits, second_hits, x, y, z, max_scattering)
+            self.assertGreater(len(first_doublets), 0)
+
+            parallel = find_multiplets_parallel(x, y, z, hit_layer, len(z_layers), setup, Z_REF, DOUBLET_CRITERIA,
+                                                max_scattering, num_workers=2, block_size=7)
+            for sequential_array, parallel_array in zip([first_hits, second_hits, first_doublets, second_doublets],
+                                                        parallel):
+                self.assertTrue(np.array_equal(sequential_array, parallel_array))
+
+        # two segments per layer split at x = 0.1, the lower segment of layer 1 has no targets
+        segment = np.where(layer >= 0, 2 * layer + (x > 0.1), -1)
+        target_indptr = np.array([0, 2, 4, 4, 6, 8, 10, 10, 10, 10, 10])
+        target_indices = np.array([2, 3, 2, 3, 4, 5, 6, 7, 6, 7])
+        first_hits, second_hits = find_doublets_in_groups(x, y, z, segment, target_indptr, target_indices, Z_REF,
+                                                          DOUBLET_CRITERIA)
+        first_doublets, second_doublets = find_triplets(first_hits, second_hits, x, y, z, max_scattering)
+        self.assertGreater(len(first_doublets), 0)
+        parallel = find_multiplets_parallel_in_groups(x, y, z, segment, target_indptr, target_indices, Z_REF,
+                                                      DOUBLET_CRITERIA, max_scattering, num_workers=2, block_size=7)
+        for sequential_array, parallel_array in zip([first_hits, second_hits, first_doublets, second_doublets],
+                                                    parallel):
+            self.assertTrue(np.array_equal(sequential_array, parallel_array))
+
+if __name__ == '__main__':
+    unittest.main()
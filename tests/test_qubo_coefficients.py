@@ -0,0 +1,145 @@
+import unittest
+import numpy as np
+import sys
+sys.path.insert(0, "../src")
+
+from math_functions.geometry import angle_based_measure, angle_based_measure_array
+from pattern.hit_table import HitTable
+from pattern.triplet_table import TripletTable
+from pattern_building.qubo_coefficients import QuboCoefficients, coo_interactions
+from pattern_building.segment_manager import LUXESegmentManager
+
+from numba import config as numba_config
+
+# like the command line scripts, processes forking after a parallel numba call of another test module do not exit with
+# the TBB threading layer
+numba_config.THREADING_LAYER_PRIORITY = ['omp', 'workqueue', 'tbb']
+
+
+class TestQuboCoefficients(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.hit_table = HitTable(hit_id=np.arange(10),
+                                  x=rng.uniform(0.1, 0.2, 10),
+                                  y=rng.uniform(-0.01, 0.01, 10),
+                                  z=np.repeat([3.9, 4.0, 4.1, 4.2, 4.3], 2))
+        # hit 2 * layer + i is the i-th hit of a layer
+        self.triplet_table = TripletTable(self.hit_table, np.array([[0, 2, 4], [2, 4, 6], [4, 6, 8], [0, 3, 4],
+                                                                    [1, 2, 4]]))
+        self.configuration = {"qubo parameters": {"b_ij conflict": 2, "b_ij match": 'default', "a_i": 'default'}}
+
+    def test_angle_based_measure_array(self):
+        x, y, z = self.triplet_table.coordinates()
+        expected = [angle_based_measure([x_row, y_row, z_row]) for x_row, y_row, z_row in zip(x, y, z)]
+        np.testing.assert_allclose(angle_based_measure_array(x, y, z), expected, rtol=1e-12)
+
+    def test_triplet_interactions(self):
+        qubo_coefficients = QuboCoefficients(self.configuration, '')
+        qubo_coefficients.triplet_table = self.triplet_table
+        x, y, z = self.hit_table.x, self.hit_table.y, self.hit_table.z
+        first = np.array([0, 0, 0, 0, 1, 0])
+        second = np.array([1, 2, 3, 4, 0, 0])
+        expected = [- 1 + angle_based_measure([x[[0, 2, 4, 6]], y[[0, 2, 4, 6]], z[[0, 2, 4, 6]]]),
+                    - 1 + angle_based_measure([x[[0, 2, 4, 6, 8]], y[[0, 2, 4, 6, 8]], z[[0, 2, 4, 6, 8]]]),
+                    2, 2, 2, 0]
+        np.testing.assert_allclose(qubo_coefficients.triplet_interactions(first, second), expected, rtol=1e-12)
+
+        # earlier versions used the x position of the last hit as its y and z position
+        self.configuration["qubo parameters"]["legacy b_ij match"] = True
+        qubo_coefficients = QuboCoefficients(self.configuration, '')
+        qubo_coefficients.triplet_table = self.triplet_table
+        fixed = expected[1]
+        expected[1] = - 1 + angle_based_measure([x[[0, 2, 4, 6, 8]],
+                                                 list(y[[0, 2, 4, 6]]) + [x[8]],
+                                                 list(z[[0, 2, 4, 6]]) + [x[8]]])
+        self.assertNotAlmostEqual(expected[1], fixed)
+        np.testing.assert_allclose(qubo_coefficients.triplet_interactions(first, second), expected, rtol=1e-12)
+
+        # the constant is used for pairs continued by one hit as well as by two hits
+        self.configuration["qubo parameters"]["b_ij match"] = -0.5
+        for legacy_match in [False, True]:
+            self.configuration["qubo parameters"]["legacy b_ij match"] = legacy_match
+            qubo_coefficients = QuboCoefficients(self.configuration, '')
+            qubo_coefficients.triplet_table = self.triplet_table
+            self.assertEqual(qubo_coefficients.triplet_interactions(first, second).tolist(), [-0.5, -0.5, 2, 2, 2, 0])
+
+    def test_implicit_conflicts_energy(self):
+        segment_manager = LUXESegmentManager({'doublet': {'dx/x0': 0.5278, 'dx/x0 eps': 0.015, 'dy/x0': 0.0,
+                                                          'dy/x0 eps': 0.015},
+                                              'binning': {'num bins x': 16, 'num bins y': 4}},
+                                             '../geometry/LUXE_key4hep.csv',
+                                             use_cache=False)
+        segment_manager.create_LUXE_segments()
+        segment_manager.segment_mapping_LUXE()
+        rng = np.random.default_rng(5)
+        hit_table = HitTable(hit_id=np.arange(30),
+                             x=rng.uniform(0.1, 0.5, 30),
+                             y=np.zeros(30),
+                             z=np.repeat(segment_manager.z_position_to_layer[:5], 6))
+        segment_manager.fill_segments(hit_table, hit_table.to_detector_hits())
+        first_layer = rng.integers(0, 3, 60)
+        hit_indices = np.unique((first_layer[:, np.newaxis] + np.arange(3)) * 6 + rng.integers(0, 6, (60, 3)), axis=0)
+
+        tables = []
+        for implicit_conflicts in [False, True]:
+            self.configuration["qubo parameters"]["implicit conflicts"] = implicit_conflicts
+            qubo_coefficients = QuboCoefficients(self.configuration, '')
+            qubo_coefficients.set_triplet_coefficients(segment_manager, TripletTable(hit_table, hit_indices))
+            tables.append(qubo_coefficients.triplet_table)
+        explicit, implicit = tables
+        conflict = self.configuration["qubo parameters"]["b_ij conflict"]
+        np.testing.assert_array_equal(explicit.quality, implicit.quality)
+
+        # explicit conflicts only exist for compared pairs, an implicit conflict group adds the penalty for each shared
+        # position of any pair of kept triplets
+        shared_positions = np.sum(hit_indices[:, np.newaxis, :] == hit_indices[np.newaxis, :, :], axis=2)
+        same_position = np.triu(shared_positions > 0, k=1)
+        explicit_conflicts = np.where(same_position, explicit.interactions.toarray(), 0)
+        self.assertTrue(np.any(same_position & (explicit_conflicts == 0)))
+        self.assertTrue(np.any(np.triu(shared_positions, k=1) == 2))
+
+        for solution_candidate in [np.ones(len(hit_indices)), rng.integers(0, 2, len(hit_indices)).astype(float)]:
+            explicit_energy = explicit.quality @ solution_candidate + \
+                solution_candidate @ (explicit.interactions @ solution_candidate)
+            implicit_energy = implicit.quality @ solution_candidate + \
+                solution_candidate @ (implicit.interactions @ solution_candidate) + \
+                implicit.conflict_energy(solution_candidate)
+            kept_pairs = same_position & np.outer(solution_candidate, solution_candidate).astype(bool)
+            difference = np.sum(np.where(kept_pairs, conflict * shared_positions - explicit_conflicts, 0))
+            self.assertGreater(difference, 0)
+            self.assertAlmostEqual(implicit_energy - explicit_energy, difference)
+
+    def test_parallel_interactions_match_sequential(self):
+        segment_manager = LUXESegmentManager({'doublet': {'dx/x0': 0.5278, 'dx/x0 eps': 0.015, 'dy/x0': 0.0,
+                                                          'dy/x0 eps': 0.015},
+                                              'binning': {'num bins x': 16, 'num bins y': 4}},
+                                             '../geometry/LUXE_key4hep.csv',
+                                             use_cache=False)
+        segment_manager.create_LUXE_segments()
+        rng = np.random.default_rng(3)
+        # 6 hits on each of the first 5 layers, spread over several segments
+        hit_table = HitTable(hit_id=np.arange(30),
+                             x=rng.uniform(0.1, 0.5, 30),
+                             y=np.zeros(30),
+                             z=np.repeat(segment_manager.z_position_to_layer[:5], 6))
+        segment_manager.fill_segments(hit_table, hit_table.to_detector_hits())
+        first_layer = rng.integers(0, 3, 60)
+        hit_indices = (first_layer[:, np.newaxis] + np.arange(3)) * 6 + rng.integers(0, 6, (60, 3))
+        qubo_coefficients = QuboCoefficients(self.configuration, '')
+        qubo_coefficients.triplet_table = TripletTable(hit_table, hit_indices)
+        qubo_coefficients.num_workers = 2
+        first, second = np.triu_indices(60, k=1)
+
+        sequential = coo_interactions(first, second, qubo_coefficients.triplet_table.hit_indices, hit_table.x,
+                                      hit_table.y, hit_table.z, 2, 'default', angle_based_measure_array, False)
+        parallel = qubo_coefficients.interactions_parallel(segment_manager, first, second, block_size=50)
+        order = np.lexsort((sequential[1], sequential[0]))
+        parallel_order = np.lexsort((parallel[1], parallel[0]))
+        self.assertGreater(len(order), 0)
+        for sequential_array, parallel_array in zip(sequential, parallel):
+            self.assertTrue(np.array_equal(sequential_array[order], parallel_array[parallel_order]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+import numpy as np
+import sys
+sys.path.insert(0, "../src")
+
+from pattern.hit_table import HitTable
+from pattern_building.doublet_engine import find_doublets_in_groups
+from pattern_building.segment_manager import LUXESegmentManager
+
+
+class TestSegmentManager(unittest.TestCase):
+
+    def setUp(self):
+        configuration = {'doublet': {'dx/x0': 0.5278, 'dx/x0 eps': 0.015, 'dy/x0': 0.0, 'dy/x0 eps': 0.015},
+                         'binning': {'num bins x': 16, 'num bins y': 4}}
+        self.segment_manager = LUXESegmentManager(configuration, '../geometry/LUXE_key4hep.csv',
+                                                  use_cache=False)
+        self.segment_manager.create_LUXE_segments()
+
+    def scan_segments(self, x, y, z):
+        """Reference implementation, scanning all segments of a layer.
+        """
+        for segment in self.segment_manager.segment_storage[self.segment_manager.z_position_to_layer.index(z)]:
+            if segment.x_start <= x <= segment.x_end and segment.y_start <= y <= segment.y_end:
+                return segment
+        return None
+
+    def test_segment_indices_match_scan(self):
+        x_edges, y_edges = self.segment_manager.segment_edges[2]
+        z = self.segment_manager.z_position_to_layer[2]
+        rng = np.random.default_rng(1)
+        x = np.concatenate([x_edges, rng.uniform(x_edges[0] - 0.01, x_edges[-1] + 0.01, 200)])
+        y = np.concatenate([y_edges[rng.integers(0, len(y_edges), len(x_edges))],
+                            rng.uniform(y_edges[0] - 0.001, y_edges[-1] + 0.001, 200)])
+
+        layer, segment_index = self.segment_manager.get_segment_indices(x, y, np.full(len(x), z + 1e-9))
+        for x_hit, y_hit, layer_hit, index_hit in zip(x, y, layer, segment_index):
+            segment = self.scan_segments(x_hit, y_hit, z)
+            if segment is None:
+                self.assertEqual((layer_hit, index_hit), (-1, -1))
+            else:
+                self.assertIs(self.segment_manager.segment_storage[layer_hit][index_hit], segment)
+
+    def test_fill_segments(self):
+        z = self.segment_manager.z_position_to_layer
+        hit_table = HitTable(hit_id=[0, 1, 2, 3],
+                             x=[0.3, 0.6, 0.3, 0.3],
+                             y=[0.0, 0.0, 0.0, 0.0],
+                             z=[z[0], z[0], z[0] + 1e-3, z[0]])
+        hits = hit_table.to_detector_hits()
+        self.assertEqual(self.segment_manager.fill_segments(hit_table, hits), 2)
+        segment = self.segment_manager.get_segment_at_known_xyz_value(hits[0])
+        self.assertEqual([hit.hit_id for hit in segment.data], ['0', '3'])
+
+    def test_segment_mapping_matches_pairwise_check(self):
+        self.segment_manager.segment_mapping_LUXE(use_cache=False)
+        for layer in range(len(self.segment_manager.z_position_to_layer) - 1):
+            targets = self.segment_manager.segment_storage[layer + 1]
+            if layer < len(self.segment_manager.z_position_to_layer) - 2:
+                targets = targets + self.segment_manager.segment_storage[layer + 2]
+            for segment in self.segment_manager.segment_storage[layer]:
+                expected = [target.name for target in targets
+                            if self.segment_manager.is_compatible_with_target_LUXE_segment(segment, target)]
+                mapped = [target.name for target in self.segment_manager.segment_mapping.get(segment.name, [])]
+                self.assertEqual(mapped, expected)
+
+    def test_adaptive_segmentation(self):
+        self.segment_manager.segment_mapping_LUXE(use_cache=False)
+        self.segment_manager.max_hits_per_segment = 3
+        z = self.segment_manager.z_position_to_layer
+        rng = np.random.default_rng(2)
+        # hot spot in layer 1 and a few hits in layer 2
+        hit_table = HitTable(hit_id=np.arange(60),
+                             x=np.concatenate([rng.uniform(0.06, 0.062, 50), rng.uniform(0.3, 0.5, 10)]),
+                             y=rng.uniform(-0.001, 0.001, 60),
+                             z=[z[1]] * 50 + [z[2]] * 10)
+        hits = hit_table.to_detector_hits()
+        grid_segment = self.segment_manager.get_segment_at_known_xyz_value(hits[0])
+
+        self.assertEqual(self.segment_manager.fill_segments(hit_table, hits), 0)
+        segments = self.segment_manager.get_all_segments()
+        self.assertEqual(sum([len(segment.data) for segment in segments]), 60)
+        self.assertTrue(all([len(segment.data) <= 3 for segment in segments]))
+        self.assertIsNot(self.segment_manager.get_segment_at_known_xyz_value(hits[0]), grid_segment)
+        self.assertIn(hits[0], self.segment_manager.get_segment_at_known_xyz_value(hits[0]).data)
+
+        # the grid is restored for the next event
+        self.segment_manager.reset_segments()
+        self.assertIs(self.segment_manager.get_segment_at_known_xyz_value(hits[0]), grid_segment)
+        self.assertEqual(len(self.segment_manager.get_all_segments()), 8 * 16 * 4)
+
+    def test_compared_hit_pairs(self):
+        self.segment_manager.segment_mapping_LUXE(use_cache=False)
+        z = self.segment_manager.z_position_to_layer
+        rng = np.random.default_rng(4)
+        x0 = rng.uniform(0.06, 0.3, 40)
+        hit_table = HitTable(hit_id=np.arange(200),
+                             x=np.concatenate([x0 * (1 + 0.5278 * (z_layer - z[0])) for z_layer in z[:5]]),
+                             y=rng.uniform(-0.001, 0.001, 200),
+                             z=np.repeat(z[:5], 40))
+
+        compared_pairs = []
+        for max_hits_per_segment in [None, 3]:
+            self.segment_manager.max_hits_per_segment = max_hits_per_segment
+            self.segment_manager.fill_segments(hit_table, hit_table.to_detector_hits())
+            num_hits = np.array([len(segment.data) for segment in self.segment_manager.get_all_segments()])
+            sources = np.repeat(np.arange(len(num_hits)), np.diff(self.segment_manager.mapping_indptr))
+            first_hits, _ = find_doublets_in_groups(hit_table.x, hit_table.y, hit_table.z,
+                                                    self.segment_manager.hit_segment,
+                                                    self.segment_manager.mapping_indptr,
+                                                    self.segment_manager.mapping_indices, z[0],
+                                                    self.segment_manager.mapping_criteria)
+            compared_pairs.append(self.segment_manager.compared_hit_pairs(hit_table))
+            # the windows contain all doublets and only hits of mapped segment pairs
+            self.assertGreater(len(first_hits), 0)
+            self.assertLessEqual(len(first_hits), compared_pairs[-1])
+            self.assertLess(compared_pairs[-1],
+                            np.sum(num_hits[sources] * num_hits[self.segment_manager.mapping_indices]))
+            self.segment_manager.reset_segments()
+        self.assertLessEqual(compared_pairs[1], compared_pairs[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
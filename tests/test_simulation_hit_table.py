@@ -0,0 +1,46 @@
+import unittest
+import tempfile
+import os
+import numpy as np
+import sys
+sys.path.insert(0, "../src")
+
+from simplified_simulation.detector_plane import DetectorPlane
+from simplified_simulation.experimental_results_MC_toy import ExperimentalResults
+from utility.data_format_handler import load_data, write_simplified_simulation_csv
+
+
+class TestSimulationHitTable(unittest.TestCase):
+
+    def setUp(self):
+        self.result = ExperimentalResults()
+        for k, z in enumerate([3.962, 4.062]):
+            plane = DetectorPlane((0.05, 0.55), (-0.007, 0.007), z, (100, 10), 1e-4, 9.37e-2, 1.0)
+            plane.true_hits_dictionary = {'3': (0.06 + 0.1 * k, 0.001, z), '7': (0.09 + 0.1 * k, -0.001, z)}
+            self.result.list_of_planes.update({f'Plane {k}': plane})
+        self.result.particle_momentum_history = {'3': {'Plane 0': np.array([0.0, 0.0, 3.0]),
+                                                       'Plane 1': np.array([0.0, 0.0, 2.5])},
+                                                 '7': {'Plane 0': np.array([0.0, 4.0, 3.0]),
+                                                       'Plane 1': np.array([0.0, 0.0, 1.0])}}
+
+    def test_true_hits(self):
+        hit_table = self.result.to_hit_table()
+        self.assertSequenceEqual(hit_table.hit_id.tolist(), [0, 1, 2, 3])
+        self.assertSequenceEqual(hit_table.particle_id.tolist(), [3, 7, 3, 7])
+        self.assertSequenceEqual(hit_table.x.tolist(), [0.06, 0.09, 0.16, 0.19])
+        self.assertSequenceEqual(hit_table.layer_id.tolist(), [0, 0, 2, 2])
+        self.assertSequenceEqual(hit_table.module_id.tolist(), [0, 1, 3, 4])
+        self.assertSequenceEqual(hit_table.particle_energy.tolist(), [3.0, 5.0, 2.5, 1.0])
+
+    def test_csv_export_matches_memory(self):
+        hit_table = self.result.to_hit_table(smearing=(5e-6, 5e-6))
+        with tempfile.TemporaryDirectory() as folder:
+            csv_file = os.path.join(folder, 'smeared_sl.csv')
+            write_simplified_simulation_csv(csv_file, hit_table)
+            loaded_hit_table = load_data(csv_file, 'simplified simulation csv', use_cache=False)
+        for name, column in hit_table.columns().items():
+            self.assertTrue(np.array_equal(column, loaded_hit_table.columns()[name]), name)
+
+
+if __name__ == '__main__':
+    unittest.main()
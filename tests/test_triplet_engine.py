@@ -0,0 +1,54 @@
+import unittest
+import numpy as np
+import sys
+sys.path.insert(0, "../src")
+
+from math_functions.checks import is_valid_triplet
+from pattern.hit_table import HitTable
+from pattern.triplet_table import TripletTable
+from pattern_building.triplet_engine import find_triplets, sharing_triplet_pairs
+
+
+class TestTripletEngine(unittest.TestCase):
+
+    def test_join_matches_pairwise_comparison(self):
+        rng = np.random.default_rng(4)
+        z_layers = np.array([3.9, 4.0, 4.1, 4.2])
+        hits_per_layer = 15
+        hit_table = HitTable(hit_id=np.arange(len(z_layers) * hits_per_layer),
+                             x=rng.uniform(0.1, 0.11, len(z_layers) * hits_per_layer),
+                             y=rng.uniform(-0.001, 0.001, len(z_layers) * hits_per_layer),
+                             z=np.repeat(z_layers, hits_per_layer))
+        hits = hit_table.to_detector_hits()
+        layer = np.repeat(np.arange(len(z_layers)), hits_per_layer)
+
+        # random doublets between consecutive layers
+        first_hits = rng.integers(0, (len(z_layers) - 1) * hits_per_layer, 300)
+        second_hits = (layer[first_hits] + 1) * hits_per_layer + rng.integers(0, hits_per_layer, 300)
+        max_scattering = 0.05
+
+        expected = [(d1, d2) for d1 in range(len(first_hits)) for d2 in range(len(first_hits))
+                    if second_hits[d1] == first_hits[d2] and is_valid_triplet(hits[first_hits[d1]],
+                                                                              hits[second_hits[d1]],
+                                                                              hits[second_hits[d2]],
+                                                                              max_scattering)]
+        first_doublets, second_doublets = find_triplets(first_hits, second_hits, hit_table.x, hit_table.y,
+                                                        hit_table.z, max_scattering)
+        self.assertGreater(len(expected), 0)
+        self.assertLess(len(expected), sum([np.count_nonzero(first_hits == h) for h in second_hits]))
+        self.assertEqual(list(zip(first_doublets.tolist(), second_doublets.tolist())), expected)
+
+
+    def test_sharing_pairs_match_pairwise_comparison(self):
+        rng = np.random.default_rng(6)
+        hit_table = HitTable(hit_id=np.arange(40), x=np.zeros(40), y=np.zeros(40), z=np.repeat([1., 2., 3., 4.], 10))
+        hit_indices = np.column_stack([rng.integers(0, 10, 100), rng.integers(10, 20, 100), rng.integers(20, 30, 100)])
+        triplet_table = TripletTable(hit_table, hit_indices)
+
+        expected = [(a, b) for a in range(100) for b in range(a + 1, 100)
+                    if len(set(hit_indices[a]).intersection(hit_indices[b])) > 0]
+        first, second = sharing_triplet_pairs(*triplet_table.triplets_by_hit(), len(triplet_table))
+        self.assertEqual(list(zip(first.tolist(), second.tolist())), expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import unittest
+import numpy as np
+import os
+import sys
+import tempfile
+sys.path.insert(0, "../src")
+
+from pattern.hit_table import HitTable
+from pattern.triplet_table import TripletTable
+from qubo.optimisation import make_connection_list, make_connection_list_legacy, make_paired_list, make_impact_list, \
+    bit_flip_optimisation, local_fields
+
+
+class TestTripletTable(unittest.TestCase):
+
+    def setUp(self):
+        self.hit_table = HitTable(hit_id=np.array([10, 11, 12, 13, 14, 15]),
+                                  x=np.array([0.1, 0.2, 0.1, 0.2, 0.1, 0.2]),
+                                  y=np.zeros(6),
+                                  z=np.array([3.9, 3.9, 4.0, 4.0, 4.1, 4.1]),
+                                  particle_id=np.array([1, 2, 1, 2, 1, 1]),
+                                  is_signal=np.array([True, True, True, True, True, False]))
+        self.triplet_table = TripletTable(self.hit_table,
+                                          np.array([[0, 2, 4], [1, 3, 5], [0, 2, 5]]),
+                                          quality=np.array([0.1, 0.2, 0.3]))
+        self.triplet_table.set_interactions(np.array([2]), np.array([0]), np.array([0.5]))
+
+    def test_export(self):
+        self.assertEqual(self.triplet_table.triplet_ids(), ['10_12_14', '11_13_15', '10_12_15'])
+        self.assertEqual(self.triplet_table.from_same_particle().tolist(), [True, False, False])
+
+        triplets = self.triplet_table.to_triplets()
+        self.assertEqual([t.triplet_id for t in triplets], self.triplet_table.triplet_ids())
+        self.assertEqual(triplets[0].interactions, {'10_12_15': 0.5})
+        self.assertEqual(triplets[2].quality, 0.3)
+        # shared hits are the same objects
+        self.assertIs(triplets[0].hit_2, triplets[2].hit_2)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as folder:
+            self.triplet_table.save(os.path.join(folder, 'triplet_table.npz'))
+            loaded = TripletTable.load(os.path.join(folder, 'triplet_table.npz'))
+        self.assertEqual(loaded.triplet_ids(), self.triplet_table.triplet_ids())
+        self.assertEqual(loaded.quality.tolist(), self.triplet_table.quality.tolist())
+        self.assertEqual(loaded.interactions.toarray().tolist(), self.triplet_table.interactions.toarray().tolist())
+        self.assertEqual(loaded.from_same_particle().tolist(), self.triplet_table.from_same_particle().tolist())
+
+    def test_interaction_matrix(self):
+        self.assertEqual(self.triplet_table.interactions.toarray().tolist(), [[0, 0, 0.5], [0, 0, 0], [0, 0, 0]])
+        self.assertEqual(self.triplet_table.symmetric_interactions().toarray().tolist(),
+                         [[0, 0, 0.5], [0, 0, 0], [0.5, 0, 0]])
+
+        # local fields a_i + sum_j b_ij x_j: 0.1 + 0.5, 0.2, 0.3 + 0.5
+        solution_candidate = np.array([1., 1., 1.])
+        self.assertEqual(make_impact_list(self.triplet_table, solution_candidate), [1, 0, 2])
+        # flipping triplet 2 first removes the interaction from the field of triplet 0
+        solution_candidate, energy_change = bit_flip_optimisation(self.triplet_table, solution_candidate, [2, 1, 0],
+                                                                  reverse=False)
+        self.assertEqual(solution_candidate.tolist(), [0., 0., 0.])
+        self.assertAlmostEqual(energy_change, -0.8 - 0.2 - 0.1)
+
+        self.triplet_table.quality = np.array([0.1, 0.2, -0.3])
+        solution_candidate, energy_change = bit_flip_optimisation(self.triplet_table, solution_candidate, [0, 1, 2],
+                                                                  reverse=False)
+        self.assertEqual(solution_candidate.tolist(), [0., 0., 1.])
+        self.assertAlmostEqual(energy_change, -0.3)
+
+    def test_zero_interactions_are_kept(self):
+        # a rescaled b_ij can be 0, it is still an interaction of the pair
+        self.triplet_table.set_interactions(np.array([2, 0]), np.array([0, 1]), np.array([0.5, 0.]))
+        symmetric = self.triplet_table.symmetric_interactions()
+        self.assertEqual(np.diff(symmetric.indptr).tolist(), [2, 1, 1])
+        self.assertEqual(self.triplet_table.to_triplets()[1].interactions, {'10_12_14': 0.})
+
+        implicit = TripletTable(self.hit_table, self.triplet_table.hit_indices, conflict_penalty=1.)
+        implicit.set_interactions(np.array([0, 1]), np.array([1, 2]), np.array([0., 0.]))
+        expanded = implicit.expand_conflicts(implicit.symmetric_interactions(), [0, 1, 2])
+        # 0-2 share two hits, 1-2 one hit and 0-1 only has the zero interaction
+        self.assertEqual(np.diff(expanded.indptr).tolist(), [2, 2, 2])
+        self.assertEqual(expanded.toarray().tolist(), [[0, 0, 2], [0, 0, 1], [2, 1, 0]])
+
+    def test_orderings_use_triplet_indices(self):
+        self.triplet_table.set_interactions(np.array([0]), np.array([2]), np.array([-0.5]))
+        self.assertEqual(make_connection_list(self.triplet_table), [0, 2, 1])
+        self.assertEqual(make_paired_list(self.triplet_table), [0, 2, 2, 0, 1])
+
+    def implicit_and_explicit_conflicts(self):
+        """Triplet tables with the same QUBO, with implicit conflicts and with all conflicts as interactions.
+        """
+        hit_indices = np.array([[0, 2, 4], [1, 3, 5], [0, 2, 5], [1, 2, 4]])
+        implicit = TripletTable(self.hit_table, hit_indices, quality=np.array([0.1, 0.2, 0.3, -0.4]),
+                                conflict_penalty=1.)
+        implicit.set_interactions(np.array([1]), np.array([3]), np.array([-0.5]))
+        # pairs sharing hits in the same position: 0-2 (two positions), 0-3 (two positions), 1-2, 1-3 and 2-3
+        explicit = TripletTable(self.hit_table, hit_indices, quality=implicit.quality)
+        explicit.set_interactions(np.array([0, 0, 1, 1, 2]), np.array([2, 3, 2, 3, 3]), np.array([2., 2., 1., 0.5, 1.]))
+        return implicit, explicit
+
+    def test_implicit_conflicts(self):
+        implicit, explicit = self.implicit_and_explicit_conflicts()
+
+        self.assertEqual(implicit.expand_conflicts(implicit.symmetric_interactions(), [0, 1, 2, 3]).toarray().tolist(),
+                         explicit.symmetric_interactions().toarray().tolist())
+        self.assertEqual(implicit.expand_conflicts(implicit.symmetric_interactions(), [1])[1].toarray().tolist(),
+                         [[0, 0, 1, 0.5]])
+        for solution_candidate in [np.array([1., 1., 1., 1.]), np.array([1., 0., 0., 1.]), np.array([0., 1., 1., 0.])]:
+            np.testing.assert_allclose(local_fields(implicit, solution_candidate),
+                                       local_fields(explicit, solution_candidate))
+            self.assertAlmostEqual(implicit.conflict_energy(solution_candidate) +
+                                   solution_candidate @ (implicit.interactions @ solution_candidate),
+                                   solution_candidate @ (explicit.interactions @ solution_candidate))
+        self.assertEqual(implicit.conflict_energy(np.array([1., 1.]), triplet_subset=[2, 3]), 1.)
+
+        implicit_result = bit_flip_optimisation(implicit, np.ones(4), [0, 1, 2, 3], reverse=False)
+        explicit_result = bit_flip_optimisation(explicit, np.ones(4), [0, 1, 2, 3], reverse=False)
+        self.assertEqual(implicit_result[0].tolist(), explicit_result[0].tolist())
+        self.assertAlmostEqual(implicit_result[1], explicit_result[1])
+
+        with tempfile.TemporaryDirectory() as folder:
+            implicit.save(os.path.join(folder, 'triplet_table.npz'))
+            loaded = TripletTable.load(os.path.join(folder, 'triplet_table.npz'))
+        self.assertEqual(loaded.conflict_penalty, 1.)
+        self.assertEqual(loaded.to_triplets()[3].interactions, {'10_12_14': 2., '11_13_15': 0.5, '10_12_15': 1.})
+
+    def test_orderings_with_implicit_conflicts(self):
+        hit_table = HitTable(hit_id=np.arange(9), x=np.full(9, 0.1), y=np.zeros(9), z=np.repeat([3.9, 4.0, 4.1], 3))
+        # triplet 4 has neither interactions nor conflicts
+        hit_indices = np.array([[0, 3, 6], [1, 4, 7], [0, 3, 7], [1, 3, 6], [2, 5, 8]])
+        implicit = TripletTable(hit_table, hit_indices, conflict_penalty=1.)
+        implicit.set_interactions(np.array([0]), np.array([1]), np.array([-0.5]))
+        explicit = TripletTable(hit_table, hit_indices)
+        explicit.set_interactions(np.array([0, 0, 0, 1, 1, 2]), np.array([1, 2, 3, 2, 3, 3]),
+                                  np.array([-0.5, 2., 2., 1., 1., 1.]))
+
+        # triplets 2 and 3 only have conflicts, which are implicit
+        self.assertEqual(implicit.in_conflict_groups().tolist(), [True, True, True, True, False])
+        self.assertEqual(make_connection_list(implicit), make_connection_list(explicit))
+        self.assertEqual(make_connection_list_legacy(implicit), make_connection_list_legacy(explicit))
+        self.assertEqual(make_paired_list(implicit), make_paired_list(explicit))
+        self.assertEqual(make_paired_list(implicit), [0, 1, 1, 0, 4, 2, 3])
+
+if __name__ == '__main__':
+    unittest.main()